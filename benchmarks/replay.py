@@ -0,0 +1,413 @@
+"""
+Load test a server by replaying transcripts of real sessions, recorded by a server or proxy
+run with `HIDE_MCP_RECORD_FILE` set:
+
+    HIDE_MCP_RECORD_FILE=transcript.jsonl hide-mcp server --transport sse
+    uv run python benchmarks/replay.py transcript.jsonl --start-server --concurrency 8 --speedup 10
+
+Each recorded session is replayed on its own connection, sending the messages of the
+client as they were recorded. A message is sent once the responses that the client had
+received before sending it have arrived, after the time the client took to send it, e.g.
+to think, divided by `--speedup`. Requests the client had sent without waiting for each
+other are sent concurrently again. `--concurrency` sessions are replayed at the same time,
+`--repeat` times over.
+
+Sessions bound to projects create sandboxes; to avoid external services, reads of
+`hide://projects/...` are dropped, and the tool calls run on the local server. They run
+against the files of this machine, so replay against a checkout in the state it was
+recorded in for the tool errors to match the recording.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import anyio
+import click
+import mcp.types as types
+from mcp.client.sse import sse_client
+
+CLIENT_TO_SERVER: str = "client -> server"
+SERVER_TO_CLIENT: str = "server -> client"
+# requests that are not replayed, as they depend on external services
+SKIPPED_RESOURCES: tuple[str, ...] = ("hide://projects/",)
+DEFAULT_TIMEOUT: float = 300.0  # seconds
+SERVER_START_TIMEOUT: float = 60.0  # seconds
+
+
+@dataclass
+class ReplayMessage:
+    """A message of the client, with what to wait for before sending it."""
+
+    message: dict[str, Any]
+    # the IDs of the requests whose responses the client had received before sending it
+    after: list[Any]
+    # seconds between the last of those responses, or the previous message, and this one
+    delay: float
+
+
+@dataclass
+class Session:
+    id: str
+    messages: list[ReplayMessage]
+
+
+@dataclass
+class Stats:
+    """Outcomes of the replayed requests, by kind of request."""
+
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    # responses that are JSON-RPC errors
+    errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    # tool calls whose result is an error
+    tool_errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    timeouts: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    failed_sessions: int = 0
+    completed_sessions: int = 0
+
+
+def load_sessions(path: str) -> list[Session]:
+    """Read the sessions of a transcript, dropping the requests that are not replayed."""
+    entries: dict[str, list[dict[str, Any]]] = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries[entry["session"]].append(entry)
+
+    sessions = []
+    for session_id, session_entries in entries.items():
+        session_entries.sort(key=lambda entry: entry["time"])
+        messages: list[ReplayMessage] = []
+        skipped: set[Any] = set()
+        answered: list[Any] = []
+        last_time = session_entries[0]["time"]
+        for entry in session_entries:
+            message = entry["message"]
+            if entry["direction"] == SERVER_TO_CLIENT:
+                if "id" in message and "method" not in message:
+                    if message["id"] not in skipped:
+                        answered.append(message["id"])
+                    last_time = max(last_time, entry["time"])
+                continue
+            if "method" not in message:
+                # a response to a request of the server, which are not replayed
+                continue
+            if _is_skipped(message):
+                skipped.add(message["id"])
+                continue
+            messages.append(
+                ReplayMessage(message, answered, max(0.0, entry["time"] - last_time))
+            )
+            answered = []
+            last_time = entry["time"]
+        if messages:
+            sessions.append(Session(session_id, messages))
+    return sessions
+
+
+def _is_skipped(message: dict[str, Any]) -> bool:
+    return message.get("method") == "resources/read" and str(
+        message.get("params", {}).get("uri", "")
+    ).startswith(SKIPPED_RESOURCES)
+
+
+def _kind(message: dict[str, Any]) -> str:
+    """The label of a request in the report, e.g. `tools/call:bash`."""
+    method = message.get("method", "")
+    if method == "tools/call":
+        return f"{method}:{message.get('params', {}).get('name')}"
+    return method
+
+
+async def replay_session(
+    url: str, session: Session, speedup: float, timeout: float, stats: Stats
+):
+    """Replay the messages of a session on a new connection, recording the outcomes."""
+    pending: dict[Any, tuple[str, float]] = {}
+    responses: dict[Any, anyio.Event] = defaultdict(anyio.Event)
+
+    async def receive(read_stream):
+        async for message in read_stream:
+            if isinstance(message, Exception):
+                continue
+            root = message.root
+            if not isinstance(root, types.JSONRPCResponse | types.JSONRPCError):
+                continue
+            request = pending.pop(root.id, None)
+            if request is None:
+                continue
+            kind, sent_at = request
+            stats.latencies[kind].append(time.perf_counter() - sent_at)
+            if isinstance(root, types.JSONRPCError):
+                stats.errors[kind] += 1
+            elif root.result.get("isError"):
+                stats.tool_errors[kind] += 1
+            responses[root.id].set()
+
+    async def send(write_stream, message: dict[str, Any]):
+        if "id" in message:
+            pending[message["id"]] = (_kind(message), time.perf_counter())
+        await write_stream.send(types.JSONRPCMessage.model_validate(message))
+
+    async def wait_for(request_ids: list[Any]) -> bool:
+        """Wait for the responses to the requests. Returns False on a timeout."""
+        with anyio.move_on_after(timeout) as scope:
+            for request_id in request_ids:
+                await responses[request_id].wait()
+        return not scope.cancelled_caught
+
+    timed_out = False
+    try:
+        async with sse_client(url) as (read_stream, write_stream):
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(receive, read_stream)
+                for replayed in session.messages:
+                    if not await wait_for(replayed.after):
+                        timed_out = True
+                        break
+                    if replayed.delay and speedup:
+                        await anyio.sleep(replayed.delay / speedup)
+                    await send(write_stream, replayed.message)
+                else:
+                    timed_out = not await wait_for(list(pending))
+                tg.cancel_scope.cancel()
+    except Exception as e:
+        # anyio wraps the errors of the task groups of the transport
+        while isinstance(e, ExceptionGroup) and len(e.exceptions) == 1:
+            e = e.exceptions[0]
+        click.echo(f"Session {session.id} failed: {e!r}", err=True)
+        stats.failed_sessions += 1
+        return
+    if timed_out:
+        for kind, _ in pending.values():
+            stats.timeouts[kind] += 1
+        stats.failed_sessions += 1
+    else:
+        stats.completed_sessions += 1
+
+
+def report(stats: Stats, duration: float) -> dict[str, Any]:
+    """Throughput, latency percentiles and error rates, overall and by kind of request."""
+
+    def summarize(latencies: list[float], errors: int, tool_errors: int, timeouts: int):
+        latencies = sorted(latencies)
+        n_requests = len(latencies) + timeouts
+        summary: dict[str, Any] = {
+            "requests": n_requests,
+            "throughput": len(latencies) / duration if duration else 0.0,
+            "error_rate": errors / n_requests if n_requests else 0.0,
+            "tool_error_rate": tool_errors / n_requests if n_requests else 0.0,
+            "timeout_rate": timeouts / n_requests if n_requests else 0.0,
+        }
+        if latencies:
+            summary.update(
+                p50=_percentile(latencies, 0.50),
+                p90=_percentile(latencies, 0.90),
+                p99=_percentile(latencies, 0.99),
+                max=latencies[-1],
+                mean=statistics.fmean(latencies),
+            )
+        return summary
+
+    kinds = sorted({*stats.latencies, *stats.timeouts})
+    by_kind = {
+        kind: summarize(
+            stats.latencies[kind],
+            stats.errors[kind],
+            stats.tool_errors[kind],
+            stats.timeouts[kind],
+        )
+        for kind in kinds
+    }
+    overall = summarize(
+        [latency for kind in kinds for latency in stats.latencies[kind]],
+        sum(stats.errors.values()),
+        sum(stats.tool_errors.values()),
+        sum(stats.timeouts.values()),
+    )
+    return {
+        "duration": duration,
+        "completed_sessions": stats.completed_sessions,
+        "failed_sessions": stats.failed_sessions,
+        "overall": overall,
+        "by_kind": by_kind,
+    }
+
+
+def _percentile(sorted_values: list[float], fraction: float) -> float:
+    return sorted_values[
+        min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    ]
+
+
+def _print_report(result: dict[str, Any]):
+    click.echo(
+        f"\n{result['completed_sessions']} sessions replayed, {result['failed_sessions']} failed, "
+        f"in {result['duration']:.2f}s"
+    )
+    click.echo(
+        f"{'request':<36} {'count':>7} {'req/s':>8} {'p50':>9} {'p99':>9} "
+        f"{'errors':>7} {'tool err':>8} {'timeouts':>8}"
+    )
+    for kind, summary in [*result["by_kind"].items(), ("all", result["overall"])]:
+        p50 = f"{summary['p50'] * 1000:.1f}ms" if "p50" in summary else "-"
+        p99 = f"{summary['p99'] * 1000:.1f}ms" if "p99" in summary else "-"
+        click.echo(
+            f"{kind:<36} {summary['requests']:>7} {summary['throughput']:>8.1f} "
+            f"{p50:>9} {p99:>9} {summary['error_rate']:>7.1%} "
+            f"{summary['tool_error_rate']:>8.1%} {summary['timeout_rate']:>8.1%}"
+        )
+
+
+def _start_server(port: int) -> subprocess.Popen:
+    """Start `hide-mcp server --transport sse` and wait until it serves requests."""
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "from hide_mcp import main; main()",
+            "server",
+            "--transport",
+            "sse",
+            "--port",
+            str(port),
+        ],
+        env={
+            **os.environ,
+            "HIDE_MCP_LOG_LEVEL": os.getenv("HIDE_MCP_LOG_LEVEL", "WARNING"),
+        },
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise click.ClickException(
+                f"The server exited with code {process.returncode}"
+            )
+        try:
+            urllib.request.urlopen(f"http://localhost:{port}/metrics", timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise click.ClickException("The server did not start in time")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@click.command()
+@click.argument("transcript", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--url",
+    default="http://localhost:8945/sse",
+    show_default=True,
+    help="SSE endpoint of the server to replay against.",
+)
+@click.option(
+    "--start-server",
+    is_flag=True,
+    help="Start a local server on a free port to replay against, instead of using --url.",
+)
+@click.option(
+    "--concurrency",
+    default=1,
+    show_default=True,
+    help="Sessions replayed at the same time.",
+)
+@click.option(
+    "--speedup",
+    default=1.0,
+    show_default=True,
+    help="Factor to shorten the pauses of the clients by; 0 sends without pauses.",
+)
+@click.option(
+    "--repeat",
+    default=1,
+    show_default=True,
+    help="Times to replay each session.",
+)
+@click.option(
+    "--timeout",
+    default=DEFAULT_TIMEOUT,
+    show_default=True,
+    help="Seconds to wait for a response before giving up on a session.",
+)
+@click.option("--output", default=None, help="File to save the report to, as JSON.")
+def main(
+    transcript: str,
+    url: str,
+    start_server: bool,
+    concurrency: int,
+    speedup: float,
+    repeat: int,
+    timeout: float,
+    output: str | None,
+):
+    """Replay the sessions recorded in TRANSCRIPT against a server, and report on the load."""
+    sessions = load_sessions(transcript)
+    if not sessions:
+        raise click.ClickException(f"No sessions to replay in {transcript}")
+    n_messages = sum(len(session.messages) for session in sessions)
+    click.echo(
+        f"Replaying {len(sessions)} sessions with {n_messages} messages, {repeat} times, "
+        f"{concurrency} at a time, {speedup}x faster"
+    )
+
+    server = None
+    if start_server:
+        port = _free_port()
+        server = _start_server(port)
+        url = f"http://localhost:{port}/sse"
+
+    stats = Stats()
+
+    async def run_all():
+        queue = [session for _ in range(repeat) for session in sessions]
+        slots = anyio.Semaphore(concurrency)
+
+        async def run_one(session: Session):
+            async with slots:
+                await replay_session(url, session, speedup, timeout, stats)
+
+        async with anyio.create_task_group() as tg:
+            for session in queue:
+                tg.start_soon(run_one, session)
+
+    started_at = time.perf_counter()
+    try:
+        asyncio.run(run_all())
+    finally:
+        if server is not None:
+            # a graceful shutdown waits for the SSE streams of all clients
+            server.kill()
+    result = report(stats, time.perf_counter() - started_at)
+    result["config"] = {
+        "transcript": str(Path(transcript).resolve()),
+        "url": url,
+        "concurrency": concurrency,
+        "speedup": speedup,
+        "repeat": repeat,
+    }
+    _print_report(result)
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(result, f, indent=2)
+        click.echo(f"\nSaved the report to {output}")
+
+
+if __name__ == "__main__":
+    main()
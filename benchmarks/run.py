@@ -0,0 +1,480 @@
+"""
+Benchmarks of the hot paths of the tools: bash round trips, file edits, directory views
+and proxy forwarding. Results are saved as JSON, and can be compared with an earlier run
+to catch regressions:
+
+    uv run python benchmarks/run.py --output before.json
+    uv run python benchmarks/run.py --output after.json --compare before.json
+"""
+
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import click
+
+# the tools log every call at INFO, which would flood the console
+os.environ.setdefault("HIDE_MCP_LOG_LEVEL", "WARNING")
+os.environ.setdefault("HIDE_BASH_SPARE_SESSIONS", "0")
+
+import anyio  # noqa: E402
+import mcp.types as types  # noqa: E402
+
+from hide_mcp.proxy import forward_messages  # noqa: E402
+from hide_mcp.tools.bash import _BashSession  # noqa: E402
+from hide_mcp.tools.edit import EditTool  # noqa: E402
+from hide_mcp.tools.outputs import OutputStore  # noqa: E402
+
+KB: int = 1024
+MB: int = 1024 * KB
+FILE_SIZES: tuple[int, ...] = (KB, 64 * KB, MB, 10 * MB, 100 * MB)
+QUICK_FILE_SIZES: tuple[int, ...] = (KB, 64 * KB, MB)
+# a benchmark runs for at least MIN_ROUNDS rounds, and more until it took `budget` seconds
+MIN_ROUNDS: int = 3
+DEFAULT_BUDGET: float = 2.0  # seconds
+DEFAULT_MAX_ROUNDS: int = 200
+# results slower than the baseline by more than this factor are reported as regressions
+DEFAULT_THRESHOLD: float = 1.25
+
+
+@dataclass
+class Result:
+    """The timings of the rounds of a benchmark, in seconds."""
+
+    name: str
+    group: str
+    params: dict[str, Any]
+    rounds: int
+    min: float
+    median: float
+    mean: float
+    p95: float
+    max: float
+    stdev: float
+    # e.g. messages or bytes per second, for the benchmarks that process items
+    throughput: dict[str, float] = field(default_factory=dict)
+
+
+class Runner:
+    def __init__(self, budget: float, max_rounds: int, name_filter: str | None):
+        self.budget = budget
+        self.max_rounds = max_rounds
+        self.name_filter = name_filter
+        self.results: list[Result] = []
+
+    def wants(self, name: str) -> bool:
+        return self.name_filter is None or self.name_filter in name
+
+    async def measure(
+        self,
+        name: str,
+        group: str,
+        func: Callable[[], Awaitable[Any]],
+        params: dict[str, Any] | None = None,
+        items: dict[str, float] | None = None,
+        warmup: int = 1,
+    ):
+        """
+        Time the rounds of `func`. `items` are the amounts processed by a round, e.g.
+        messages or bytes, which are reported per second of the median round.
+        """
+        if not self.wants(name):
+            return
+        for _ in range(warmup):
+            await func()
+        timings: list[float] = []
+        started_at = time.perf_counter()
+        while len(timings) < MIN_ROUNDS or (
+            time.perf_counter() - started_at < self.budget
+            and len(timings) < self.max_rounds
+        ):
+            round_started_at = time.perf_counter()
+            await func()
+            timings.append(time.perf_counter() - round_started_at)
+
+        timings.sort()
+        median = statistics.median(timings)
+        result = Result(
+            name=name,
+            group=group,
+            params=params or {},
+            rounds=len(timings),
+            min=timings[0],
+            median=median,
+            mean=statistics.fmean(timings),
+            p95=timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            max=timings[-1],
+            stdev=statistics.stdev(timings),
+            throughput={
+                f"{unit}_per_second": amount / median
+                for unit, amount in (items or {}).items()
+            },
+        )
+        self.results.append(result)
+        throughput = "".join(
+            f"  {value:,.0f} {unit.replace('_', ' ')}"
+            for unit, value in result.throughput.items()
+        )
+        click.echo(
+            f"{name:<48} median {_format_time(median):>10}  "
+            f"p95 {_format_time(result.p95):>10}  ({result.rounds} rounds){throughput}"
+        )
+
+
+async def bench_bash(runner: Runner, tmp: Path):
+    """Round trips of commands through a persistent shell."""
+    store = OutputStore(max_outputs=1)
+    session = _BashSession(store)
+    await session.start()
+    try:
+        await runner.measure(
+            "bash.run.trivial", "bash", lambda: session.run("true"), {"command": "true"}
+        )
+        await runner.measure(
+            "bash.run.small_output",
+            "bash",
+            lambda: session.run("seq 1 100"),
+            {"command": "seq 1 100"},
+        )
+        # clipped to its head and tail, the rest is spilled to a file
+        n_lines = 1000000
+        command = f"seq 1 {n_lines}"
+        size = sum(len(str(i)) + 1 for i in range(1, n_lines + 1))
+        await runner.measure(
+            "bash.run.large_output",
+            "bash",
+            lambda: session.run(command),
+            {"command": command},
+            items={"bytes": size},
+        )
+    finally:
+        session.stop()
+        store.max_outputs = 0
+        store.list()
+
+
+async def bench_edit(runner: Runner, tmp: Path, sizes: tuple[int, ...]):
+    """Views and edits of files of increasing sizes."""
+    for size in sizes:
+        label = _format_size(size)
+        prefix = f"edit.{label}"
+        if not any(
+            runner.wants(f"{prefix}.{command}")
+            for command in ("view", "view_range", "str_replace", "insert")
+        ):
+            continue
+        path = tmp / f"file_{label}.py"
+        n_lines = _write_file(path, size)
+        tool = EditTool()
+        params = {"size": size, "lines": n_lines}
+
+        await runner.measure(
+            f"{prefix}.view",
+            "edit",
+            lambda: tool(command="view", path=str(path)),
+            params,
+            items={"bytes": size},
+        )
+        middle = n_lines // 2
+        await runner.measure(
+            f"{prefix}.view_range",
+            "edit",
+            lambda: tool(
+                command="view",
+                path=str(path),
+                view_range=[middle, min(middle + 50, n_lines)],
+            ),
+            params,
+        )
+
+        # swap the marker back and forth, so that every round has a unique match
+        markers = ["MARKER_A = 1", "MARKER_B = 2"]
+
+        async def str_replace():
+            await tool(
+                command="str_replace",
+                path=str(path),
+                old_str=markers[0],
+                new_str=markers[1],
+            )
+            markers.reverse()
+
+        await runner.measure(
+            f"{prefix}.str_replace", "edit", str_replace, params, items={"bytes": size}
+        )
+        await runner.measure(
+            f"{prefix}.insert",
+            "edit",
+            lambda: tool(
+                command="insert",
+                path=str(path),
+                insert_line=middle,
+                new_str="inserted = True",
+            ),
+            params,
+            items={"bytes": size},
+        )
+        path.unlink()
+
+
+async def bench_directories(runner: Runner, tmp: Path, quick: bool):
+    """Views of wide and deep directory trees, with cold and warm caches."""
+    if not any(
+        runner.wants(f"view_directory.{shape}.{cache}")
+        for shape in ("wide", "deep")
+        for cache in ("cold", "warm")
+    ):
+        return
+    trees = {
+        # one directory with many entries
+        "wide": _make_wide_tree(tmp / "wide", 2000 if quick else 20000),
+        # a narrow tree many levels deep, viewed to its full depth
+        "deep": _make_deep_tree(tmp / "deep", 4 if quick else 6, 4, 4),
+    }
+    for shape, (root, depth) in trees.items():
+        params = {"depth": depth}
+        await runner.measure(
+            f"view_directory.{shape}.cold",
+            "view_directory",
+            lambda: EditTool()(command="view", path=str(root), depth=depth),
+            params,
+        )
+        tool = EditTool()
+        await runner.measure(
+            f"view_directory.{shape}.warm",
+            "view_directory",
+            lambda: tool(command="view", path=str(root), depth=depth),
+            params,
+        )
+
+
+async def bench_proxy(runner: Runner, quick: bool):
+    """Throughput of `forward_messages` between unbuffered streams, as in the proxy."""
+    n_messages = 1000 if quick else 10000
+    for label, payload_size in (("small", 0), ("large", 16 * KB)):
+        messages = [
+            types.JSONRPCMessage(
+                types.JSONRPCRequest(
+                    jsonrpc="2.0",
+                    id=i,
+                    method="tools/call",
+                    params={
+                        "name": "bash",
+                        "arguments": {"command": "x" * payload_size or "true"},
+                    },
+                )
+            )
+            for i in range(n_messages)
+        ]
+
+        async def forward():
+            source_send, source_receive = anyio.create_memory_object_stream(0)
+            dest_send, dest_receive = anyio.create_memory_object_stream(0)
+
+            async def produce():
+                async with source_send:
+                    for message in messages:
+                        await source_send.send(message)
+
+            async def consume():
+                async with dest_receive:
+                    async for _ in dest_receive:
+                        pass
+
+            async with anyio.create_task_group() as tg:
+                tg.start_soon(produce)
+                tg.start_soon(consume)
+                async with dest_send:
+                    await forward_messages(source_receive, dest_send, "benchmark")
+
+        await runner.measure(
+            f"proxy.forward.{label}",
+            "proxy",
+            forward,
+            {"messages": n_messages, "payload_size": payload_size},
+            items={"messages": n_messages},
+        )
+
+
+def _write_file(path: Path, size: int) -> int:
+    """Write a Python-like file of about `size` bytes, with a marker line in the middle."""
+    line = "value_{:08d} = compute(alpha, beta, gamma)  # some trailing comment\n"
+    n_lines = max(2, size // len(line.format(0)))
+    with open(path, "w") as f:
+        for i in range(n_lines):
+            if i == n_lines // 2:
+                f.write("MARKER_A = 1\n")
+            else:
+                f.write(line.format(i))
+    return n_lines
+
+
+def _make_wide_tree(root: Path, n_entries: int) -> tuple[Path, int]:
+    root.mkdir()
+    for i in range(n_entries):
+        if i % 10 == 0:
+            (root / f"dir_{i:06d}").mkdir()
+        else:
+            (root / f"file_{i:06d}.txt").write_text("x")
+    return root, 2
+
+
+def _make_deep_tree(
+    root: Path, depth: int, n_dirs: int, n_files: int
+) -> tuple[Path, int]:
+    """A tree with `n_dirs` directories and `n_files` files in each directory, `depth` levels deep."""
+    level = [root]
+    root.mkdir()
+    for _ in range(depth):
+        next_level = []
+        for directory in level:
+            for i in range(n_files):
+                (directory / f"file_{i}.py").write_text("x")
+            for i in range(n_dirs):
+                child = directory / f"dir_{i}"
+                child.mkdir()
+                next_level.append(child)
+        level = next_level
+    return root, depth
+
+
+def _format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1.0), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def _format_size(size: int) -> str:
+    if size >= MB:
+        return f"{size // MB}MB"
+    return f"{size // KB}KB"
+
+
+def _metadata() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _compare(results: list[Result], baseline_path: str, threshold: float) -> bool:
+    """Print the change of each median against the baseline. Returns whether any regressed."""
+    with open(baseline_path) as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+    regressed = False
+    click.echo(f"\nCompared with {baseline_path}:")
+    for result in results:
+        if result.name not in baseline:
+            continue
+        ratio = result.median / baseline[result.name]["median"]
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        click.echo(f"{result.name:<48} {ratio:>6.2f}x{flag}")
+    return regressed
+
+
+@click.command()
+@click.option(
+    "--output",
+    default="benchmark-results.json",
+    show_default=True,
+    help="File to save the results to, as JSON.",
+)
+@click.option(
+    "--compare",
+    "baseline",
+    default=None,
+    help="Results of an earlier run to compare with. Exits with 1 on regressions.",
+)
+@click.option(
+    "--threshold",
+    default=DEFAULT_THRESHOLD,
+    show_default=True,
+    help="Slowdown of the median that counts as a regression.",
+)
+@click.option(
+    "--filter",
+    "name_filter",
+    default=None,
+    help="Only run the benchmarks whose name contains this string.",
+)
+@click.option(
+    "--quick",
+    is_flag=True,
+    help="Smaller files, trees and message counts, for a fast check.",
+)
+@click.option(
+    "--budget",
+    default=DEFAULT_BUDGET,
+    show_default=True,
+    help="Seconds to spend on each benchmark, after the first rounds.",
+)
+@click.option("--max-rounds", default=DEFAULT_MAX_ROUNDS, show_default=True)
+def main(
+    output: str,
+    baseline: str | None,
+    threshold: float,
+    name_filter: str | None,
+    quick: bool,
+    budget: float,
+    max_rounds: int,
+):
+    """Run the benchmarks of the tools and save the results."""
+    runner = Runner(budget, max_rounds, name_filter)
+    tmp = Path(tempfile.mkdtemp(prefix="hide-mcp-bench-"))
+
+    async def run_all():
+        await bench_bash(runner, tmp)
+        await bench_edit(runner, tmp, QUICK_FILE_SIZES if quick else FILE_SIZES)
+        await bench_directories(runner, tmp, quick)
+        await bench_proxy(runner, quick)
+
+    try:
+        asyncio.run(run_all())
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "metadata": {**_metadata(), "quick": quick},
+                "results": [asdict(result) for result in runner.results],
+            },
+            f,
+            indent=2,
+        )
+    click.echo(f"\nSaved {len(runner.results)} results to {output}")
+
+    if baseline is not None and _compare(runner.results, baseline, threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""In-process metrics, exported in the Prometheus text format."""
+
+import math
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+# the label values of a sample, in the order of the label names of its metric
+Labels = tuple[str, ...]
+# called when the metrics are exported, for values that are cheaper to read than to track
+MetricFunction = Callable[[], dict[Labels, float]]
+
+DEFAULT_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+
+class _Metric:
+    type: str
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        function: MetricFunction | None = None,
+        registry: "Registry | None" = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._function = function
+        self._values: dict[Labels, float] = {}
+        (registry or REGISTRY).register(self)
+
+    def _samples(self) -> list[tuple[str, Labels, tuple[str, ...], float]]:
+        values = self._function() if self._function is not None else self._values
+        return [
+            (self.name, self.labelnames, labels, value)
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. the number of calls, per combination of labels."""
+
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g. the number of calls in flight."""
+
+    type = "gauge"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float):
+        self._values[labels] = value
+
+
+class Histogram(_Metric):
+    """Counts of observed values, e.g. latencies, in cumulative buckets."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        registry: "Registry | None" = None,
+    ):
+        self.buckets = buckets
+        # per combination of labels: the count of each bucket (not cumulative), the
+        # count of values above the last bucket, and the sum of the values
+        self._counts: dict[Labels, list[int]] = {}
+        self._sums: dict[Labels, float] = {}
+        super().__init__(name, documentation, labelnames, registry=registry)
+
+    def observe(self, value: float, *labels: str):
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Observe the time the block takes, in seconds."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, *labels)
+
+    def _samples(self) -> list[tuple[str, Labels, tuple[str, ...], float]]:
+        samples = []
+        for labels, counts in sorted(self._counts.items()):
+            total = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                total += count
+                samples.append(
+                    (
+                        self.name + "_bucket",
+                        (*self.labelnames, "le"),
+                        (*labels, _format_value(bound)),
+                        total,
+                    )
+                )
+            samples.append(
+                (self.name + "_sum", self.labelnames, labels, self._sums[labels])
+            )
+            samples.append((self.name + "_count", self.labelnames, labels, total))
+        return samples
+
+
+class Registry:
+    """
+    The metrics of the process. They are updated and exported on the event loop, so an
+    update is a plain dict operation, without locks.
+    """
+
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format, version 0.0.4."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labelnames, labels, value in metric._samples():
+                if labelnames:
+                    label_text = ",".join(
+                        f'{labelname}="{_escape(label, quote=True)}"'
+                        for labelname, label in zip(labelnames, labels)
+                    )
+                    name += "{" + label_text + "}"
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(text: str, quote: bool = False) -> str:
+    text = text.replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quote else text
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+REGISTRY = Registry()
@@ -5,11 +5,14 @@ from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStre
 import mcp.types as types
 from mcp.client.sse import sse_client
 from mcp.server.stdio import stdio_server
+from hide_mcp import recording, tracing
 from hide_mcp.logging_utils import setup_logging
 
 # Logging will be configured by server.py, but in case this module is run directly:
 if not logging.getLogger().handlers:
     setup_logging()
+tracing.setup_tracing()
+recording.setup_recording()
 logger = logging.getLogger("mcp-proxy")
 
 
@@ -17,15 +20,24 @@ async def forward_messages(
     source: MemoryObjectReceiveStream[types.JSONRPCMessage | Exception],
     dest: MemoryObjectSendStream[types.JSONRPCMessage],
     direction: str,
+    session: str | None = None,
 ) -> None:
-    """Forward messages from source to destination"""
+    """Forward messages from source to destination, recording them as part of `session` if given"""
     try:
         async for message in source:
             if isinstance(message, Exception):
                 logger.error(f"Error in {direction}: {message}")
                 continue
             logger.info(f"{direction}: {message}")
-            await dest.send(message)
+            if session is not None:
+                recording.record(session, direction, message)
+            with tracing.span(
+                "proxy.forward",
+                direction=direction,
+                method=getattr(message.root, "method", None),
+                request_id=getattr(message.root, "id", None),
+            ):
+                await dest.send(message)
     except Exception as e:
         logger.error(f"Error forwarding {direction}: {e}")
         logger.error(f"Traceback: {''.join(traceback.format_tb(e.__traceback__))}")
@@ -33,6 +45,7 @@ async def forward_messages(
 
 async def run_proxy(remote_url: str):
     """Run the proxy, connecting stdio to SSE"""
+    session = recording.new_session()
     try:
         async with (
             stdio_server() as (stdio_read, stdio_write),
@@ -40,8 +53,20 @@ async def run_proxy(remote_url: str):
             anyio.create_task_group() as tg,
         ):
             # Forward messages in both directions
-            tg.start_soon(forward_messages, stdio_read, sse_write, "client -> server")
-            tg.start_soon(forward_messages, sse_read, stdio_write, "server -> client")
+            tg.start_soon(
+                forward_messages,
+                stdio_read,
+                sse_write,
+                recording.CLIENT_TO_SERVER,
+                session,
+            )
+            tg.start_soon(
+                forward_messages,
+                sse_read,
+                stdio_write,
+                recording.SERVER_TO_CLIENT,
+                session,
+            )
     except Exception as e:
         logger.error(f"Error in run_proxy: {e}")
         logger.error(f"Traceback: {''.join(traceback.format_tb(e.__traceback__))}")
@@ -0,0 +1,139 @@
+"""
+Recording of the JSON-RPC messages of sessions, to replay real workloads later, e.g. with
+`benchmarks/replay.py`.
+
+Recording is off unless `HIDE_MCP_RECORD_FILE` is set to the path of a file, to which the
+messages of all sessions are appended, one JSON object per line:
+
+    {"session": "...", "time": 1700000000.123, "direction": "client -> server", "message": {...}}
+
+`time` is in seconds since the epoch, when the message passed through the server or proxy.
+Transcripts hold the full arguments and results of the tool calls, file contents included.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, TextIO
+
+import anyio
+import mcp.types as types
+from anyio.streams.memory import MemoryObjectReceiveStream, MemoryObjectSendStream
+
+CLIENT_TO_SERVER: str = "client -> server"
+SERVER_TO_CLIENT: str = "server -> client"
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptRecorder:
+    """Appends the messages of sessions to a file, one JSON object per line. Thread safe."""
+
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: TextIO = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def record(self, session: str, direction: str, message: types.JSONRPCMessage):
+        entry: dict[str, Any] = {
+            "session": session,
+            "time": time.time(),
+            "direction": direction,
+            "message": message.model_dump(
+                by_alias=True, mode="json", exclude_none=True
+            ),
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_recorder: TranscriptRecorder | None = None
+
+
+def setup_recording(path: str | None = None):
+    """
+    Record the sessions to the file at `path`. If not provided, will check the
+    HIDE_MCP_RECORD_FILE environment variable, and leave recording off if it is not set.
+    """
+    global _recorder
+    path = path or os.getenv("HIDE_MCP_RECORD_FILE")
+    if _recorder is not None:
+        if path == _recorder.path:
+            return
+        _recorder.close()
+        _recorder = None
+    if path:
+        _recorder = TranscriptRecorder(path)
+        logger.info(f"Recording initialized. Transcript file: {path}")
+
+
+def is_enabled() -> bool:
+    return _recorder is not None
+
+
+def new_session() -> str:
+    """A new ID to tell the messages of a session apart from those of the others."""
+    return uuid.uuid4().hex
+
+
+def record(session: str, direction: str, message: types.JSONRPCMessage | Exception):
+    """Record a message of the session, if recording is on. Errors are not recorded."""
+    if _recorder is not None and not isinstance(message, Exception):
+        _recorder.record(session, direction, message)
+
+
+@asynccontextmanager
+async def recorded_streams(
+    read_stream: MemoryObjectReceiveStream[types.JSONRPCMessage | Exception],
+    write_stream: MemoryObjectSendStream[types.JSONRPCMessage],
+) -> AsyncIterator[
+    tuple[
+        MemoryObjectReceiveStream[types.JSONRPCMessage | Exception],
+        MemoryObjectSendStream[types.JSONRPCMessage],
+    ]
+]:
+    """
+    The streams of a server session, relayed through streams that record the messages
+    if recording is on. Without recording, the streams are returned as they are.
+    """
+    if _recorder is None:
+        yield read_stream, write_stream
+        return
+
+    session = new_session()
+    client_send, client_receive = anyio.create_memory_object_stream[
+        types.JSONRPCMessage | Exception
+    ](0)
+    server_send, server_receive = anyio.create_memory_object_stream[
+        types.JSONRPCMessage
+    ](0)
+
+    async def relay(source, dest, direction: str):
+        async with source, dest:
+            try:
+                async for message in source:
+                    record(session, direction, message)
+                    await dest.send(message)
+            except (anyio.BrokenResourceError, anyio.ClosedResourceError):
+                # the other end of the session is gone
+                pass
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(relay, read_stream, client_send, CLIENT_TO_SERVER)
+        tg.start_soon(relay, server_receive, write_stream, SERVER_TO_CLIENT)
+        try:
+            yield client_receive, server_send
+        finally:
+            tg.cancel_scope.cancel()
@@ -0,0 +1,277 @@
+"""Pooled, long-lived MCP client connections to remote project servers."""
+
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Coroutine, Hashable, TypeVar
+
+import anyio
+import mcp.types as types
+from mcp.client.session import ClientSession
+from mcp.client.sse import sse_client
+from pydantic import AnyUrl
+
+from hide_mcp import tracing
+from hide_mcp.tools.base import ToolError
+
+# called with the log notifications of the remote server, e.g. streamed bash output
+LogCallback = Callable[[types.LoggingMessageNotificationParams], Awaitable[None]]
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteConnection:
+    """
+    An initialized MCP session with a remote server over SSE, kept open between calls.
+
+    The session lives in a background task, which also drains the notifications of the
+    remote server and pings it every `ping_interval` seconds. The connection closes when a
+    ping fails or after `idle_timeout` seconds without calls. Calls may run concurrently;
+    log notifications are relayed to all calls in flight, as they cannot be told apart.
+    """
+
+    url: str
+    in_flight: int
+    ping_interval: float = 30.0  # seconds
+    ping_timeout: float = 10.0  # seconds
+    connect_timeout: float = 30.0  # seconds
+    idle_timeout: float = 600.0  # seconds
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self._session: ClientSession | None = None
+        self._task: asyncio.Task | None = None
+        self._log_callbacks: set[LogCallback] = set()
+        self._last_used = time.monotonic()
+
+    @property
+    def closed(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    async def connect(self):
+        """Open and initialize the session; raises if that fails."""
+        ready = asyncio.get_running_loop().create_future()
+        # outlives the request that opened it, so must not keep its context alive
+        self._task = asyncio.create_task(
+            self._run(ready, tracing.current_span()), context=contextvars.Context()
+        )
+        try:
+            await asyncio.wait_for(asyncio.shield(ready), self.connect_timeout)
+        except BaseException:
+            self._task.cancel()
+            raise
+
+    async def call_tool(
+        self, name: str, arguments: dict[str, Any] | None, on_log: LogCallback | None
+    ) -> types.CallToolResult:
+        """Call a tool of the remote server. Raises ConnectionError if the connection is lost meanwhile."""
+        assert self._session is not None
+        return await self._request(self._session.call_tool(name, arguments), on_log)
+
+    async def read_resource(self, uri: AnyUrl) -> types.ReadResourceResult:
+        """Read a resource of the remote server. Raises ConnectionError if the connection is lost meanwhile."""
+        assert self._session is not None
+        return await self._request(self._session.read_resource(uri), None)
+
+    async def _request(
+        self, request: Coroutine[Any, Any, T], on_log: LogCallback | None
+    ) -> T:
+        assert self._task is not None
+        self.in_flight += 1
+        self._last_used = time.monotonic()
+        if on_log is not None:
+            self._log_callbacks.add(on_log)
+        call = asyncio.create_task(request)
+        try:
+            # the pending requests of a session are not failed when its stream ends
+            await asyncio.wait({call, self._task}, return_when=asyncio.FIRST_COMPLETED)
+            if not call.done():
+                call.cancel()
+                raise ConnectionError(f"Lost the connection to {self.url}")
+            return call.result()
+        finally:
+            if not call.done():
+                call.cancel()
+            self.in_flight -= 1
+            self._last_used = time.monotonic()
+            if on_log is not None:
+                self._log_callbacks.discard(on_log)
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except BaseException:
+                pass
+
+    async def _run(self, ready: asyncio.Future, parent: tracing.Span | None):
+        # the stages of connecting are traced under the span of the caller of `connect`
+        connecting = tracing.start_span("remote.sse_connect", parent, url=self.url)
+        try:
+            async with sse_client(self.url) as streams:
+                connecting.end()
+                async with ClientSession(streams[0], streams[1]) as session:
+                    with tracing.span("remote.initialize", parent):
+                        await session.initialize()
+                    self._session = session
+                    logger.info(f"Connected to {self.url}")
+                    ready.set_result(None)
+                    async with anyio.create_task_group() as tg:
+                        tg.start_soon(self._keep_alive, session, tg.cancel_scope)
+                        await self._relay_notifications(session)
+                        tg.cancel_scope.cancel()
+        except Exception as e:
+            # anyio wraps the errors of the task groups of the transport
+            while isinstance(e, ExceptionGroup) and len(e.exceptions) == 1:
+                e = e.exceptions[0]
+            connecting.record_exception(e)
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logger.warning(f"Connection to {self.url} failed: {e}")
+        finally:
+            connecting.end()
+            if not ready.done():
+                ready.set_exception(ConnectionError(f"Could not connect to {self.url}"))
+            self._session = None
+            logger.info(f"Disconnected from {self.url}")
+
+    async def _relay_notifications(self, session: ClientSession):
+        """Forward log notifications to the calls in flight, until the session ends."""
+        async for message in session.incoming_messages:
+            match message:
+                case types.ServerNotification(
+                    root=types.LoggingMessageNotification(params=params)
+                ):
+                    for callback in list(self._log_callbacks):
+                        try:
+                            await callback(params)
+                        except Exception as e:
+                            logger.error(f"Failed to relay a log message: {e}")
+                case Exception():
+                    logger.error(f"Error from remote server: {message}")
+
+    async def _keep_alive(self, session: ClientSession, scope: anyio.CancelScope):
+        """Ping the remote server, and close the session if it does not answer or is idle."""
+        while True:
+            await anyio.sleep(self.ping_interval)
+            if (
+                not self.in_flight
+                and time.monotonic() - self._last_used > self.idle_timeout
+            ):
+                logger.info(f"Closing idle connection to {self.url}")
+                break
+            try:
+                with anyio.fail_after(self.ping_timeout):
+                    await session.send_ping()
+            except Exception as e:
+                logger.warning(f"Ping to {self.url} failed: {e!r}")
+                break
+        scope.cancel()
+
+
+class RemotePool:
+    """
+    Connections to remote project servers, up to `max_connections` per URL and owner.
+    Calls go to the least busy open connection; a new one is only opened when all are
+    busy. Closed connections are replaced transparently on the next call.
+
+    Owners, e.g. client sessions, do not share connections, as the log notifications of
+    a call are relayed to all the calls in flight on its connection.
+    """
+
+    max_connections: int
+
+    def __init__(self, max_connections: int | None = None):
+        self.max_connections = max_connections or int(
+            os.getenv("HIDE_REMOTE_CONNECTIONS", "4")
+        )
+        self._connections: dict[tuple[str, Hashable], list[RemoteConnection]] = {}
+        self._locks: dict[tuple[str, Hashable], asyncio.Lock] = {}
+
+    async def call_tool(
+        self,
+        url: str,
+        name: str,
+        arguments: dict[str, Any] | None,
+        on_log: LogCallback | None = None,
+        owner: Hashable = None,
+    ) -> types.CallToolResult:
+        connection = await self._acquire(url, owner)
+        try:
+            return await connection.call_tool(name, arguments, on_log)
+        except ConnectionError as e:
+            raise ToolError(
+                f"{e}. The tool call may or may not have completed on the remote server."
+            ) from None
+
+    async def read_resource(
+        self, url: str, uri: AnyUrl, owner: Hashable = None
+    ) -> types.ReadResourceResult:
+        connection = await self._acquire(url, owner)
+        try:
+            return await connection.read_resource(uri)
+        except ConnectionError as e:
+            raise ToolError(str(e)) from None
+
+    @property
+    def n_connections(self) -> int:
+        return sum(
+            not connection.closed
+            for connections in self._connections.values()
+            for connection in connections
+        )
+
+    async def close(self, url: str | None = None):
+        """Close the connections to `url`, or all of them."""
+        keys = [key for key in self._connections if url is None or key[0] == url]
+        for key in keys:
+            for connection in self._connections.pop(key, []):
+                await connection.close()
+            lock = self._locks.get(key)
+            if lock is not None and not lock.locked():
+                del self._locks[key]
+
+    async def _acquire(self, url: str, owner: Hashable) -> RemoteConnection:
+        self._prune()
+        key = (url, owner)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            connections = [
+                connection
+                for connection in self._connections.get(key, [])
+                if not connection.closed
+            ]
+            self._connections[key] = connections
+            least_busy = min(
+                connections, key=lambda connection: connection.in_flight, default=None
+            )
+            if least_busy is not None and (
+                least_busy.in_flight == 0 or len(connections) >= self.max_connections
+            ):
+                return least_busy
+
+            connection = RemoteConnection(url)
+            try:
+                with tracing.span("remote.connect", url=url):
+                    await connection.connect()
+            except Exception as e:
+                raise ToolError(f"Could not connect to {url}: {e}") from None
+            connections.append(connection)
+            return connection
+
+    def _prune(self):
+        """Forget the owners whose connections all closed, e.g. of client sessions that ended."""
+        for key, connections in list(self._connections.items()):
+            lock = self._locks.get(key)
+            if lock is not None and lock.locked():
+                # a connection may be opening
+                continue
+            if all(connection.closed for connection in connections):
+                del self._connections[key]
+                self._locks.pop(key, None)
@@ -1,40 +1,153 @@
+import anyio
+import asyncio
+import json
 import logging
+import os
+import time
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import parse_qs, unquote
 from dotenv import load_dotenv
-from mcp.client.session import ClientSession
-from mcp.client.sse import sse_client
+from hide_mcp import metrics, recording, tracing
 from hide_mcp.logging_utils import setup_logging
 from mcp.server.models import InitializationOptions
 import mcp.types as types
-from mcp.server import NotificationOptions, Server
+from mcp.server import NotificationOptions, Server, request_ctx
+from mcp.server.session import ServerSession
+from mcp.shared.context import RequestContext
+from mcp.shared.exceptions import McpError
+from mcp.shared.session import RequestResponder
 from pydantic import AnyUrl
 
+from hide_mcp.remote import RemotePool
 from hide_mcp.sandbox import create_sandbox, setup_hide_mcp
 from hide_mcp.tools.base import ToolError, ToolResult
-from hide_mcp.tools.bash import BashTool
+from hide_mcp.tools.bash import BashTool, OutputCallback
 from hide_mcp.tools.edit import EditTool
+from hide_mcp.tools.jobs import JobTool
+from hide_mcp.tools.outputs import OutputStore
+from hide_mcp.tools.search import SearchTool
+from hide_mcp.tools.watcher import FileWatcher
 
 # Setup logging
 load_dotenv()
 setup_logging()
+tracing.setup_tracing()
+recording.setup_recording()
 logger = logging.getLogger(__name__)
 # Store Hide client
 
 server = Server("hide-mcp")
 
-edit_tool = EditTool()
-bash_tool = BashTool()
+output_store = OutputStore()
+edit_tool = EditTool(output_store=output_store)
+bash_tool = BashTool(output_store=output_store)
+job_tool = JobTool()
+file_watcher = FileWatcher()
+search_tool = SearchTool(watcher=file_watcher)
+edit_tool.write_listeners.append(search_tool.file_changed)
+file_watcher.add_listener(edit_tool.files_changed)
+file_watcher.add_listener(search_tool.files_changed)
+remote_pool = RemotePool()
 
-# Project ID is set when a client reads resource
-PROJECT_URL = None
+TOOL_CALL_DURATION = metrics.Histogram(
+    "hide_tool_call_duration_seconds",
+    "Duration of tool calls, by tool and command.",
+    ("tool", "command", "status"),
+)
+TOOL_CALLS_IN_FLIGHT = metrics.Gauge(
+    "hide_tool_calls_in_flight", "Tool calls being handled.", ("tool",)
+)
+TOOL_CALL_RECEIVED_BYTES = metrics.Counter(
+    "hide_tool_call_received_bytes_total",
+    "Size of the arguments of tool calls, as JSON.",
+    ("tool",),
+)
+TOOL_CALL_SENT_BYTES = metrics.Counter(
+    "hide_tool_call_sent_bytes_total", "Size of the text of tool results.", ("tool",)
+)
+REMOTE_CALL_DURATION = metrics.Histogram(
+    "hide_remote_call_duration_seconds",
+    "Round trip time of tool calls relayed to the server of a project.",
+    ("tool",),
+)
+metrics.Gauge(
+    "hide_bash_sessions",
+    "Running bash sessions.",
+    function=lambda: {(): bash_tool.n_sessions},
+)
+metrics.Gauge(
+    "hide_remote_connections",
+    "Open connections to the servers of projects.",
+    function=lambda: {(): remote_pool.n_connections},
+)
+metrics.Counter(
+    "hide_edit_cache_hits_total",
+    "Hits of the caches of the editor.",
+    ("cache",),
+    function=lambda: {
+        (cache,): hits for cache, (hits, _) in edit_tool.cache_stats().items()
+    },
+)
+metrics.Counter(
+    "hide_edit_cache_misses_total",
+    "Misses of the caches of the editor.",
+    ("cache",),
+    function=lambda: {
+        (cache,): misses for cache, (_, misses) in edit_tool.cache_stats().items()
+    },
+)
+# the commands of the tools that have them, used as metric labels
+TOOL_COMMANDS: dict[str, set[str]] = {
+    tool.name: set(tool.to_params()["inputSchema"]["properties"]["command"]["enum"])
+    for tool in (edit_tool, job_tool)
+}
+
+# requests of a session that are handled at the same time
+MAX_CONCURRENT_REQUESTS: int = int(os.getenv("HIDE_MAX_CONCURRENT_REQUESTS", "16"))
+
+# Client sessions subscribed to file resources, by path
+SUBSCRIPTIONS: dict[str, set[ServerSession]] = {}
+# Held while subscriptions change, so that every subscription is watched exactly once
+_subscriptions_lock = anyio.Lock()
+
+
+@dataclass
+class Project:
+    """A project sandbox, running its own hide-mcp server that tool calls are relayed to."""
+
+    id: str
+    url: str
+
+
+# Running project sandboxes, by ID
+PROJECTS: dict[str, Project] = {}
+# The IDs of the projects each client session created; sessions only see their own
+SESSION_OWNED_PROJECTS: weakref.WeakKeyDictionary[ServerSession, set[str]] = (
+    weakref.WeakKeyDictionary()
+)
+# The project each client session is bound to, set when the client reads its resource
+SESSION_PROJECTS: weakref.WeakKeyDictionary[ServerSession, Project] = (
+    weakref.WeakKeyDictionary()
+)
 
 
 @server.list_resources()
 async def handle_list_resources() -> list[types.Resource]:
     """
-    List available Hide projects as resources.
+    List the Hide projects created by the session as resources.
     Each project is exposed as a resource with a hide:// URI scheme.
     """
-    resources = []
+    owned = SESSION_OWNED_PROJECTS.get(server.request_context.session, set())
+    resources = [
+        types.Resource(
+            uri=AnyUrl(f"hide://projects/{project.id}"),
+            name=f"Hide Project {project.id}",
+        )
+        for project in PROJECTS.values()
+        if project.id in owned
+    ]
     # for project in client.get_projects():
     #     resources.append(
     #         types.Resource(
@@ -55,24 +168,155 @@ async def handle_list_resources() -> list[types.Resource]:
 
 @server.read_resource()
 async def read_resource(uri: AnyUrl) -> str:
-    """Read a Hide project."""
-    global PROJECT_URL
+    """
+    Read a Hide project. Reading `hide://projects/new` creates a project sandbox, and
+    reading the resource of a project binds the tool calls of the session to it. Sessions
+    can only bind to the projects they created.
+    Also reads files, and pages of the outputs clipped from tool results.
+    """
+    if uri.scheme == "hide" and uri.host == "outputs":
+        return await _read_output(uri)
+    if uri.scheme == "file":
+        try:
+            return await anyio.to_thread.run_sync(
+                edit_tool.read_file, Path(_file_resource_path(uri))
+            )
+        except ToolError as e:
+            raise ValueError(e.message) from None
     if str(uri).startswith("hide://projects/"):
         project_id = str(uri).split("/")[-1]
     else:
         raise ValueError(f"Unknown resource: {uri}")
 
+    ctx = server.request_context
+    owned = SESSION_OWNED_PROJECTS.setdefault(ctx.session, set())
     if project_id == "new":
-        sbx = create_sandbox()
-        url = setup_hide_mcp(sbx)
-        PROJECT_URL = url
-        # Access the current request context
-        ctx = server.request_context
-        logger.info(f"Sending notification: tools/list_changed")
-        await ctx.session.send_tool_list_changed()
-        return "New project"
+        # setting up a sandbox takes a while, keep serving the other sessions meanwhile
+        project = await anyio.to_thread.run_sync(_create_project)
+        PROJECTS[project.id] = project
+        owned.add(project.id)
+    elif project_id in PROJECTS and project_id in owned:
+        project = PROJECTS[project_id]
     else:
-        return f"Project {project_id}"
+        # the projects of other sessions are unknown to this one
+        raise ValueError(f"Unknown project: {project_id}")
+
+    SESSION_PROJECTS[ctx.session] = project
+    logger.info(f"Session bound to project {project.id} at {project.url}")
+    await ctx.session.send_tool_list_changed()
+    return f"Project {project.id}"
+
+
+async def _read_output(uri: AnyUrl) -> str:
+    """
+    Read a page of a stored output, e.g. `hide://outputs/{id}?lines=100-200` or
+    `hide://outputs/{id}?bytes=0-65535`. The outputs of a project live on its server.
+    """
+    project = SESSION_PROJECTS.get(server.request_context.session)
+    if project is not None:
+        result = await remote_pool.read_resource(
+            project.url, uri, owner=server.request_context.session
+        )
+        return "".join(
+            content.text
+            for content in result.contents
+            if isinstance(content, types.TextResourceContents)
+        )
+
+    output_id = (uri.path or "").strip("/")
+    query = parse_qs(uri.query or "")
+    ranges = {}
+    for unit in ("lines", "bytes"):
+        if unit not in query:
+            continue
+        start, _, end = query[unit][0].partition("-")
+        try:
+            ranges[unit] = (int(start), int(end) if end else None)
+        except ValueError:
+            raise ValueError(
+                f"Invalid range `{unit}={query[unit][0]}`, expected e.g. `{unit}=10-20` or `{unit}=10-`"
+            ) from None
+    try:
+        return await anyio.to_thread.run_sync(
+            lambda: output_store.read(
+                output_id,
+                byte_range=ranges.get("bytes"),
+                line_range=ranges.get("lines"),
+            )
+        )
+    except ToolError as e:
+        raise ValueError(e.message) from None
+
+
+def _create_project() -> Project:
+    sbx = create_sandbox()
+    url = setup_hide_mcp(sbx)
+    return Project(id=sbx.sandbox_id, url=url)
+
+
+@server.subscribe_resource()
+async def handle_subscribe_resource(uri: AnyUrl) -> None:
+    """
+    Subscribe the client to changes of a file resource, e.g. `file:///repo/main.py`.
+    The directory of the file is watched, without its subdirectories, and a resource
+    updated notification is sent when the file changes.
+    """
+    path = _file_resource_path(uri)
+    session = server.request_context.session
+    async with _subscriptions_lock:
+        sessions = SUBSCRIPTIONS.setdefault(path, set())
+        if session in sessions:
+            return
+        sessions.add(session)
+        await anyio.to_thread.run_sync(file_watcher.watch_file, path)
+
+
+@server.unsubscribe_resource()
+async def handle_unsubscribe_resource(uri: AnyUrl) -> None:
+    await _unsubscribe(_file_resource_path(uri), server.request_context.session)
+
+
+async def _unsubscribe(path: str, session: ServerSession):
+    """Remove a subscription, and stop watching the file if it was the last one."""
+    async with _subscriptions_lock:
+        sessions = SUBSCRIPTIONS.get(path, set())
+        if session not in sessions:
+            return
+        sessions.discard(session)
+        if not sessions:
+            SUBSCRIPTIONS.pop(path, None)
+        await anyio.to_thread.run_sync(file_watcher.unwatch_file, path)
+
+
+async def _unsubscribe_all(session: ServerSession):
+    """Remove the subscriptions of a session that ended."""
+    for path, sessions in list(SUBSCRIPTIONS.items()):
+        if session in sessions:
+            await _unsubscribe(path, session)
+
+
+def _file_resource_path(uri: AnyUrl) -> str:
+    if uri.scheme != "file" or not uri.path:
+        raise ValueError(f"Unknown resource: {uri}")
+    return os.path.normpath(unquote(uri.path))
+
+
+async def _notify_resource_updates(paths: set[str]):
+    """Send resource updated notifications for the subscribed files that changed."""
+    for path, sessions in list(SUBSCRIPTIONS.items()):
+        if not any(
+            path == changed or path.startswith(changed + "/") for changed in paths
+        ):
+            continue
+        for session in list(sessions):
+            try:
+                await session.send_resource_updated(AnyUrl(f"file://{path}"))
+            except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+                # the client is gone
+                await _unsubscribe(path, session)
+
+
+file_watcher.add_listener(_notify_resource_updates)
 
 
 @server.list_tools()
@@ -91,9 +335,29 @@ async def handle_list_tools() -> list[types.Tool]:
             description=edit_tool.to_params()["description"],
             inputSchema=edit_tool.to_params()["inputSchema"],
         ),
+        types.Tool(
+            name=job_tool.to_params()["name"],
+            description=job_tool.to_params()["description"],
+            inputSchema=job_tool.to_params()["inputSchema"],
+        ),
+        types.Tool(
+            name=search_tool.to_params()["name"],
+            description=search_tool.to_params()["description"],
+            inputSchema=search_tool.to_params()["inputSchema"],
+        ),
     ]
 
 
+@server.set_logging_level()
+async def handle_set_logging_level(level: types.LoggingLevel) -> None:
+    """
+    Accept the client's logging level.
+    Registering this handler advertises the logging capability, which is used
+    to stream bash output as log notifications.
+    """
+    logger.info(f"Client requested logging level: {level}")
+
+
 @server.call_tool()
 async def handle_call_tool(
     name: str, arguments: dict | None
@@ -101,32 +365,81 @@ async def handle_call_tool(
     """
     Handle tool execution requests for Hide operations.
     """
-    global PROJECT_URL
-
-    if PROJECT_URL:
-        async with sse_client(PROJECT_URL) as streams:
-            async with ClientSession(streams[0], streams[1]) as session:
-                await session.initialize()
-
-                result = await session.call_tool(name, arguments)
-                if result.isError:
-                    if len(result.content) > 1:
-                        logger.warning(
-                            "Multiple contents returned in the tool error. Expected only one."
-                        )
-                    if not isinstance(result.content[0], types.TextContent):
-                        logger.warning(
-                            "Unexpected content type returned in the tool error. Expected only TextContent."
-                        )
-                    raise ToolError(
-                        ",".join(
-                            content.text
-                            for content in result.content
-                            if isinstance(content, types.TextContent)
-                        )
-                    )
+    tool, command = _metric_labels(name, arguments)
+    TOOL_CALL_RECEIVED_BYTES.inc(tool, amount=len(json.dumps(arguments or {})))
+    TOOL_CALLS_IN_FLIGHT.inc(tool)
+    started_at = time.perf_counter()
+    status = "error"
+    try:
+        with tracing.span("tool.call", tool=name, command=command):
+            content = await _call_tool(name, arguments)
+        status = "ok"
+        TOOL_CALL_SENT_BYTES.inc(
+            tool,
+            amount=sum(
+                len(part.text.encode())
+                for part in content
+                if isinstance(part, types.TextContent)
+            ),
+        )
+        return content
+    finally:
+        TOOL_CALLS_IN_FLIGHT.dec(tool)
+        TOOL_CALL_DURATION.observe(
+            time.perf_counter() - started_at, tool, command, status
+        )
 
-                return result.content
+
+def _metric_labels(name: str, arguments: dict | None) -> tuple[str, str]:
+    """
+    The tool and command labels of a call. Bash commands are free text, so they are only
+    told apart from restarts; unknown values are labeled `other`, to bound the labels.
+    """
+    arguments = arguments or {}
+    if name == bash_tool.name:
+        return name, "restart" if arguments.get("restart") else "run"
+    if name == search_tool.name:
+        return name, "search"
+    if name in TOOL_COMMANDS:
+        command = arguments.get("command")
+        return name, command if command in TOOL_COMMANDS[name] else "other"
+    return "other", "other"
+
+
+async def _call_tool(
+    name: str, arguments: dict | None
+) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+    project = SESSION_PROJECTS.get(server.request_context.session)
+    if project is not None:
+        with (
+            REMOTE_CALL_DURATION.time(_metric_labels(name, arguments)[0]),
+            tracing.span("remote.call_tool", url=project.url),
+        ):
+            result = await remote_pool.call_tool(
+                project.url,
+                name,
+                arguments,
+                on_log=_make_log_relay(),
+                owner=server.request_context.session,
+            )
+        if result.isError:
+            if len(result.content) > 1:
+                logger.warning(
+                    "Multiple contents returned in the tool error. Expected only one."
+                )
+            if not isinstance(result.content[0], types.TextContent):
+                logger.warning(
+                    "Unexpected content type returned in the tool error. Expected only TextContent."
+                )
+            raise ToolError(
+                ",".join(
+                    content.text
+                    for content in result.content
+                    if isinstance(content, types.TextContent)
+                )
+            )
+
+        return result.content
 
     logger.warning("No project set. Running tool locally.")
 
@@ -143,6 +456,8 @@ async def handle_call_tool(
             return [types.TextContent(type="text", text=result_text)]
 
         case bash_tool.name:
+            if arguments.pop("stream", False):
+                arguments["on_output"] = _make_output_streamer()
             result = await bash_tool(**arguments)
             if result.error:
                 result_text = _maybe_prepend_system_tool_result(result, result.error)
@@ -150,10 +465,63 @@ async def handle_call_tool(
             result_text = _maybe_prepend_system_tool_result(result, result.output or "")
             return [types.TextContent(type="text", text=result_text)]
 
+        case job_tool.name:
+            result = await job_tool(**arguments)
+            if result.error:
+                result_text = _maybe_prepend_system_tool_result(result, result.error)
+                raise ToolError(result_text)
+            result_text = _maybe_prepend_system_tool_result(result, result.output or "")
+            return [types.TextContent(type="text", text=result_text)]
+
+        case search_tool.name:
+            result = await search_tool(**arguments)
+            if result.error:
+                result_text = _maybe_prepend_system_tool_result(result, result.error)
+                raise ToolError(result_text)
+            result_text = _maybe_prepend_system_tool_result(result, result.output or "")
+            return [types.TextContent(type="text", text=result_text)]
+
         case _:
             raise ValueError(f"Unknown tool: {name}")
 
 
+def _make_log_relay():
+    """
+    Create a callback that forwards log notifications (e.g. streamed bash output) from
+    the remote server to the client of the current request.
+    """
+    ctx = server.request_context
+
+    async def relay(params: types.LoggingMessageNotificationParams):
+        await ctx.session.send_log_message(
+            level=params.level, data=params.data, logger=params.logger
+        )
+
+    return relay
+
+
+def _make_output_streamer() -> OutputCallback:
+    """
+    Create a callback that sends bash output chunks to the client of the current request.
+    Each chunk is sent as a log message; if the client asked for progress, a progress
+    notification with the number of characters received so far is sent as well.
+    """
+    ctx = server.request_context
+    progress_token = ctx.meta.progressToken if ctx.meta else None
+    received = 0
+
+    async def on_output(chunk: str):
+        nonlocal received
+        received += len(chunk)
+        await ctx.session.send_log_message(
+            level="info", data=chunk, logger=bash_tool.name
+        )
+        if progress_token is not None:
+            await ctx.session.send_progress_notification(progress_token, received)
+
+    return on_output
+
+
 def _maybe_prepend_system_tool_result(result: ToolResult, result_text: str):
     if result.system:
         result_text = f"<system>{result.system}</system>\n{result_text}"
@@ -162,18 +530,122 @@ def _maybe_prepend_system_tool_result(result: ToolResult, result_text: str):
 
 async def run_server(read_stream, write_stream):
     """Run the MCP server with given streams."""
-    await server.run(
+    bash_tool.warm_up()
+    capabilities = server.get_capabilities(
+        notification_options=NotificationOptions(),
+        experimental_capabilities={},
+    )
+    if capabilities.resources is not None:
+        # mcp does not advertise subscriptions, even with a subscribe handler registered
+        capabilities.resources.subscribe = True
+    _start_file_watcher()
+    async with recording.recorded_streams(read_stream, write_stream) as (
         read_stream,
         write_stream,
-        InitializationOptions(
-            server_name="hide-mcp",
-            server_version="0.1.0",
-            capabilities=server.get_capabilities(
-                notification_options=NotificationOptions(),
-                experimental_capabilities={},
+    ):
+        await _serve(
+            read_stream,
+            write_stream,
+            InitializationOptions(
+                server_name="hide-mcp",
+                server_version="0.1.0",
+                capabilities=capabilities,
             ),
-        ),
-    )
+        )
+
+
+_file_watcher_task: asyncio.Task | None = None
+
+
+def _start_file_watcher():
+    """Start the file watcher, once for all the sessions of the process."""
+    global _file_watcher_task
+    if _file_watcher_task is None or _file_watcher_task.done():
+        _file_watcher_task = asyncio.create_task(file_watcher.run())
+
+
+async def _serve(read_stream, write_stream, initialization_options):
+    """
+    Like `server.run`, but handles up to `MAX_CONCURRENT_REQUESTS` requests of the session
+    at the same time instead of one after the other. The tools serialize the calls that
+    share state, e.g. commands in the same bash session or edits of the same file. The
+    requests beyond the limit wait for a slot in their own tasks, so that notifications,
+    e.g. cancellations, are still read meanwhile. The subscriptions of the session are
+    removed when it ends.
+    """
+    async with ServerSession(
+        read_stream, write_stream, initialization_options
+    ) as session:
+        slots = anyio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        try:
+            async with anyio.create_task_group() as tg:
+                async for message in session.incoming_messages:
+                    match message:
+                        case RequestResponder():
+                            tg.start_soon(_handle_request, session, message, slots)
+                        case types.ClientNotification(root=notify):
+                            handler = server.notification_handlers.get(type(notify))
+                            if handler is None:
+                                continue
+                            try:
+                                await handler(notify)
+                            except Exception as e:
+                                logger.error(
+                                    f"Uncaught exception in notification handler: {e}"
+                                )
+                # the client is gone, nobody is waiting for the responses
+                tg.cancel_scope.cancel()
+        finally:
+            with anyio.CancelScope(shield=True):
+                await _unsubscribe_all(session)
+
+
+async def _handle_request(
+    session: ServerSession, message: RequestResponder, slots: anyio.Semaphore
+):
+    async with slots:
+        await _respond(session, message)
+
+
+async def _respond(session: ServerSession, message: RequestResponder):
+    request = message.request.root
+    try:
+        with tracing.span(
+            "mcp.request", method=request.method, request_id=message.request_id
+        ) as span:
+            handler = server.request_handlers.get(type(request))
+            if handler is None:
+                await message.respond(
+                    types.ErrorData(
+                        code=types.METHOD_NOT_FOUND, message="Method not found"
+                    )
+                )
+                return
+
+            logger.info(f"Processing request of type {type(request).__name__}")
+            token = request_ctx.set(
+                RequestContext(message.request_id, message.request_meta, session)
+            )
+            try:
+                with tracing.span("mcp.handle"):
+                    response = await handler(request)
+            except McpError as e:
+                # mcp passes the error data as the argument of the exception
+                error = e.args[0] if e.args else None
+                if isinstance(error, types.ErrorData):
+                    response = error
+                else:
+                    response = types.ErrorData(code=0, message=str(e), data=None)
+            except Exception as e:
+                response = types.ErrorData(code=0, message=str(e), data=None)
+            finally:
+                request_ctx.reset(token)
+            if isinstance(response, types.ErrorData):
+                span.set_attribute("error", response.message)
+            with tracing.span("mcp.respond"):
+                await message.respond(response)
+    except (anyio.ClosedResourceError, anyio.BrokenResourceError):
+        logger.debug("Client disconnected before the response was sent")
 
 
 async def main():
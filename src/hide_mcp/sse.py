@@ -1,17 +1,30 @@
 from mcp.server.sse import SseServerTransport
 from starlette.applications import Starlette
+from starlette.responses import Response
 from starlette.routing import Route
 
-from hide_mcp import server
+from hide_mcp import metrics, server, tracing
 
 sse = SseServerTransport("/messages")
 
+SSE_SESSIONS = metrics.Gauge("hide_sse_sessions", "Connected SSE sessions.")
+
 
 async def handle_sse(request):
+    accepting = tracing.start_span("sse.accept")
     async with sse.connect_sse(
         request.scope, request.receive, request._send
     ) as streams:
-        await server.run_server(streams[0], streams[1])
+        accepting.end()
+        SSE_SESSIONS.inc()
+        try:
+            await server.run_server(streams[0], streams[1])
+        finally:
+            SSE_SESSIONS.dec()
+
+
+async def handle_metrics(request):
+    return Response(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 async def handle_messages(request):
@@ -29,7 +42,11 @@ async def handle_messages(request):
         ):
             await request._send(message)
 
-    await sse.handle_post_message(request.scope, request.receive, send_wrapper)
+    # parses and validates the JSON-RPC message, and queues it for the session
+    with tracing.span(
+        "sse.post_message", session_id=request.query_params.get("session_id")
+    ):
+        await sse.handle_post_message(request.scope, request.receive, send_wrapper)
     return response
 
 
@@ -37,5 +54,6 @@ starlette_app = Starlette(
     routes=[
         Route("/sse", endpoint=handle_sse),
         Route("/messages", endpoint=handle_messages, methods=["POST"]),
+        Route("/metrics", endpoint=handle_metrics),
     ]
 )
@@ -3,12 +3,16 @@ from .bash import BashTool
 from .collection import ToolCollection
 from .computer import ComputerTool
 from .edit import EditTool
+from .jobs import JobTool
+from .search import SearchTool
 
 __ALL__ = [
     BashTool,
     CLIResult,
     ComputerTool,
     EditTool,
+    JobTool,
+    SearchTool,
     ToolCollection,
     ToolResult,
 ]
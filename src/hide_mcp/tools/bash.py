@@ -1,10 +1,19 @@
 import asyncio
+import codecs
 import logging
 import os
+import secrets
+import shlex
+import signal
+import time
 from pathlib import Path
-from typing import Any, ClassVar, Literal
+from typing import Any, Awaitable, Callable, ClassVar, Literal, NoReturn
 
+from .. import tracing
 from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
+from .capture import OutputCapture
+from .outputs import OutputStore, output_uri
+from .run import MAX_RESPONSE_LEN, run as run_cmd
 
 DESCRIPTION: str = """
 Run commands in a bash shell
@@ -13,22 +22,145 @@ Run commands in a bash shell
 * State is persistent across command calls and discussions with the user.
 * To inspect a particular line range of a file, e.g. lines 10-25, try 'sed -n 10,25p /path/to/the/file'.
 * Please avoid commands that may produce a very large amount of output.
-* Please run long lived commands in the background, e.g. 'sleep 10 &' or start a server in the background.
+* Commands read no input: stdin is empty, so pass input with pipes, files or heredocs instead of interactive prompts.
+* Long outputs are clipped to their start and end. The full output is saved to a file, which can be inspected with e.g. 'sed -n' or 'grep -n', and can be read in pages as the `hide://outputs/...` resource given in the output.
+* Please run long lived commands in the background, e.g. 'sleep 10 &' or start a server in the background. Use the `bash_jobs` tool to keep their output and to check on or stop them later.
 """
 
 logger = logging.getLogger(__name__)
 
+OutputCallback = Callable[[str], Awaitable[None]]
+
+
+def _cpu_time(pid: int) -> float | None:
+    """
+    CPU time in seconds used by a process and its terminated children, read from /proc.
+    Returns None where /proc is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # utime, stime, cutime and cstime are the fields 14 to 17, counted after the
+    # command name in parentheses, which may contain spaces
+    fields = stat[stat.rindex(")") + 2 :].split()
+    return sum(int(ticks) for ticks in fields[11:15]) / os.sysconf("SC_CLK_TCK")
+
+
+def _partial_suffix(buffer: bytes, sentinel: bytes) -> int:
+    """Length of the longest suffix of `buffer` that is a proper prefix of `sentinel`."""
+    for size in range(min(len(sentinel) - 1, len(buffer)), 0, -1):
+        if buffer.endswith(sentinel[:size]):
+            return size
+    return 0
+
+
+async def _foreground_processes(shell_pid: int) -> list[int]:
+    """
+    Find the processes of the command the shell is currently running in the foreground.
+    Without job control, the shell starts background jobs with SIGINT ignored, so
+    subtrees rooted at a process that ignores SIGINT are skipped.
+    """
+    _, stdout, _ = await run_cmd(
+        "ps -A -o pid=,ppid=,sigignore=", timeout=5.0, truncate_after=None
+    )
+    children: dict[int, list[tuple[int, bool]]] = {}
+    for line in stdout.splitlines():
+        try:
+            pid, ppid, ignored = line.split()
+            ignores_sigint = bool(int(ignored, 16) & (1 << (signal.SIGINT - 1)))
+        except ValueError:
+            continue
+        children.setdefault(int(ppid), []).append((int(pid), ignores_sigint))
+
+    processes = []
+    stack = [shell_pid]
+    while stack:
+        for pid, ignores_sigint in children.get(stack.pop(), []):
+            if not ignores_sigint:
+                processes.append(pid)
+                stack.append(pid)
+    return processes
+
+
+class _OutputReader:
+    """Reads the output of a command from the shell's stdout until the sentinel line."""
+
+    def __init__(
+        self,
+        stream: asyncio.StreamReader,
+        sentinel: bytes,
+        read_size: int,
+        capture: OutputCapture,
+        on_output: OutputCallback | None = None,
+    ):
+        self._stream = stream
+        self._sentinel = sentinel
+        self._read_size = read_size
+        self._on_output = on_output
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        # bytes that may be the start of the sentinel, not yet added to the capture
+        self._pending = b""
+        self.capture = capture
+
+    async def read_until_sentinel(self) -> str:
+        """
+        Read stdout as it arrives and add everything before the sentinel to the capture.
+        Returns the rest of the sentinel line, e.g. the exit status written after the sentinel.
+        Only the newly read bytes (plus a sentinel-sized overlap) are scanned,
+        so the cost is linear in the size of the output.
+        If `on_output` is given, it is awaited with every decoded chunk of output
+        as soon as the chunk is known not to be part of the sentinel.
+        Raises EOFError if the shell closes its stdout before the sentinel is found.
+        """
+        while True:
+            chunk = await self._stream.read(self._read_size)
+            if not chunk:
+                raise EOFError
+            data = self._pending + chunk
+            index = data.find(self._sentinel)
+            if index != -1:
+                line_end = data.find(b"\n", index)
+                if line_end == -1:
+                    # wait for the rest of the sentinel line
+                    self._pending = data[index:]
+                    await self._commit(data[:index], final=False)
+                    continue
+                logger.debug("Sentinel found!")
+                # anything read past the sentinel line belongs to background jobs
+                self._pending = b""
+                await self._commit(data[:index], final=True)
+                return data[index + len(self._sentinel) : line_end].decode(
+                    errors="replace"
+                )
+            end = len(data) - _partial_suffix(data, self._sentinel)
+            self._pending = data[end:]
+            await self._commit(data[:end], final=False)
+
+    async def _commit(self, data: bytes, final: bool):
+        self.capture.write(data)
+        if self._on_output:
+            text = self._decoder.decode(data, final=final)
+            if text:
+                await self._on_output(text)
+
 
 class _BashSession:
     """A session of a bash shell."""
 
     _started: bool
     _process: asyncio.subprocess.Process
+    lock: asyncio.Lock
+    last_used: float
 
     command: str = "/bin/bash"
-    _output_delay: float = 0.2  # seconds
+    _read_size: int = 65536  # bytes
     _timeout: float = 120.0  # seconds
-    _sentinel: str = "<<exit>>"
+    _interrupt_timeout: float = 5.0  # seconds
+    # bytes of output kept from the start and the end of a long output
+    _head_size: int = MAX_RESPONSE_LEN // 2
+    _tail_size: int = MAX_RESPONSE_LEN // 2
 
     @staticmethod
     def _get_user_shell() -> tuple[str, list[str]]:
@@ -64,8 +196,13 @@ class _BashSession:
 
         return shell, configs
 
-    def __init__(self):
+    def __init__(self, output_store: OutputStore):
         self._started = False
+        self._stopped = False
+        self._output_store = output_store
+        # serializes commands sent to this shell
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
         # Get user's shell and config
         self.command, self._configs = self._get_user_shell()
         logger.debug(f"Using shell: {self.command}, configs: {self._configs}")
@@ -73,14 +210,17 @@ class _BashSession:
     async def start(self):
         if self._started:
             return
+        with tracing.span("bash.start"):
+            await self._start()
 
+    async def _start(self):
         logger.debug(f"Starting shell: {self.command}")
 
         # Standard handling for bash/zsh
-        self._process = await asyncio.create_subprocess_shell(
+        # exec the shell directly, so that its pid is the one of the shell itself
+        self._process = await asyncio.create_subprocess_exec(
             self.command,
             preexec_fn=os.setsid,
-            shell=True,
             bufsize=0,
             limit=65536 * 8,
             stdin=asyncio.subprocess.PIPE,
@@ -91,6 +231,7 @@ class _BashSession:
 
         # Mark as started right after process creation but before config sourcing
         self._started = True
+        self._stopped = False
         logger.debug(f"Shell process started, return code: {self._process.returncode}")
 
         # Source config for bash/zsh
@@ -110,13 +251,31 @@ class _BashSession:
         if self._process.returncode is None:
             self._process.terminate()
         self._started = False
+        self._stopped = True
+
+    def _keep_output(self, capture: OutputCapture) -> str | None:
+        """Hand the spill file of a long output over to the output store. Returns its URI."""
+        capture.close()
+        if not capture.spill_path:
+            return None
+        return output_uri(self._output_store.add(capture.spill_path))
+
+    @property
+    def exited(self) -> bool:
+        """Whether the shell has been stopped or has exited on its own."""
+        return self._stopped or (self._started and self._process.returncode is not None)
 
     async def restart(self):
         """Restart the bash shell."""
         self.stop()
         await self.start()
 
-    async def run(self, command: str):
+    async def run(
+        self,
+        command: str,
+        on_output: OutputCallback | None = None,
+        timeout: float | None = None,
+    ):
         """Execute a command in the bash shell."""
         if not self._started:
             raise ToolError("Session has not started.")
@@ -130,85 +289,245 @@ class _BashSession:
         assert self._process.stdin
         assert self._process.stdout
 
+        if timeout is None:
+            timeout = self._timeout
+        elif (
+            not isinstance(timeout, int | float)
+            or isinstance(timeout, bool)
+            or timeout <= 0
+        ):
+            raise ToolError(
+                f"Invalid `timeout` parameter: {timeout}. It should be a positive number of seconds."
+            )
+
         logger.debug(f"Running command: {command}")
-        # send command to the process
+        started_at = time.monotonic()
+        cpu_started = _cpu_time(self._process.pid)
+        # send the command to the process, followed by the sentinel with its exit status.
+        # The command is evaluated from a quoted string with stdin from /dev/null, on a
+        # single line with the sentinel: commands that read stdin cannot swallow the
+        # sentinel, and syntax errors, a trailing `&` or a comment cannot keep it from
+        # running. The sentinel is new for every command, so output cannot fake it.
+        sentinel = f"<<exit-{secrets.token_hex(8)}>>"
         self._process.stdin.write(
-            command.encode() + f"; echo '{self._sentinel}'\n".encode()
+            f'eval {shlex.quote(command)} < /dev/null; echo "{sentinel}$?"\n'.encode()
         )
         await self._process.stdin.drain()
 
         # read output from the process, until the sentinel is found
+        # long outputs are spilled to the private directory of the store that keeps them
+        capture = OutputCapture(
+            self._head_size, self._tail_size, self._output_store.directory
+        )
+        reader = _OutputReader(
+            self._process.stdout,
+            sentinel.encode(),
+            self._read_size,
+            capture,
+            on_output,
+        )
         try:
             logger.debug("Waiting for output...")
-            async with asyncio.timeout(self._timeout):
-                while True:
-                    logger.debug("Checking for sentinel...")
-                    await asyncio.sleep(self._output_delay)
-                    # if we read directly from stdout/stderr, it will wait forever for
-                    # EOF. use the StreamReader buffer directly instead.
-                    output = (
-                        self._process.stdout._buffer.decode()  # pyright: ignore[reportAttributeAccessIssue]
-                    )
-                    if self._sentinel in output:
-                        logger.debug("Sentinel found!")
-                        # strip the sentinel and break
-                        output = output[: output.index(self._sentinel)]
-                        break
+            async with asyncio.timeout(timeout):
+                status = await reader.read_until_sentinel()
         except asyncio.TimeoutError:
-            logger.error("Timed out, restarting bash session")
-            await self.restart()
-
+            await self._interrupt(reader, timeout)
+        except EOFError:
+            await self._process.wait()
             raise ToolError(
-                f"timed out: bash has not returned in {self._timeout} seconds and has been restarted",
+                f"bash has exited with returncode {self._process.returncode}"
             ) from None
+        finally:
+            uri = self._keep_output(capture)
+
+        output = capture.getvalue(uri)
 
         if output.endswith("\n"):
             output = output[:-1]
 
         logger.debug(f"Output: {output}")
-        logger.debug("Clearing buffers...")
-        # clear the buffers so that the next output can be read correctly
-        self._process.stdout._buffer.clear()  # pyright: ignore[reportAttributeAccessIssue]
-        logger.debug("Done!")
 
-        return CLIResult(output=output)
+        wall_time = time.monotonic() - started_at
+        cpu_ended = _cpu_time(self._process.pid)
+        system = f"exit code: {status}, wall time: {wall_time:.3f}s"
+        cpu_time = None
+        if cpu_started is not None and cpu_ended is not None:
+            cpu_time = round(cpu_ended - cpu_started, 3)
+            system += f", cpu time: {cpu_time:.3f}s"
+        logger.info(
+            f"Command finished: exit_code={status} wall_time={wall_time:.3f} "
+            f"cpu_time={cpu_time} output_bytes={capture.total_bytes}"
+        )
+
+        return CLIResult(output=output, system=system)
+
+    async def _signal_foreground(self, sig: int):
+        """Send a signal to the processes of the command running in the foreground."""
+        for pid in await _foreground_processes(self._process.pid):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    async def _interrupt(self, reader: _OutputReader, timeout: float) -> NoReturn:
+        """
+        Interrupt the command that timed out and raise a ToolError with its output so far.
+        The shell is kept alive, unless the command does not stop after SIGINT.
+        """
+        logger.error("Timed out, interrupting the running command")
+        await self._signal_foreground(signal.SIGINT)
+
+        try:
+            async with asyncio.timeout(self._interrupt_timeout):
+                await reader.read_until_sentinel()
+            status = "the command has been interrupted"
+        except (asyncio.TimeoutError, EOFError):
+            # stop the shell, the session pool replaces it with a warm one
+            logger.error("Command did not stop after interrupt, stopping bash session")
+            await self._signal_foreground(signal.SIGKILL)
+            self.stop()
+            status = "bash has been restarted"
+
+        message = f"timed out: bash has not returned in {timeout} seconds and {status}"
+        output = reader.capture.getvalue(self._keep_output(reader.capture))
+        if output.strip():
+            message += f". Output so far:\n{output}"
+        raise ToolError(message)
 
 
 class BashTool(BaseAnthropicTool):
     """
     A tool that allows the agent to run bash commands.
     The tool parameters are defined by Anthropic and are not editable.
+    Commands can be run in independent named sessions, each backed by its own shell.
     """
 
-    _session: _BashSession | None
+    _sessions: dict[str, _BashSession]
+    _spares: list[_BashSession]
+    _warming: set[asyncio.Task]
+    # keeps the full outputs that are clipped in the results
+    output_store: OutputStore
     name: ClassVar[Literal["bash"]] = "bash"
 
-    def __init__(self):
-        self._session = None
+    default_session: ClassVar[str] = "default"
+    _max_sessions: int = 8
+    _idle_timeout: float = 1800.0  # seconds
+    _spare_sessions: int = int(os.getenv("HIDE_BASH_SPARE_SESSIONS", "1"))
+
+    def __init__(self, output_store: OutputStore | None = None):
+        self._sessions = {}
+        self._spares = []
+        self._warming = set()
+        self.output_store = output_store or OutputStore()
         super().__init__()
 
+    def warm_up(self):
+        """
+        Start spare shells in the background, up to `_spare_sessions`.
+        New and restarted sessions take a spare, so they don't wait for the shell
+        and its config files to load. Must be called from a running event loop.
+        """
+        self._spares = [s for s in self._spares if not s.exited]
+        while len(self._spares) < self._spare_sessions:
+            bash_session = _BashSession(self.output_store)
+            task = asyncio.create_task(self._start_spare(bash_session))
+            # keep a reference so the task isn't garbage collected while running
+            self._warming.add(task)
+            task.add_done_callback(self._warming.discard)
+            self._spares.append(bash_session)
+
+    @property
+    def n_sessions(self) -> int:
+        return len(self._sessions)
+
+    async def _start_spare(self, bash_session: _BashSession):
+        # holding the lock makes the first command wait until the shell is ready
+        async with bash_session.lock:
+            try:
+                await bash_session.start()
+            except Exception as e:
+                logger.warning(f"Failed to start spare bash session: {e}")
+
     async def __call__(
-        self, command: str | None = None, restart: bool = False, **kwargs
+        self,
+        command: str | None = None,
+        restart: bool = False,
+        session: str | None = None,
+        timeout: float | None = None,
+        on_output: OutputCallback | None = None,
+        **kwargs,
     ):
+        name = session or self.default_session
+
         if restart:
-            logger.debug("Restarting bash session")
-            if self._session:
-                self._session.stop()
-            self._session = _BashSession()
-            await self._session.start()
+            logger.debug(f"Restarting bash session {name}")
+            if name in self._sessions:
+                # don't wait for the lock, a running command is likely why we restart
+                self._stop_session(name)
+            bash_session = self._get_session(name)
+            async with bash_session.lock:
+                await bash_session.start()
 
             return ToolResult(system="tool has been restarted.")
 
-        if self._session is None:
-            logger.debug("Starting bash session")
-            self._session = _BashSession()
-            await self._session.start()
-
         if command is not None:
-            return await self._session.run(command)
+            bash_session = self._get_session(name)
+            waiting = tracing.start_span("bash.lock_wait", session=name)
+            async with bash_session.lock:
+                waiting.end()
+                await bash_session.start()
+                with tracing.span("bash.run", session=name) as span:
+                    result = await bash_session.run(command, on_output, timeout)
+                    span.set_attribute("system", result.system)
+                bash_session.last_used = time.monotonic()
+                return result
 
         raise ToolError("no command provided.")
 
+    def _get_session(self, name: str) -> _BashSession:
+        """
+        Get the session with the given name, taking a spare if it does not exist or has exited.
+        The session may still be starting; acquire its lock and call `start` before using it.
+        """
+        if name in self._sessions:
+            if not self._sessions[name].exited:
+                return self._sessions[name]
+            logger.debug(f"Bash session {name} has exited, replacing it")
+            self._stop_session(name)
+
+        self._evict_idle_sessions()
+        if len(self._sessions) >= self._max_sessions:
+            idle = [s for s in self._sessions.items() if not s[1].lock.locked()]
+            if not idle:
+                raise ToolError(
+                    f"too many bash sessions: all {self._max_sessions} sessions are busy."
+                )
+            oldest, _ = min(idle, key=lambda s: s[1].last_used)
+            logger.debug(f"Evicting least recently used bash session {oldest}")
+            self._stop_session(oldest)
+
+        logger.debug(f"Starting bash session {name}")
+        self._spares = [s for s in self._spares if not s.exited]
+        self._sessions[name] = (
+            self._spares.pop(0) if self._spares else _BashSession(self.output_store)
+        )
+        self.warm_up()
+        return self._sessions[name]
+
+    def _evict_idle_sessions(self):
+        """Stop the sessions that have not been used for longer than the idle timeout."""
+        deadline = time.monotonic() - self._idle_timeout
+        for name, bash_session in list(self._sessions.items()):
+            if not bash_session.lock.locked() and bash_session.last_used < deadline:
+                logger.debug(f"Evicting idle bash session {name}")
+                self._stop_session(name)
+
+    def _stop_session(self, name: str):
+        """Remove the session with the given name from the pool and stop its shell."""
+        bash_session = self._sessions.pop(name)
+        if bash_session._started:
+            bash_session.stop()
+
     def to_params(self) -> dict[str, Any]:
         return {
             "name": self.name,
@@ -223,6 +542,18 @@ class BashTool(BaseAnthropicTool):
                         "description": "Specifying true will restart this tool. Otherwise, leave this unspecified.",
                         "type": "boolean",
                     },
+                    "session": {
+                        "description": "Optional name of the shell session to use. Each session is an independent shell with its own state, and commands in different sessions can run concurrently. If not given, the `default` session is used.",
+                        "type": "string",
+                    },
+                    "timeout": {
+                        "description": "Optional timeout in seconds. If the command does not return in time, it is interrupted and its output so far is returned. Defaults to 120 seconds.",
+                        "type": "number",
+                    },
+                    "stream": {
+                        "description": "Specifying true will send the output as log notifications while the command runs. The full output is still returned at the end.",
+                        "type": "boolean",
+                    },
                 },
                 "type": "object",
             },
@@ -0,0 +1,96 @@
+"""Utility to capture command output with a fixed memory budget."""
+
+import os
+import tempfile
+from typing import BinaryIO
+
+
+class OutputCapture:
+    """
+    Captures a stream of output, keeping only its head and tail in memory.
+    The first `head_size` and the last `tail_size` bytes are kept, along with the total
+    byte and line counts. The bytes in between are dropped, unless a `spill_dir` is
+    given: then, once the output outgrows the memory budget, all of it is written to a
+    spill file in `spill_dir`, so that it can be read later.
+    """
+
+    head: bytearray
+    tail: bytearray
+    total_bytes: int
+    total_lines: int
+    spill_path: str | None
+
+    def __init__(self, head_size: int, tail_size: int, spill_dir: str | None = None):
+        self._head_size = head_size
+        self._tail_size = tail_size
+        self._spill_dir = spill_dir
+        self._spill_file: BinaryIO | None = None
+        self._ends_with_newline = True
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+        self.total_lines = 0
+        self.spill_path = None
+
+    @property
+    def omitted_bytes(self) -> int:
+        return self.total_bytes - len(self.head) - len(self.tail)
+
+    def write(self, data: bytes):
+        """Add data to the capture."""
+        if not data:
+            return
+        self.total_bytes += len(data)
+        self.total_lines += data.count(b"\n")
+        self._ends_with_newline = data.endswith(b"\n")
+
+        room = self._head_size - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+
+        self.tail += data
+        overflow = len(self.tail) - self._tail_size
+        if overflow > 0:
+            self._spill(memoryview(self.tail)[:overflow])
+            del self.tail[:overflow]
+
+    def _spill(self, data: memoryview):
+        if self._spill_dir is None:
+            return
+        if self._spill_file is None:
+            os.makedirs(self._spill_dir, exist_ok=True)
+            fd, self.spill_path = tempfile.mkstemp(
+                prefix="output-", suffix=".txt", dir=self._spill_dir
+            )
+            self._spill_file = os.fdopen(fd, "wb")
+            self._spill_file.write(self.head)
+        self._spill_file.write(data)
+
+    def close(self):
+        """Complete and close the spill file, if any. The file itself is kept."""
+        if self._spill_file is not None:
+            self._spill_file.write(self.tail)
+            self._spill_file.close()
+            self._spill_file = None
+
+    def getvalue(self, uri: str | None = None) -> str:
+        """
+        Decode the captured output. If any bytes were omitted, a notice with the
+        size of the output and where to find all of it is put in their place: the
+        spill file and, if given, the `uri` of a resource with its content.
+        """
+        if not self.omitted_bytes:
+            return (self.head + self.tail).decode(errors="replace")
+
+        lines = self.total_lines + (0 if self._ends_with_newline else 1)
+        notice = f"<response clipped: {self.omitted_bytes} of {self.total_bytes} bytes ({lines} lines) omitted"
+        if self.spill_path:
+            notice += f", the full output was saved to {self.spill_path}"
+        if uri:
+            notice += f" and can be read in pages as the resource {uri}, e.g. {uri}?lines=1-100 or {uri}?bytes=0-65535"
+        return (
+            self.head.decode(errors="replace")
+            + f"\n{notice}>\n"
+            + self.tail.decode(errors="replace")
+        )
@@ -1,9 +1,22 @@
-from collections import defaultdict
+import asyncio
+import difflib
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from contextlib import AsyncExitStack, asynccontextmanager
 from pathlib import Path
-from typing import Any, Literal, get_args
+from typing import Any, Callable, Literal, get_args
 
+from .. import tracing
 from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
-from .run import maybe_truncate, run
+from .file_cache import CachedFile, FileCache
+from .history import FileHistory
+from .outputs import OutputStore
+from .run import MAX_RESPONSE_LEN, maybe_truncate
+from .symbols import SymbolCache
+from .walker import DirectoryWalker
 
 Command = Literal[
     "view",
@@ -11,16 +24,37 @@ Command = Literal[
     "str_replace",
     "insert",
     "undo_edit",
+    "batch",
+    "outline",
+    "view_symbol",
+]
+BatchCommand = Literal[
+    "str_replace",
+    "insert",
 ]
 SNIPPET_LINES: int = 4
+FILE_CACHE_SIZE: int = 256 * 1024 * 1024  # bytes
+# budgets of the edit history; beyond the memory budgets, old edits are moved to disk
+HISTORY_FILE_MEMORY: int = 16 * 1024 * 1024  # bytes
+HISTORY_MEMORY: int = 128 * 1024 * 1024  # bytes
+HISTORY_DISK: int = 1024 * 1024 * 1024  # bytes
+DIRECTORY_CACHE_SIZE: int = 4096  # directories
+DIRECTORY_DEPTH: int = 2
+MAX_DIRECTORY_ENTRIES: int = 1000
+# total length of the file contents shown when viewing several files at once
+MAX_VIEW_FILES_LEN: int = 4 * MAX_RESPONSE_LEN
+SYMBOL_CACHE_SIZE: int = 1024  # files
 
 DESCRIPTION: str = """
 Custom editing tool for viewing, creating and editing files
 * State is persistent across command calls and discussions with the user
-* If `path` is a file, `view` displays the result of applying `cat -n`. If `path` is a directory, `view` lists non-hidden files and directories up to 2 levels deep
+* If `path` is a file, `view` displays the result of applying `cat -n`. If `path` is a directory, `view` lists non-hidden files and directories that are not ignored by .gitignore, up to `depth` levels deep (2 by default) and at most 1000 entries
 * The `create` command cannot be used if the specified `path` already exists as a file
 * If a `command` generates a long output, it will be truncated and marked with `<response clipped>`
+* To view several files or ranges at once, pass them as `files` to the `view` command instead of `path`. They are shown one after the other, shortened to fit in a total output budget
 * The `undo_edit` command will revert the last edit made to the file at `path`
+* For Python files, the `outline` command lists the classes and functions of the file at `path` with their line ranges, and the `view_symbol` command shows the source of one of them by its qualified name, e.g. `MyClass.my_method`
+* The `batch` command applies a list of `str_replace` and `insert` edits to one or more files. All edits are checked first and either all or none are applied. Edits to the same file are applied in order. A later `undo_edit` on any of the files reverts the whole batch
 
 Notes for using the `str_replace` command:
 * The `old_str` parameter should match EXACTLY one or more consecutive lines from the original file. Be mindful of whitespaces!
@@ -33,14 +67,41 @@ class EditTool(BaseAnthropicTool):
     """
     An filesystem editor tool that allows the agent to view, create, and edit files.
     The tool parameters are defined by Anthropic and are not editable.
+    Calls on different files run concurrently, in worker threads; calls on the same
+    file are serialized.
     """
 
     name: Literal["str_replace_editor"] = "str_replace_editor"
 
-    _file_history: dict[Path, list[str]]
-
-    def __init__(self):
-        self._file_history = defaultdict(list)
+    _file_history: FileHistory
+    _file_cache: FileCache
+    _walker: DirectoryWalker
+    _symbol_cache: SymbolCache
+    # keeps the full outputs that are clipped from the results
+    output_store: OutputStore
+    _undo_groups: dict[int, list[Path]]
+    _path_locks: weakref.WeakValueDictionary[Path, asyncio.Lock]
+    # called with the path of every file written by the tool, e.g. to update a search index
+    write_listeners: list[Callable[[Path], None]]
+
+    def __init__(self, output_store: OutputStore | None = None):
+        self.output_store = output_store or OutputStore()
+        self._file_history = FileHistory(
+            max_file_memory=HISTORY_FILE_MEMORY,
+            max_memory=HISTORY_MEMORY,
+            max_disk=HISTORY_DISK,
+            spill=True,
+        )
+        self._file_cache = FileCache(FILE_CACHE_SIZE)
+        self._walker = DirectoryWalker(DIRECTORY_CACHE_SIZE)
+        self._symbol_cache = SymbolCache(SYMBOL_CACHE_SIZE)
+        self._undo_groups = {}
+        self.write_listeners = []
+        self._next_group = 1
+        self._path_locks = weakref.WeakValueDictionary()
+        # guards the undo groups and the walker, which are shared by the worker threads
+        self._groups_lock = threading.Lock()
+        self._walker_lock = threading.Lock()
         super().__init__()
 
     def to_params(self) -> dict[str, Any]:
@@ -50,8 +111,17 @@ class EditTool(BaseAnthropicTool):
             "inputSchema": {
                 "properties": {
                     "command": {
-                        "description": "The commands to run. Allowed options are: `view`, `create`, `str_replace`, `insert`, `undo_edit`.",
-                        "enum": ["view", "create", "str_replace", "insert", "undo_edit"],
+                        "description": "The commands to run. Allowed options are: `view`, `create`, `str_replace`, `insert`, `undo_edit`, `batch`, `outline`, `view_symbol`.",
+                        "enum": [
+                            "view",
+                            "create",
+                            "str_replace",
+                            "insert",
+                            "undo_edit",
+                            "batch",
+                            "outline",
+                            "view_symbol",
+                        ],
                         "type": "string",
                     },
                     "file_text": {
@@ -71,7 +141,29 @@ class EditTool(BaseAnthropicTool):
                         "type": "string",
                     },
                     "path": {
-                        "description": "Absolute path to file or directory, e.g. `/repo/file.py` or `/repo`.",
+                        "description": "Absolute path to file or directory, e.g. `/repo/file.py` or `/repo`. Required unless the command is `batch`.",
+                        "type": "string",
+                    },
+                    "edits": {
+                        "description": "Required parameter of `batch` command. The edits to apply, each with a `command` (`str_replace` or `insert`), an absolute `path` and the parameters of that command.",
+                        "items": {
+                            "properties": {
+                                "command": {
+                                    "enum": ["str_replace", "insert"],
+                                    "type": "string",
+                                },
+                                "path": {"type": "string"},
+                                "old_str": {"type": "string"},
+                                "new_str": {"type": "string"},
+                                "insert_line": {"type": "integer"},
+                            },
+                            "required": ["command", "path"],
+                            "type": "object",
+                        },
+                        "type": "array",
+                    },
+                    "symbol": {
+                        "description": "Required parameter of `view_symbol` command. The qualified name of the class or function to view, e.g. `MyClass.my_method`, or its name if it is unique in the file.",
                         "type": "string",
                     },
                     "view_range": {
@@ -79,8 +171,31 @@ class EditTool(BaseAnthropicTool):
                         "items": {"type": "integer"},
                         "type": "array",
                     },
+                    "files": {
+                        "description": "Optional parameter of `view` command, instead of `path`. A list of files to view at once, each with an absolute `path` and an optional `view_range`.",
+                        "items": {
+                            "properties": {
+                                "path": {"type": "string"},
+                                "view_range": {
+                                    "items": {"type": "integer"},
+                                    "type": "array",
+                                },
+                            },
+                            "required": ["path"],
+                            "type": "object",
+                        },
+                        "type": "array",
+                    },
+                    "depth": {
+                        "description": "Optional parameter of `view` command when `path` points to a directory. How many levels deep to list, defaults to 2.",
+                        "type": "integer",
+                    },
+                    "show_sizes": {
+                        "description": "Optional parameter of `view` command when `path` points to a directory. If true, the size of each file is shown.",
+                        "type": "boolean",
+                    },
                 },
-                "required": ["command", "path"],
+                "required": ["command"],
                 "type": "object",
             }
         }
@@ -90,23 +205,90 @@ class EditTool(BaseAnthropicTool):
         self,
         *,
         command: Command,
-        path: str,
+        path: str | None = None,
         file_text: str | None = None,
         view_range: list[int] | None = None,
         old_str: str | None = None,
         new_str: str | None = None,
         insert_line: int | None = None,
+        edits: list[dict[str, Any]] | None = None,
+        files: list[dict[str, Any]] | None = None,
+        symbol: str | None = None,
+        depth: int | None = None,
+        show_sizes: bool = False,
         **kwargs,
     ):
+        if command == "batch":
+            if not edits or not isinstance(edits, list):
+                raise ToolError(
+                    "Parameter `edits` is required and should be a non-empty list for command: batch"
+                )
+            paths = [
+                Path(edit["path"])
+                for edit in edits
+                if isinstance(edit, dict) and isinstance(edit.get("path"), str)
+            ]
+            async with self._lock_paths(paths):
+                with tracing.span("edit.batch", edits=len(edits)):
+                    return await asyncio.to_thread(self.batch, edits)
+        if command == "view" and files is not None:
+            if path is not None:
+                raise ToolError(
+                    "Parameters `path` and `files` cannot be used together for command: view. Pass each file as one of the `files` instead."
+                )
+            if not files or not isinstance(files, list):
+                raise ToolError(
+                    "Parameter `files` should be a non-empty list for command: view"
+                )
+            return await self.view_files(files)
+        if path is None:
+            raise ToolError(f"Parameter `path` is required for command: {command}")
         _path = Path(path)
+        while True:
+            paths = self._undo_paths(_path) if command == "undo_edit" else [_path]
+            async with self._lock_paths(paths):
+                if command == "undo_edit" and not set(self._undo_paths(_path)) <= set(
+                    paths
+                ):
+                    # a batch edited the file while waiting for the locks
+                    continue
+                with tracing.span(f"edit.{command}", path=path):
+                    return await asyncio.to_thread(
+                        self._run_command,
+                        command,
+                        _path,
+                        file_text,
+                        view_range,
+                        old_str,
+                        new_str,
+                        insert_line,
+                        symbol,
+                        depth,
+                        show_sizes,
+                    )
+
+    def _run_command(
+        self,
+        command: Command,
+        _path: Path,
+        file_text: str | None,
+        view_range: list[int] | None,
+        old_str: str | None,
+        new_str: str | None,
+        insert_line: int | None,
+        symbol: str | None,
+        depth: int | None,
+        show_sizes: bool,
+    ):
+        """Run a command on a single path, in a worker thread holding the lock of the path."""
         self.validate_path(command, _path)
         if command == "view":
-            return await self.view(_path, view_range)
+            return self.view(_path, view_range, depth, show_sizes)
         elif command == "create":
             if file_text is None:
                 raise ToolError("Parameter `file_text` is required for command: create")
             self.write_file(_path, file_text)
-            self._file_history[_path].append(file_text)
+            self._file_history.push(_path, file_text)
             return ToolResult(output=f"File created successfully at: {_path}")
         elif command == "str_replace":
             if old_str is None:
@@ -124,6 +306,14 @@ class EditTool(BaseAnthropicTool):
             return self.insert(_path, insert_line, new_str)
         elif command == "undo_edit":
             return self.undo_edit(_path)
+        elif command == "outline":
+            return self.outline(_path)
+        elif command == "view_symbol":
+            if not symbol:
+                raise ToolError(
+                    "Parameter `symbol` is required for command: view_symbol"
+                )
+            return self.view_symbol(_path, symbol)
         raise ToolError(
             f'Unrecognized command {command}. The allowed commands for the {self.name} tool are: {", ".join(get_args(Command))}'
         )
@@ -154,30 +344,96 @@ class EditTool(BaseAnthropicTool):
                     f"The path {path} is a directory and only the `view` command can be used on directories"
                 )
 
-    async def view(self, path: Path, view_range: list[int] | None = None):
+    def view(
+        self,
+        path: Path,
+        view_range: list[int] | None = None,
+        depth: int | None = None,
+        show_sizes: bool = False,
+    ):
         """Implement the view command"""
         if path.is_dir():
             if view_range:
                 raise ToolError(
                     "The `view_range` parameter is not allowed when `path` points to a directory."
                 )
+            return self.view_directory(path, depth, show_sizes)
+
+        file_content, init_line = self._read_range(path, view_range)
+        return CLIResult(
+            output=self._make_output(file_content, str(path), init_line=init_line)
+        )
 
-            _, stdout, stderr = await run(
-                rf"find {path} -maxdepth 2 -not -path '*/\.*'"
+    async def view_files(self, files: list[dict[str, Any]]):
+        """Implement the view command for several files, which are read concurrently"""
+
+        async def read(file: dict[str, Any]) -> tuple[str, int] | str:
+            """The content and first line of a file, or the output for a directory or an error."""
+            try:
+                if not isinstance(file, dict) or not file.get("path"):
+                    raise ToolError("Each of the `files` needs a `path`.")
+                path = Path(file["path"])
+                view_range = file.get("view_range")
+
+                def view_one() -> tuple[str, int] | str:
+                    self.validate_path("view", path)
+                    if path.is_dir():
+                        if view_range:
+                            raise ToolError(
+                                "The `view_range` parameter is not allowed when `path` points to a directory."
+                            )
+                        return self.view_directory(path, None, False).output or ""
+                    return self._read_range(path, view_range)
+
+                async with self._lock_paths([path]):
+                    with tracing.span("edit.view", path=str(path)):
+                        return await asyncio.to_thread(view_one)
+            except ToolError as e:
+                return f"Could not view {file.get('path') if isinstance(file, dict) else file}: {e.message}\n"
+
+        results = await asyncio.gather(*(read(file) for file in files))
+
+        # share the budget among the files, the shorter ones leave more to the longer ones
+        lengths = [
+            len(result[0]) if isinstance(result, tuple) else len(result)
+            for result in results
+        ]
+        shares = {}
+        budget = MAX_VIEW_FILES_LEN
+        for k, i in enumerate(sorted(range(len(results)), key=lengths.__getitem__)):
+            shares[i] = min(lengths[i], budget // (len(results) - k), MAX_RESPONSE_LEN)
+            budget -= shares[i]
+
+        outputs = []
+        for i, (file, result) in enumerate(zip(files, results)):
+            if isinstance(result, str):
+                # directory listings and errors take their share of the budget too
+                outputs.append(
+                    maybe_truncate(result, max(1, shares[i]), self.output_store)
+                )
+                continue
+            file_content, init_line = result
+            outputs.append(
+                self._make_output(
+                    file_content,
+                    str(file["path"]),
+                    init_line=init_line,
+                    truncate_after=max(1, shares[i]),
+                )
             )
-            if not stderr:
-                stdout = f"Here's the files and directories up to 2 levels deep in {path}, excluding hidden items:\n{stdout}\n"
-            return CLIResult(output=stdout, error=stderr)
+        return CLIResult(output="\n".join(outputs))
 
-        file_content = self.read_file(path)
+    def _read_range(self, path: Path, view_range: list[int] | None) -> tuple[str, int]:
+        """Read the lines of a file in `view_range`. Returns them and the number of the first one."""
+        cached_file = self._read_cached(path)
+        file_content = cached_file.content
         init_line = 1
         if view_range:
             if len(view_range) != 2 or not all(isinstance(i, int) for i in view_range):
                 raise ToolError(
                     "Invalid `view_range`. It should be a list of two integers."
                 )
-            file_lines = file_content.split("\n")
-            n_lines_file = len(file_lines)
+            n_lines_file = cached_file.n_lines
             init_line, final_line = view_range
             if init_line < 1 or init_line > n_lines_file:
                 raise ToolError(
@@ -192,72 +448,219 @@ class EditTool(BaseAnthropicTool):
                     f"Invalid `view_range`: {view_range}. Its second element `{final_line}` should be larger or equal than its first `{init_line}`"
                 )
 
-            if final_line == -1:
-                file_content = "\n".join(file_lines[init_line - 1 :])
-            else:
-                file_content = "\n".join(file_lines[init_line - 1 : final_line])
+            file_content = cached_file.lines(init_line, final_line)
 
+        return file_content, init_line
+
+    def outline(self, path: Path):
+        """Implement the outline command, which lists the classes and functions of a Python file"""
+        symbols = self._get_symbols(path)
+        if not symbols:
+            return CLIResult(output=f"No classes or functions found in {path}.")
+        lines = [
+            f"{'    ' * symbol.depth}{symbol.kind} {symbol.name.rsplit('.', 1)[-1]}  (lines {symbol.start_line}-{symbol.end_line})"
+            for symbol in symbols
+        ]
         return CLIResult(
-            output=self._make_output(file_content, str(path), init_line=init_line)
+            output=f"Here's the outline of {path}:\n"
+            + maybe_truncate("\n".join(lines), output_store=self.output_store)
+            + "\n"
         )
 
+    def view_symbol(self, path: Path, symbol: str):
+        """Implement the view_symbol command, which shows the source of a class or function of a Python file"""
+        symbols = self._get_symbols(path)
+        matches = [s for s in symbols if s.name == symbol]
+        if not matches:
+            matches = [s for s in symbols if s.name.rsplit(".", 1)[-1] == symbol]
+            names = list(dict.fromkeys(s.name for s in matches))
+            if len(names) > 1:
+                raise ToolError(
+                    f"The name `{symbol}` is ambiguous in {path}, use one of the qualified names: {', '.join(names)}"
+                )
+        if not matches:
+            message = f"No class or function named `{symbol}` found in {path}."
+            # a name defined more than once, e.g. in both branches of an `if`, is suggested once
+            close = difflib.get_close_matches(
+                symbol, list(dict.fromkeys(s.name for s in symbols))
+            )
+            if close:
+                message += (
+                    f" Did you mean {' or '.join(f'`{name}`' for name in close)}?"
+                )
+            raise ToolError(
+                message + " Use the `outline` command to list the symbols of the file."
+            )
+
+        # a name may be defined more than once, e.g. a property and its setter
+        cached_file = self._read_cached(path)
+        output = ""
+        for match in matches:
+            output += self._make_output(
+                cached_file.lines(match.start_line, match.end_line),
+                f"`{match.name}` in {path}",
+                init_line=match.start_line,
+            )
+        return CLIResult(output=output)
+
+    def _get_symbols(self, path: Path):
+        if path.suffix not in (".py", ".pyi"):
+            raise ToolError(
+                f"The path {path} is not a Python file. Symbols can only be listed for Python files."
+            )
+        try:
+            return self._symbol_cache.get(
+                path, lambda path: self._read_cached(path).content
+            )
+        except SyntaxError as e:
+            raise ToolError(f"Could not parse {path}: {e}") from None
+
+    def view_directory(self, path: Path, depth: int | None, show_sizes: bool):
+        """List a directory in process, skipping hidden and ignored items"""
+        if depth is None:
+            depth = DIRECTORY_DEPTH
+        if not isinstance(depth, int) or depth < 1:
+            raise ToolError(
+                f"Invalid `depth` parameter: {depth}. It should be a positive integer."
+            )
+        try:
+            with self._walker_lock:
+                entries, truncated = self._walker.walk(
+                    str(path), depth, MAX_DIRECTORY_ENTRIES, sizes=show_sizes
+                )
+        except OSError as e:
+            raise ToolError(f"Ran into {e} while trying to list {path}") from None
+
+        lines = []
+        for entry in entries:
+            line = entry.path
+            if show_sizes and entry.size is not None:
+                line += f" ({entry.size} bytes)"
+            lines.append(line)
+        output = f"Here's the files and directories up to {depth} levels deep in {path}, excluding hidden items and items ignored by .gitignore:\n"
+        output += "\n".join(lines) + "\n"
+        if truncated:
+            output += f"<listing clipped at {MAX_DIRECTORY_ENTRIES} entries, view a subdirectory or use a smaller `depth` to see the rest>\n"
+        return CLIResult(output=output)
+
     def str_replace(self, path: Path, old_str: str, new_str: str | None):
         """Implement the str_replace command, which replaces old_str with new_str in the file content"""
         # Read the file content
         file_content = self.read_file(path).expandtabs()
+        new_file_content, snippet, start_line = self._replace(
+            path, file_content, old_str, new_str
+        )
+
+        # Write the new content to the file
+        self.write_file(path, new_file_content)
+
+        # Save the content to history
+        self._file_history.push(path, file_content)
+
+        # Prepare the success message
+        success_msg = f"The file {path} has been edited. "
+        success_msg += self._make_output(
+            snippet, f"a snippet of {path}", start_line + 1
+        )
+        success_msg += "Review the changes and make sure they are as expected. Edit the file again if necessary."
+
+        return CLIResult(output=success_msg)
+
+    def _replace(
+        self, path: Path, file_content: str, old_str: str, new_str: str | None
+    ) -> tuple[str, str, int]:
+        """
+        Replace old_str with new_str in the file content.
+        Returns the new content, a snippet of the edited section and the index of its first line.
+        """
         if file_content == "" and new_str:
             new_file_content = new_str
+            old_str = ""
+            index = 0
         else:
             old_str = old_str.expandtabs()
             new_str = new_str.expandtabs() if new_str is not None else ""
 
             # Check if old_str is unique in the file
-            occurrences = file_content.count(old_str)
-            if occurrences == 0:
+            index = file_content.find(old_str)
+            if index == -1:
                 raise ToolError(
                     f"No replacement was performed, old_str `{old_str}` did not appear verbatim in {path}."
                 )
-            elif occurrences > 1:
-                file_content_lines = file_content.split("\n")
-                lines = [
-                    idx + 1
-                    for idx, line in enumerate(file_content_lines)
-                    if old_str in line
-                ]
+            if file_content.find(old_str, index + max(1, len(old_str))) != -1 or (
+                old_str == "" and file_content
+            ):
+                lines = self._occurrence_lines(file_content, old_str, index)
                 raise ToolError(
                     f"No replacement was performed. Multiple occurrences of old_str `{old_str}` in lines {lines}. Please ensure it is unique"
                 )
 
             # Replace old_str with new_str
-            new_file_content = file_content.replace(old_str, new_str)
+            new_file_content = "".join(
+                (file_content[:index], new_str, file_content[index + len(old_str) :])
+            )
 
-        # Write the new content to the file
-        self.write_file(path, new_file_content)
+        # Create a snippet of the edited section, from SNIPPET_LINES lines before the
+        # replacement to SNIPPET_LINES lines after it, without splitting the content
+        replacement_line = file_content.count("\n", 0, index)
+        start_line = max(0, replacement_line - SNIPPET_LINES)
+        snippet_start = index
+        for _ in range(replacement_line - start_line + 1):
+            snippet_start = new_file_content.rfind("\n", 0, snippet_start)
+        snippet_start += 1
+        snippet_end = index + len(new_str) - 1
+        for _ in range(SNIPPET_LINES + 1):
+            snippet_end = new_file_content.find("\n", snippet_end + 1)
+            if snippet_end == -1:
+                snippet_end = len(new_file_content)
+                break
+        snippet = new_file_content[snippet_start:snippet_end]
+
+        return new_file_content, snippet, start_line
+
+    @staticmethod
+    def _occurrence_lines(file_content: str, old_str: str, index: int) -> list[int]:
+        """The numbers of the lines that contain old_str, given the offset of its first occurrence."""
+        if "\n" in old_str:
+            # a single line cannot contain old_str
+            return []
+        if old_str == "":
+            return list(range(1, file_content.count("\n") + 2))
+        lines = []
+        line = file_content.count("\n", 0, index) + 1
+        last = index
+        while index != -1:
+            line += file_content.count("\n", last, index)
+            if not lines or lines[-1] != line:
+                lines.append(line)
+            last = index
+            index = file_content.find(old_str, index + len(old_str))
+        return lines
 
-        # Save the content to history
-        self._file_history[path].append(file_content)
+    def insert(self, path: Path, insert_line: int, new_str: str):
+        """Implement the insert command, which inserts new_str at the specified line in the file content."""
+        file_text = self.read_file(path).expandtabs()
+        new_file_text, snippet = self._insert(file_text, insert_line, new_str)
 
-        # Create a snippet of the edited section
-        if old_str == "":
-            replacement_line = 0
-        else:
-            replacement_line = file_content.split(old_str)[0].count("\n")
-        start_line = max(0, replacement_line - SNIPPET_LINES)
-        end_line = replacement_line + SNIPPET_LINES + new_str.count("\n")
-        snippet = "\n".join(new_file_content.split("\n")[start_line : end_line + 1])
+        self.write_file(path, new_file_text)
+        self._file_history.push(path, file_text)
 
-        # Prepare the success message
         success_msg = f"The file {path} has been edited. "
         success_msg += self._make_output(
-            snippet, f"a snippet of {path}", start_line + 1
+            snippet,
+            "a snippet of the edited file",
+            max(1, insert_line - SNIPPET_LINES + 1),
         )
-        success_msg += "Review the changes and make sure they are as expected. Edit the file again if necessary."
-
+        success_msg += "Review the changes and make sure they are as expected (correct indentation, no duplicate lines, etc). Edit the file again if necessary."
         return CLIResult(output=success_msg)
 
-    def insert(self, path: Path, insert_line: int, new_str: str):
-        """Implement the insert command, which inserts new_str at the specified line in the file content."""
-        file_text = self.read_file(path).expandtabs()
+    def _insert(
+        self, file_text: str, insert_line: int, new_str: str
+    ) -> tuple[str, str]:
+        """
+        Insert new_str after the line insert_line of the file content.
+        Returns the new content and a snippet of the edited section.
+        """
         new_str = new_str.expandtabs()
         file_text_lines = file_text.split("\n")
         n_lines_file = len(file_text_lines)
@@ -279,46 +682,250 @@ class EditTool(BaseAnthropicTool):
             + file_text_lines[insert_line : insert_line + SNIPPET_LINES]
         )
 
-        new_file_text = "\n".join(new_file_text_lines)
-        snippet = "\n".join(snippet_lines)
-
-        self.write_file(path, new_file_text)
-        self._file_history[path].append(file_text)
-
-        success_msg = f"The file {path} has been edited. "
-        success_msg += self._make_output(
-            snippet,
-            "a snippet of the edited file",
-            max(1, insert_line - SNIPPET_LINES + 1),
-        )
-        success_msg += "Review the changes and make sure they are as expected (correct indentation, no duplicate lines, etc). Edit the file again if necessary."
+        return "\n".join(new_file_text_lines), "\n".join(snippet_lines)
+
+    def batch(self, edits: list[dict[str, Any]]):
+        """Implement the batch command, which applies all of the edits or none of them."""
+        original_contents: dict[Path, str] = {}
+        new_contents: dict[Path, str] = {}
+        outputs = []
+        for i, edit in enumerate(edits, start=1):
+            try:
+                _check_batch_edit(edit)
+            except ToolError as e:
+                raise ToolError(
+                    f"No edits were performed. Edit {i} of {len(edits)} is invalid: {e.message}"
+                ) from None
+        for i, edit in enumerate(edits, start=1):
+            try:
+                path, output = self._batch_edit(edit, original_contents, new_contents)
+            except ToolError as e:
+                raise ToolError(
+                    f"No edits were performed. Edit {i} of {len(edits)} failed: {e.message}"
+                ) from None
+            outputs.append(f"Edit {i} to {path}: {output}")
+
+        self._write_files_atomically(new_contents)
+
+        with self._groups_lock:
+            group = self._next_group
+            self._next_group += 1
+            for path, file_content in original_contents.items():
+                self._file_history.push(path, file_content, group)
+            self._undo_groups[group] = list(original_contents)
+
+        success_msg = f"{len(edits)} edits to {len(new_contents)} files have been applied. An `undo_edit` on any of the files will revert all of them.\n"
+        success_msg += "".join(outputs)
+        success_msg += "Review the changes and make sure they are as expected. Edit the files again if necessary."
         return CLIResult(output=success_msg)
 
+    def _batch_edit(
+        self,
+        edit: dict[str, Any],
+        original_contents: dict[Path, str],
+        new_contents: dict[Path, str],
+    ) -> tuple[Path, str]:
+        """
+        Apply one edit of a batch, checked by `_check_batch_edit`, to the new contents in
+        memory. Returns its path and a snippet.
+        """
+        command = edit["command"]
+        path = Path(edit["path"])
+        self.validate_path(command, path)
+        if path not in new_contents:
+            original_contents[path] = self.read_file(path).expandtabs()
+            new_contents[path] = original_contents[path]
+
+        if command == "str_replace":
+            if edit.get("old_str") is None:
+                raise ToolError(
+                    "Parameter `old_str` is required and cannot be empty for command: str_replace"
+                )
+            new_contents[path], snippet, start_line = self._replace(
+                path, new_contents[path], edit["old_str"], edit.get("new_str")
+            )
+            init_line = start_line + 1
+        else:
+            if edit.get("insert_line") is None:
+                raise ToolError(
+                    "Parameter `insert_line` is required for command: insert"
+                )
+            if edit.get("new_str") is None:
+                raise ToolError("Parameter `new_str` is required for command: insert")
+            new_contents[path], snippet = self._insert(
+                new_contents[path], edit["insert_line"], edit["new_str"]
+            )
+            init_line = max(1, edit["insert_line"] - SNIPPET_LINES + 1)
+        return path, self._make_output(snippet, f"a snippet of {path}", init_line)
+
     def undo_edit(self, path: Path):
         """Implement the undo_edit command."""
-        if not self._file_history[path]:
+        with self._groups_lock:
+            group = self._file_history.top_group(path)
+            if group is None or group not in self._undo_groups:
+                group = None
+        if group is not None:
+            return self._undo_group(group)
+
+        old_text = self._file_history.pop(path)
+        if old_text is None:
             raise ToolError(f"No edit history found for {path}.")
 
-        old_text = self._file_history[path].pop()
         self.write_file(path, old_text)
 
         return CLIResult(
             output=f"Last edit to {path} undone successfully. {self._make_output(old_text, str(path))}"
         )
 
+    def _undo_group(self, group: int):
+        """Revert the files of a batch whose last edit is still that batch."""
+        with self._groups_lock:
+            paths = [
+                path
+                for path in self._undo_groups.pop(group)
+                if self._file_history.top_group(path) == group
+            ]
+        old_contents = {}
+        for path in paths:
+            old_text = self._file_history.pop(path)
+            assert old_text is not None
+            old_contents[path] = old_text
+        self._write_files_atomically(old_contents)
+
+        return CLIResult(
+            output=f"Last edit, a batch of edits to {len(paths)} files, undone successfully. Reverted files:\n"
+            + "\n".join(str(path) for path in paths)
+        )
+
+    def _undo_paths(self, path: Path) -> list[Path]:
+        """The files that an undo_edit of `path` writes: those of its batch if its last edit was one."""
+        with self._groups_lock:
+            group = self._file_history.top_group(path)
+            return [path, *self._undo_groups.get(group, [])] if group else [path]
+
+    @asynccontextmanager
+    async def _lock_paths(self, paths: list[Path]):
+        """Hold the locks of the files, taken in a fixed order so that calls cannot deadlock."""
+        locks = []
+        for path in sorted(set(paths)):
+            lock = self._path_locks.get(path)
+            if lock is None:
+                lock = asyncio.Lock()
+                self._path_locks[path] = lock
+            locks.append(lock)
+        async with AsyncExitStack() as stack:
+            with tracing.span("edit.lock_wait", paths=len(locks)):
+                for lock in locks:
+                    await stack.enter_async_context(lock)
+            yield
+
+    def _write_files_atomically(self, contents: dict[Path, str]):
+        """
+        Write either all of the files or none of them: the contents are written to temporary
+        files next to the targets first, which are then renamed over the targets, keeping
+        their mode and owner. Symlinks are followed. Files with other hard links, or whose
+        owner cannot be kept, are overwritten in place instead. If writing a file fails,
+        the files already written are restored from backups.
+        """
+        # per file: the target, its temporary file, whether it is renamed over the
+        # target (or copied into it), and a backup of the original once it is written
+        targets: dict[Path, Path] = {}
+        temp_paths: dict[Path, str] = {}
+        renames: dict[Path, bool] = {}
+        backups: dict[Path, str] = {}
+        path = next(iter(contents), None)
+        try:
+            for path, content in contents.items():
+                target = targets[path] = Path(os.path.realpath(path))
+                fd, temp_paths[path] = tempfile.mkstemp(
+                    prefix=f".{target.name}.", suffix=".tmp", dir=target.parent
+                )
+                with os.fdopen(fd, "w") as f:
+                    f.write(content)
+                renames[path] = _copy_metadata(target, temp_paths[path])
+            for path, temp_path in temp_paths.items():
+                target = targets[path]
+                backup = temp_path + ".orig"
+                if renames[path]:
+                    os.link(target, backup)
+                else:
+                    shutil.copyfile(target, backup)
+                backups[path] = backup
+                if renames[path]:
+                    os.replace(temp_path, target)
+                else:
+                    shutil.copyfile(temp_path, target)
+        except Exception as e:
+            not_restored = []
+            # the file that failed may have been partly copied into
+            for written in reversed(backups):
+                try:
+                    if renames[written]:
+                        os.replace(backups[written], targets[written])
+                    else:
+                        shutil.copyfile(backups[written], targets[written])
+                except OSError:
+                    not_restored.append(str(written))
+            message = f"Ran into {e} while trying to write to {path}."
+            if not_restored:
+                message += f" These files were changed and could not be restored: {', '.join(not_restored)}"
+            else:
+                message += " None of the files were changed."
+            raise ToolError(message) from None
+        finally:
+            for leftover in [*temp_paths.values(), *backups.values()]:
+                try:
+                    os.remove(leftover)
+                except OSError:
+                    pass
+            for written in contents:
+                self._file_written(written)
+
     def read_file(self, path: Path):
-        """Read the content of a file from a given path; raise a ToolError if an error occurs."""
+        """
+        Read the content of a file from a given path; raise a ToolError if an error occurs.
+        Edits read the file this way rather than through the cache, so that they never
+        write back content the cache did not see change.
+        """
         try:
             return path.read_text()
         except Exception as e:
             raise ToolError(f"Ran into {e} while trying to read {path}") from None
 
+    def _read_cached(self, path: Path) -> CachedFile:
+        """Read a file through the file cache; raise a ToolError if an error occurs."""
+        try:
+            return self._file_cache.get(path, Path.read_text)
+        except Exception as e:
+            raise ToolError(f"Ran into {e} while trying to read {path}") from None
+
     def write_file(self, path: Path, file: str):
         """Write the content of a file to a given path; raise a ToolError if an error occurs."""
         try:
             path.write_text(file)
         except Exception as e:
             raise ToolError(f"Ran into {e} while trying to write to {path}") from None
+        finally:
+            self._file_written(path)
+
+    def cache_stats(self) -> dict[str, tuple[int, int]]:
+        """The hits and misses of the file cache and of the directory cache."""
+        return {
+            "file": (self._file_cache.hits, self._file_cache.misses),
+            "directory": (self._walker.hits, self._walker.misses),
+        }
+
+    async def files_changed(self, paths: set[str]):
+        """Drop the cached contents and symbols of files that changed on disk, e.g. through the bash tool."""
+        changed = [Path(path) for path in paths]
+        self._file_cache.invalidate_many(changed)
+        self._symbol_cache.invalidate_many(changed)
+
+    def _file_written(self, path: Path):
+        self._file_cache.invalidate(path)
+        self._symbol_cache.invalidate(path)
+        for listener in self.write_listeners:
+            listener(path)
 
     def _make_output(
         self,
@@ -326,19 +933,77 @@ class EditTool(BaseAnthropicTool):
         file_descriptor: str,
         init_line: int = 1,
         expand_tabs: bool = True,
+        truncate_after: int = MAX_RESPONSE_LEN,
     ):
         """Generate output for the CLI based on the content of a file."""
-        file_content = maybe_truncate(file_content)
-        if expand_tabs:
-            file_content = file_content.expandtabs()
-        file_content = "\n".join(
-            [
-                f"{i + init_line:6}\t{line}"
-                for i, line in enumerate(file_content.split("\n"))
-            ]
+        # the clipped content is kept in the output store as the agent would see it
+        file_content = maybe_truncate(
+            file_content,
+            truncate_after,
+            self.output_store,
+            full_content=_number_lines(file_content, init_line, expand_tabs)
+            if len(file_content) > truncate_after
+            else None,
         )
+        file_content = _number_lines(file_content, init_line, expand_tabs)
         return (
             f"Here's the result of running `cat -n` on {file_descriptor}:\n"
             + file_content
             + "\n"
         )
+
+
+def _check_batch_edit(edit: Any):
+    """Check the shape of an edit of a batch and the types of its fields."""
+    if not isinstance(edit, dict):
+        raise ToolError(
+            f"Each edit should be an object with `command` and `path`, got: {edit!r}"
+        )
+    command = edit.get("command")
+    if command not in get_args(BatchCommand):
+        raise ToolError(
+            f"Unrecognized command {command}. The allowed commands in a batch are: {', '.join(get_args(BatchCommand))}"
+        )
+    if not isinstance(edit.get("path"), str) or not edit["path"]:
+        raise ToolError(
+            f"Parameter `path` is required and should be a string for command: {command}"
+        )
+    for name in ("old_str", "new_str"):
+        if edit.get(name) is not None and not isinstance(edit[name], str):
+            raise ToolError(
+                f"Parameter `{name}` should be a string, got: {edit[name]!r}"
+            )
+    insert_line = edit.get("insert_line")
+    if insert_line is not None and (
+        not isinstance(insert_line, int) or isinstance(insert_line, bool)
+    ):
+        raise ToolError(
+            f"Parameter `insert_line` should be an integer, got: {insert_line!r}"
+        )
+
+
+def _copy_metadata(target: Path, temp_path: str) -> bool:
+    """
+    Give the temporary file the mode and owner of the target. Returns whether it can be
+    renamed over the target: False if the target has other hard links, or if its owner
+    cannot be kept.
+    """
+    stat = os.stat(target)
+    os.chmod(temp_path, stat.st_mode & 0o7777)
+    if stat.st_nlink > 1:
+        return False
+    if (stat.st_uid, stat.st_gid) != (os.getuid(), os.getgid()):
+        try:
+            os.chown(temp_path, stat.st_uid, stat.st_gid)
+        except PermissionError:
+            return False
+    return True
+
+
+def _number_lines(content: str, init_line: int, expand_tabs: bool) -> str:
+    """Prefix the lines of `content` with their numbers, like `cat -n`."""
+    if expand_tabs:
+        content = content.expandtabs()
+    return "\n".join(
+        f"{i + init_line:6}\t{line}" for i, line in enumerate(content.split("\n"))
+    )
@@ -0,0 +1,114 @@
+"""LRU cache of file contents with a line-offset index."""
+
+import os
+import sys
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import accumulate
+from pathlib import Path
+from typing import Callable, Iterable
+
+
+class CachedFile:
+    """The content of a file and the offsets at which its lines start."""
+
+    content: str
+    line_offsets: array
+
+    def __init__(self, content: str):
+        self.content = content
+        # offset of the start of each line; lines are separated by "\n", so a file
+        # with n newlines has n + 1 lines, as with `content.split("\n")`
+        self.line_offsets = array(
+            "q",
+            accumulate((len(line) + 1 for line in content.split("\n")), initial=0),
+        )
+        self.line_offsets.pop()
+
+    @property
+    def n_lines(self) -> int:
+        return len(self.line_offsets)
+
+    @property
+    def size(self) -> int:
+        """Approximate memory used by the entry, in bytes."""
+        return sys.getsizeof(self.content) + self.line_offsets.itemsize * self.n_lines
+
+    def lines(self, init_line: int, final_line: int) -> str:
+        """
+        Get the lines from `init_line` to `final_line` (inclusive, indexed at 1) without
+        splitting the whole content. `final_line` of -1 means the end of the file.
+        """
+        start = self.line_offsets[init_line - 1]
+        if final_line == -1 or final_line >= self.n_lines:
+            return self.content[start:]
+        # the end of a line is the start of the next one minus the newline
+        return self.content[start : self.line_offsets[final_line] - 1]
+
+
+class FileCache:
+    """
+    Caches file contents keyed by (path, inode, mtime_ns, ctime_ns, size), evicting the
+    least recently used entries when the total size exceeds `max_size` bytes. A file
+    that changed on disk gets a new key, unless it was rewritten in place with the same
+    size within one timestamp tick, so edits must not write back cached content. The
+    cache can be used from several threads; files are read outside of its lock.
+    """
+
+    max_size: int
+    hits: int
+    misses: int
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[
+            Path, tuple[tuple[int, int, int, int], CachedFile]
+        ] = OrderedDict()
+        self._total_size = 0
+        self._lock = threading.RLock()
+
+    def get(self, path: Path, read: Callable[[Path], str]) -> CachedFile:
+        """Get the cached content of `path`, reading it with `read` if it is missing or stale."""
+        stat = os.stat(path)
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.hits += 1
+                self._entries.move_to_end(path)
+                return entry[1]
+            self.misses += 1
+
+        cached = CachedFile(read(path))
+        with self._lock:
+            self.invalidate(path)
+            if cached.size <= self.max_size:
+                self._entries[path] = (key, cached)
+                self._total_size += cached.size
+                while self._total_size > self.max_size:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self._total_size -= evicted.size
+        return cached
+
+    def invalidate(self, path: Path):
+        """Drop the entry of `path`, if any."""
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._total_size -= entry[1].size
+
+    def invalidate_many(self, paths: Iterable[Path]):
+        """Drop the entries of `paths`; a directory drops the entries of the files below it."""
+        paths = set(paths)
+        with self._lock:
+            for path in list(self._entries):
+                if path in paths or not paths.isdisjoint(path.parents):
+                    self.invalidate(path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_size = 0
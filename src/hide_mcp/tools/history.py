@@ -0,0 +1,263 @@
+"""Memory-bounded edit history, stored as reverse deltas."""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+
+# size of the blocks compared at once when looking for the common prefix and suffix
+_BLOCK_SIZE: int = 4096
+
+
+def _common_prefix(a: str, b: str) -> int:
+    """Length of the common prefix of `a` and `b`, comparing whole blocks where possible."""
+    n = min(len(a), len(b))
+    i = 0
+    while i + _BLOCK_SIZE <= n and a[i : i + _BLOCK_SIZE] == b[i : i + _BLOCK_SIZE]:
+        i += _BLOCK_SIZE
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    """Length of the common suffix of `a` and `b`, up to `limit`."""
+    la, lb = len(a), len(b)
+    i = 0
+    while (
+        i + _BLOCK_SIZE <= limit
+        and a[la - i - _BLOCK_SIZE : la - i] == b[lb - i - _BLOCK_SIZE : lb - i]
+    ):
+        i += _BLOCK_SIZE
+    while i < limit and a[la - i - 1] == b[lb - i - 1]:
+        i += 1
+    return i
+
+
+def make_delta(new: str, old: str) -> tuple[int, int, str]:
+    """
+    Compute a delta that turns `new` back into `old`, such that
+    `old == new[:start] + text + new[end:]`. Edits are usually local, so trimming
+    the common prefix and suffix makes the delta about as small as the edit.
+    """
+    prefix = _common_prefix(new, old)
+    suffix = _common_suffix(new, old, min(len(new), len(old)) - prefix)
+    return prefix, len(new) - suffix, old[prefix : len(old) - suffix]
+
+
+def apply_delta(new: str, delta: tuple[int, int, str]) -> str:
+    start, end, text = delta
+    return new[:start] + text + new[end:]
+
+
+@dataclass
+class _Entry:
+    """
+    A previous content of a file. The newest entry of a file holds the full content,
+    older entries hold a delta against the next newer entry. The data is either in
+    memory or in a spill file, which holds the text of the content or delta; the range
+    of a spilled delta stays in memory. Entries recorded together share a group.
+    """
+
+    seq: int
+    size: int
+    full: bool
+    group: int | None = None
+    data: str | tuple[int, int, str] | None = None
+    spill_path: str | None = None
+    spill_range: tuple[int, int] | None = None
+
+
+class FileHistory:
+    """
+    Stacks of previous file contents, used to undo edits.
+    Entries are kept in memory up to `max_file_memory` bytes per file and `max_memory`
+    bytes in total; beyond that the oldest entries are moved to spill files if `spill` is
+    set, or else dropped. Once the spill files exceed `max_disk` bytes, the oldest entries
+    are dropped. The spill files are kept in a private temporary directory, removed on
+    `clear` and when the history is garbage collected or the interpreter exits. The
+    history can be used from several threads.
+    """
+
+    def __init__(
+        self,
+        max_file_memory: int,
+        max_memory: int,
+        max_disk: int,
+        spill: bool = False,
+    ):
+        self._max_file_memory = max_file_memory
+        self._max_memory = max_memory
+        self._max_disk = max_disk
+        self._spill_enabled = spill
+        self._spill_dir: str | None = None
+        self._remove_spill_dir: weakref.finalize | None = None
+        self._stacks: dict[Path, list[_Entry]] = {}
+        self._file_memory: dict[Path, int] = {}
+        self._memory = 0
+        self._disk = 0
+        self._seq = 0
+        self._lock = threading.RLock()
+
+    def __contains__(self, path: Path) -> bool:
+        with self._lock:
+            return bool(self._stacks.get(path))
+
+    def push(self, path: Path, content: str, group: int | None = None):
+        """Record `content` as the newest previous content of `path`, optionally as part of a group."""
+        with self._lock:
+            stack = self._stacks.setdefault(path, [])
+            if stack:
+                # the former newest entry becomes a delta against the new one
+                top = stack[-1]
+                delta = make_delta(content, self._load(path, top))
+                self._release(path, top)
+                top.full = False
+                self._store(path, top, delta, sys.getsizeof(delta[2]))
+
+            self._seq += 1
+            entry = _Entry(seq=self._seq, size=0, full=True, group=group)
+            stack.append(entry)
+            self._store(path, entry, content, sys.getsizeof(content))
+            self._enforce_budgets(path)
+
+    def top_group(self, path: Path) -> int | None:
+        """The group of the newest previous content of `path`, if any."""
+        with self._lock:
+            stack = self._stacks.get(path)
+            return stack[-1].group if stack else None
+
+    def pop(self, path: Path) -> str | None:
+        """Remove and return the newest previous content of `path`, or None if there is none."""
+        with self._lock:
+            stack = self._stacks.get(path)
+            if not stack:
+                return None
+            top = stack.pop()
+            content = self._load(path, top)
+            self._release(path, top)
+            if stack:
+                # the next entry becomes the newest one, with the full content
+                entry = stack[-1]
+                full = apply_delta(content, self._load(path, entry))
+                self._release(path, entry)
+                entry.full = True
+                self._store(path, entry, full, sys.getsizeof(full))
+            else:
+                del self._stacks[path]
+            return content
+
+    def clear(self):
+        with self._lock:
+            self._stacks.clear()
+            self._file_memory.clear()
+            self._memory = 0
+            self._disk = 0
+            if self._remove_spill_dir is not None:
+                self._remove_spill_dir()
+                self._remove_spill_dir = None
+                self._spill_dir = None
+
+    def _store(self, path: Path, entry: _Entry, data, size: int):
+        entry.data = data
+        entry.size = size
+        self._file_memory[path] = self._file_memory.get(path, 0) + size
+        self._memory += size
+
+    def _load(self, path: Path, entry: _Entry):
+        if entry.spill_path is None:
+            return entry.data
+        with open(
+            entry.spill_path, encoding="utf-8", errors="surrogatepass", newline=""
+        ) as f:
+            text = f.read()
+        if entry.spill_range is None:
+            return text
+        return (*entry.spill_range, text)
+
+    def _release(self, path: Path, entry: _Entry):
+        """Forget the data of an entry, from memory or disk."""
+        if entry.spill_path is None:
+            self._file_memory[path] -= entry.size
+            self._memory -= entry.size
+            if not self._file_memory[path]:
+                del self._file_memory[path]
+        else:
+            self._disk -= entry.size
+            try:
+                os.remove(entry.spill_path)
+            except OSError:
+                pass
+            entry.spill_path = None
+            entry.spill_range = None
+        entry.data = None
+
+    def _spill(self, path: Path, entry: _Entry):
+        """Move the data of an entry from memory to a spill file; drop it if spilling is off."""
+        data = entry.data
+        self._release(path, entry)
+        if not self._spill_enabled:
+            self._drop(path, entry)
+            return
+        if self._spill_dir is None:
+            # only readable by the owner, as it holds the contents of the edited files
+            self._spill_dir = tempfile.mkdtemp(prefix="hide-mcp-history-")
+            self._remove_spill_dir = weakref.finalize(
+                self, shutil.rmtree, self._spill_dir, ignore_errors=True
+            )
+        if isinstance(data, tuple):
+            start, end, text = data
+            entry.spill_range = (start, end)
+        else:
+            text = data
+        fd, entry.spill_path = tempfile.mkstemp(suffix=".hist", dir=self._spill_dir)
+        with os.fdopen(
+            fd, "w", encoding="utf-8", errors="surrogatepass", newline=""
+        ) as f:
+            f.write(text)
+        self._disk += entry.size
+
+    def _drop(self, path: Path, entry: _Entry):
+        """Drop the oldest entry of a file from the history."""
+        stack = self._stacks[path]
+        assert stack[0] is entry
+        if entry.spill_path is not None or entry.data is not None:
+            self._release(path, entry)
+        stack.pop(0)
+        if not stack:
+            del self._stacks[path]
+
+    def _enforce_budgets(self, path: Path):
+        # per file, spill the oldest in-memory entries, but keep the newest one
+        for entry in self._stacks[path][:-1]:
+            if self._file_memory.get(path, 0) <= self._max_file_memory:
+                break
+            if entry.spill_path is None:
+                self._spill(path, entry)
+
+        while self._memory > self._max_memory:
+            oldest = self._oldest(in_memory=True)
+            if oldest is None:
+                break
+            self._spill(*oldest)
+
+        while self._disk > self._max_disk:
+            oldest = self._oldest(in_memory=False)
+            if oldest is None:
+                break
+            self._drop(*oldest)
+
+    def _oldest(self, in_memory: bool) -> tuple[Path, _Entry] | None:
+        """Find the oldest entry that is in memory, or on disk."""
+        oldest = None
+        for path, stack in self._stacks.items():
+            for entry in stack:
+                if (entry.spill_path is None) == in_memory:
+                    if oldest is None or entry.seq < oldest[1].seq:
+                        oldest = (path, entry)
+                    break
+        return oldest
@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import tempfile
+import time
+import weakref
+from pathlib import Path
+from typing import Any, ClassVar, Literal, get_args
+
+from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
+from .run import MAX_RESPONSE_LEN
+
+Command = Literal[
+    "start_job",
+    "job_status",
+    "job_output",
+    "kill_job",
+]
+
+DESCRIPTION: str = """
+Run long-lived commands, like dev servers, watchers or long builds, as background jobs
+* `start_job` runs `job_command` in a new shell in the background and returns the job id. It does not share state with the `bash` tool.
+* `job_status` shows whether a job is running, its exit code and runtime. Without `job_id`, all jobs are listed.
+* `job_output` shows the output of a job (stdout and stderr combined) starting at byte `offset`. The result tells the offset to continue reading from.
+* `kill_job` stops a job and the processes it started.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    """A command running in the background, with its output written to a file."""
+
+    id: str
+    command: str
+    output_path: str
+    started_at: float
+    ended_at: float | None
+    _process: asyncio.subprocess.Process
+    _monitor: asyncio.Task
+
+    def __init__(self, id: str, command: str, output_path: str):
+        self.id = id
+        self.command = command
+        self.output_path = output_path
+        self.started_at = time.monotonic()
+        self.ended_at = None
+
+    async def start(self, cwd: str | None):
+        with open(self.output_path, "wb") as output:
+            # the process writes to the file directly, the server never buffers its output
+            self._process = await asyncio.create_subprocess_shell(
+                self.command,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=output,
+                stderr=asyncio.subprocess.STDOUT,
+                cwd=cwd or str(Path.home()),
+                start_new_session=True,
+            )
+        self._monitor = asyncio.create_task(self._wait())
+
+    async def _wait(self):
+        returncode = await self._process.wait()
+        self.ended_at = time.monotonic()
+        logger.debug(f"Job {self.id} exited with returncode {returncode}")
+
+    @property
+    def running(self) -> bool:
+        return self._process.returncode is None
+
+    @property
+    def output_size(self) -> int:
+        try:
+            return os.path.getsize(self.output_path)
+        except OSError:
+            return 0
+
+    def status(self) -> str:
+        """Describe the state of the job in a single line."""
+        runtime = (self.ended_at or time.monotonic()) - self.started_at
+        state = (
+            "running"
+            if self.running
+            else f"exited with code {self._process.returncode}"
+        )
+        return f"[{self.id}] {state} after {runtime:.1f}s, {self.output_size} bytes of output: {self.command}"
+
+    def read_output(self, offset: int, limit: int) -> tuple[str, int]:
+        """
+        Read up to `limit` bytes of output at `offset`. Returns the text and the offset
+        after it. The text stops before a UTF-8 character that does not fit in `limit`,
+        or that a running job has not finished writing, so that the next read starts with
+        the whole character.
+        """
+        with open(self.output_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(limit)
+        end = _complete_length(data)
+        if end or (self.running and len(data) < limit):
+            data = data[:end]
+        return data.decode(errors="replace"), offset + len(data)
+
+    async def kill(self, timeout: float):
+        """
+        Terminate the job's process group, and kill what is left of it after `timeout`
+        seconds. The group is killed even if the job's own process exited, as the
+        processes it started in the background may ignore the termination signal.
+        """
+        try:
+            os.killpg(self._process.pid, signal.SIGTERM)
+            await asyncio.wait_for(self._wait_group(), timeout)
+            return
+        except ProcessLookupError:
+            # nothing is left of the group
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            os.killpg(self._process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(asyncio.shield(self._monitor), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _wait_group(self):
+        """Wait until the job's process and all the other processes of its group exited."""
+        await asyncio.shield(self._monitor)
+        while True:
+            try:
+                os.killpg(self._process.pid, 0)
+            except ProcessLookupError:
+                return
+            except PermissionError:
+                # a process of the group changed its user, it is still there
+                pass
+            await asyncio.sleep(0.05)
+
+    def remove(self):
+        """Remove the output file of a finished job."""
+        try:
+            os.remove(self.output_path)
+        except OSError:
+            pass
+
+
+def _complete_length(data: bytes) -> int:
+    """The length of `data` without a UTF-8 character that is cut off at its end."""
+    # a character has up to 4 bytes: look for the first byte of the last one
+    for back in range(1, min(len(data), 3) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            # a continuation byte
+            continue
+        if byte >= 0xF0:
+            length = 4
+        elif byte >= 0xE0:
+            length = 3
+        elif byte >= 0xC0:
+            length = 2
+        else:
+            length = 1
+        return len(data) - back if length > back else len(data)
+    return len(data)
+
+
+class JobTool(BaseAnthropicTool):
+    """
+    A tool that allows the agent to run long-lived commands in the background,
+    read their output, check on them and stop them. The output files are kept in a
+    private temporary directory, removed when the tool is garbage collected or the
+    interpreter exits.
+    """
+
+    name: ClassVar[Literal["bash_jobs"]] = "bash_jobs"
+
+    _jobs: dict[str, _Job]
+    _next_id: int
+    _max_finished_jobs: int = 50
+    _kill_timeout: float = 5.0  # seconds
+
+    def __init__(self):
+        self._jobs = {}
+        self._next_id = 1
+        self._jobs_dir: str | None = None
+        super().__init__()
+
+    async def __call__(
+        self,
+        *,
+        command: Command,
+        job_command: str | None = None,
+        job_id: str | None = None,
+        cwd: str | None = None,
+        offset: int = 0,
+        **kwargs,
+    ):
+        if job_id is not None:
+            job_id = str(job_id)
+        if command == "start_job":
+            if not job_command:
+                raise ToolError(
+                    "Parameter `job_command` is required for command: start_job"
+                )
+            return await self.start_job(job_command, cwd)
+        elif command == "job_status":
+            if job_id is None:
+                return self.list_jobs()
+            return ToolResult(output=self._get_job(job_id).status())
+        elif command == "job_output":
+            if job_id is None:
+                raise ToolError(
+                    "Parameter `job_id` is required for command: job_output"
+                )
+            return self.job_output(self._get_job(job_id), offset)
+        elif command == "kill_job":
+            if job_id is None:
+                raise ToolError("Parameter `job_id` is required for command: kill_job")
+            job = self._get_job(job_id)
+            await job.kill(self._kill_timeout)
+            return ToolResult(output=job.status())
+        raise ToolError(
+            f"Unrecognized command {command}. The allowed commands for the {self.name} tool are: {', '.join(get_args(Command))}"
+        )
+
+    async def start_job(self, job_command: str, cwd: str | None):
+        """Implement the start_job command"""
+        if cwd is not None and not Path(cwd).is_dir():
+            raise ToolError(f"The path {cwd} is not a directory.")
+        self._remove_finished_jobs(keep=self._max_finished_jobs - 1)
+
+        if self._jobs_dir is None:
+            # only readable by the owner, as the output of the commands may be sensitive
+            self._jobs_dir = tempfile.mkdtemp(prefix="hide-mcp-jobs-")
+            weakref.finalize(self, shutil.rmtree, self._jobs_dir, ignore_errors=True)
+        job_id = str(self._next_id)
+        self._next_id += 1
+        fd, output_path = tempfile.mkstemp(
+            prefix=f"job-{job_id}-", suffix=".log", dir=self._jobs_dir
+        )
+        os.close(fd)
+
+        job = _Job(job_id, job_command, output_path)
+        try:
+            await job.start(cwd)
+        except Exception as e:
+            job.remove()
+            raise ToolError(f"Ran into {e} while trying to start the job") from None
+        self._jobs[job_id] = job
+        return ToolResult(output=f"Started job {job_id}: {job_command}")
+
+    def list_jobs(self):
+        """Implement the job_status command without a job id"""
+        if not self._jobs:
+            return ToolResult(output="No jobs.")
+        return ToolResult(output="\n".join(job.status() for job in self._jobs.values()))
+
+    def job_output(self, job: _Job, offset: int):
+        """Implement the job_output command"""
+        if (
+            not isinstance(offset, int)
+            or isinstance(offset, bool)
+            or offset < 0
+            or offset > job.output_size
+        ):
+            raise ToolError(
+                f"Invalid `offset` parameter: {offset}. It should be within the size of the output: {[0, job.output_size]}"
+            )
+        output, next_offset = job.read_output(offset, MAX_RESPONSE_LEN)
+        remaining = job.output_size - next_offset
+        system = f"job {job.id} is {'running' if job.running else 'finished'}, next offset: {next_offset}"
+        if remaining > 0:
+            system += f", {remaining} more bytes available"
+        return CLIResult(output=output, system=system)
+
+    def _get_job(self, job_id: str) -> _Job:
+        if job_id not in self._jobs:
+            raise ToolError(
+                f"No job found with id {job_id}. Use the `job_status` command to list the jobs."
+            )
+        return self._jobs[job_id]
+
+    def _remove_finished_jobs(self, keep: int):
+        """Forget the oldest finished jobs and remove their output, keeping the `keep` latest ones."""
+        finished = [job for job in self._jobs.values() if not job.running]
+        for job in finished[: max(0, len(finished) - keep)]:
+            del self._jobs[job.id]
+            job.remove()
+
+    def to_params(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": DESCRIPTION,
+            "inputSchema": {
+                "properties": {
+                    "command": {
+                        "description": "The commands to run. Allowed options are: `start_job`, `job_status`, `job_output`, `kill_job`.",
+                        "enum": list(get_args(Command)),
+                        "type": "string",
+                    },
+                    "job_command": {
+                        "description": "Required parameter of `start_job` command containing the shell command to run in the background.",
+                        "type": "string",
+                    },
+                    "cwd": {
+                        "description": "Optional parameter of `start_job` command with the absolute path of the directory to run the job in. Defaults to the home directory.",
+                        "type": "string",
+                    },
+                    "job_id": {
+                        "description": "Required parameter of `job_output` and `kill_job` commands. Optional parameter of `job_status` command.",
+                        "type": "string",
+                    },
+                    "offset": {
+                        "description": "Optional parameter of `job_output` command. The byte offset in the output to start reading from, e.g. the next offset returned by a previous `job_output`. Defaults to 0.",
+                        "type": "integer",
+                    },
+                },
+                "required": ["command"],
+                "type": "object",
+            },
+        }
@@ -0,0 +1,236 @@
+"""Store of full command outputs, read back in pages through `hide://outputs/{id}` resources."""
+
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from .base import ToolError
+
+# outputs are forgotten, and their files removed, after this long or beyond these budgets
+OUTPUT_TTL: float = 3600.0  # seconds
+MAX_OUTPUTS: int = 256
+MAX_OUTPUTS_SIZE: int = 1024 * 1024 * 1024  # bytes
+# most bytes returned by one read
+PAGE_SIZE: int = 64 * 1024  # bytes
+# the line index of an output records the offset of every this many lines
+LINE_INDEX_STEP: int = 1024
+_READ_SIZE: int = 1024 * 1024  # bytes
+
+
+@dataclass
+class _StoredOutput:
+    id: str
+    path: str
+    size: int
+    created_at: float
+    # offset of the line LINE_INDEX_STEP * i + 1 at index i, built on the first read by lines
+    line_index: array | None = field(default=None, repr=False)
+    n_lines: int | None = None
+
+
+def output_uri(output_id: str) -> str:
+    return f"hide://outputs/{output_id}"
+
+
+class OutputStore:
+    """
+    Keeps the files of full command outputs, so that the parts clipped from a tool result
+    can be read later, by byte or by line range, instead of running the command again.
+    The store owns the files: they are removed when the outputs expire after `ttl`
+    seconds, or when more than `max_outputs` outputs or `max_size` bytes are stored, the
+    oldest first. The newest output is kept until it expires, even if it is larger than
+    `max_size`, so that the URI just given for it can be read. New output files are
+    written to the private temporary `directory` of the store, removed when the store is
+    garbage collected or the interpreter exits. Outputs get random IDs, so that other
+    clients cannot guess them. The store can be used from several threads.
+    """
+
+    ttl: float
+    max_outputs: int
+    max_size: int
+
+    def __init__(
+        self,
+        ttl: float = OUTPUT_TTL,
+        max_outputs: int = MAX_OUTPUTS,
+        max_size: int = MAX_OUTPUTS_SIZE,
+    ):
+        self.ttl = ttl
+        self.max_outputs = max_outputs
+        self.max_size = max_size
+        self._outputs: OrderedDict[str, _StoredOutput] = OrderedDict()
+        self._ids: dict[str, str] = {}
+        self._size = 0
+        self._directory: str | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> str:
+        """The directory to write new output files to, created on first use."""
+        with self._lock:
+            if self._directory is None:
+                # mkdtemp makes the directory readable by the current user only
+                self._directory = tempfile.mkdtemp(prefix="hide-mcp-outputs-")
+                weakref.finalize(
+                    self, shutil.rmtree, self._directory, ignore_errors=True
+                )
+            return self._directory
+
+    def add(self, path: str) -> str:
+        """Take over the output file at `path`. Returns the ID of the output."""
+        with self._lock:
+            if path in self._ids:
+                return self._ids[path]
+            output = _StoredOutput(
+                id=secrets.token_hex(8),
+                path=path,
+                size=os.path.getsize(path),
+                created_at=time.monotonic(),
+            )
+            self._outputs[output.id] = output
+            self._ids[path] = output.id
+            self._size += output.size
+            self._evict()
+            return output.id
+
+    def add_text(self, text: str) -> str:
+        """Store `text` as an output. Returns the ID of the output."""
+        fd, path = tempfile.mkstemp(prefix="output-", suffix=".txt", dir=self.directory)
+        with os.fdopen(fd, "w", encoding="utf-8", errors="replace", newline="") as f:
+            f.write(text)
+        return self.add(path)
+
+    def list(self) -> list[tuple[str, int]]:
+        """The IDs and sizes of the stored outputs, oldest first."""
+        with self._lock:
+            self._evict()
+            return [(output.id, output.size) for output in self._outputs.values()]
+
+    def read(
+        self,
+        output_id: str,
+        byte_range: tuple[int, int | None] | None = None,
+        line_range: tuple[int, int | None] | None = None,
+    ) -> str:
+        """
+        Read a page of an output: the bytes `byte_range` (indexed at 0), or the lines
+        `line_range` (indexed at 1), both inclusive and open ended if the end is None.
+        Without a range, the first page is read. A page has at most `PAGE_SIZE` bytes.
+        """
+        output = self._get(output_id)
+        if line_range is not None:
+            start, end = self._line_offsets(output, *line_range)
+        else:
+            start, last = byte_range or (0, None)
+            if start < 0 or (last is not None and last < start):
+                raise ToolError(f"Invalid byte range: {start}-{last}")
+            end = output.size if last is None else min(last + 1, output.size)
+        if start >= output.size and output.size:
+            raise ToolError(
+                f"The range starts after the end of the output, which has {output.size} bytes."
+            )
+        with open(output.path, "rb") as f:
+            f.seek(start)
+            data = f.read(min(end - start, PAGE_SIZE))
+        return data.decode(errors="replace")
+
+    def _get(self, output_id: str) -> _StoredOutput:
+        with self._lock:
+            self._evict()
+            output = self._outputs.get(output_id)
+        if output is None:
+            raise ToolError(
+                f"No output found with id {output_id}. Outputs are kept for {self.ttl:.0f} seconds."
+            )
+        return output
+
+    def _line_offsets(
+        self, output: _StoredOutput, first: int, last: int | None
+    ) -> tuple[int, int]:
+        """The byte offsets where the line `first` starts and the line `last` ends."""
+        if output.line_index is None:
+            self._index_lines(output)
+        assert output.line_index is not None and output.n_lines is not None
+        if first < 1 or first > max(1, output.n_lines):
+            raise ToolError(
+                f"Invalid line range: the first line `{first}` should be within the lines of the output: {[1, output.n_lines]}"
+            )
+        if last is not None and last < first:
+            raise ToolError(
+                f"Invalid line range: the last line `{last}` should be larger or equal than the first `{first}`"
+            )
+        start = self._find_line(output, first)
+        if last is None or last >= output.n_lines:
+            return start, output.size
+        return start, self._find_line(output, last + 1)
+
+    def _find_line(self, output: _StoredOutput, line: int) -> int:
+        """The offset where a line starts, scanning forward from the closest indexed line."""
+        assert output.line_index is not None
+        step, skip = divmod(line - 1, LINE_INDEX_STEP)
+        offset = output.line_index[step]
+        with open(output.path, "rb") as f:
+            f.seek(offset)
+            while skip:
+                chunk = f.read(_READ_SIZE)
+                if not chunk:
+                    return output.size
+                index = -1
+                while skip:
+                    index = chunk.find(b"\n", index + 1)
+                    if index == -1:
+                        break
+                    skip -= 1
+                if not skip:
+                    return offset + index + 1
+                offset += len(chunk)
+        return offset
+
+    def _index_lines(self, output: _StoredOutput):
+        line_index = array("q", [0])
+        n_lines = 0
+        offset = 0
+        last_byte = b""
+        with open(output.path, "rb") as f:
+            while chunk := f.read(_READ_SIZE):
+                index = chunk.find(b"\n")
+                while index != -1:
+                    n_lines += 1
+                    if n_lines % LINE_INDEX_STEP == 0:
+                        line_index.append(offset + index + 1)
+                    index = chunk.find(b"\n", index + 1)
+                offset += len(chunk)
+                last_byte = chunk[-1:]
+        if offset and last_byte != b"\n":
+            # the last line has no newline
+            n_lines += 1
+        output.n_lines = n_lines
+        output.line_index = line_index
+
+    def _evict(self):
+        """Forget the expired outputs, and the oldest ones beyond the budgets but the newest."""
+        deadline = time.monotonic() - self.ttl
+        while self._outputs:
+            oldest = next(iter(self._outputs.values()))
+            if oldest.created_at >= deadline and (
+                len(self._outputs) == 1
+                or (
+                    len(self._outputs) <= self.max_outputs
+                    and self._size <= self.max_size
+                )
+            ):
+                break
+            del self._outputs[oldest.id]
+            del self._ids[oldest.path]
+            self._size -= oldest.size
+            try:
+                os.remove(oldest.path)
+            except OSError:
+                pass
@@ -2,16 +2,33 @@
 
 import asyncio
 
+from .outputs import OutputStore, output_uri
+
 TRUNCATED_MESSAGE: str = "<response clipped><NOTE>To save on context only part of this file has been shown to you. You should retry this tool after you have searched inside the file with `grep -n` in order to find the line numbers of what you are looking for.</NOTE>"
 MAX_RESPONSE_LEN: int = 16000
 
 
-def maybe_truncate(content: str, truncate_after: int | None = MAX_RESPONSE_LEN):
-    """Truncate content and append a notice if content exceeds the specified length."""
+def maybe_truncate(
+    content: str,
+    truncate_after: int | None = MAX_RESPONSE_LEN,
+    output_store: OutputStore | None = None,
+    full_content: str | None = None,
+):
+    """
+    Truncate content and append a notice if content exceeds the specified length. With
+    an `output_store`, the content, or `full_content` if given, e.g. with line numbers,
+    is kept in the store, and the notice gives the URI of the resource to read it from.
+    """
+    if not truncate_after or len(content) <= truncate_after:
+        return content
+    if output_store is None:
+        return content[:truncate_after] + TRUNCATED_MESSAGE
+    uri = output_uri(
+        output_store.add_text(content if full_content is None else full_content)
+    )
     return (
-        content
-        if not truncate_after or len(content) <= truncate_after
-        else content[:truncate_after] + TRUNCATED_MESSAGE
+        content[:truncate_after]
+        + f"<response clipped: {len(content) - truncate_after} of {len(content)} characters omitted, all of it can be read in pages as the resource {uri}, e.g. {uri}?lines=1-100 or {uri}?bytes=0-65535>"
     )
 
 
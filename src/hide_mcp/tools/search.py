@@ -0,0 +1,279 @@
+import asyncio
+import fnmatch
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, ClassVar, Literal
+
+from .. import tracing
+from .base import BaseAnthropicTool, CLIResult, ToolError
+from .search_index import MAX_INDEXED_FILES, TrigramIndex, is_binary, regex_literals
+from .walker import DirectoryWalker
+from .watcher import FileWatcher
+
+DESCRIPTION: str = """
+Search the contents of files for a literal string or a regular expression, like `grep -rn`
+* `path` is the absolute path of the directory to search in, or of a single file
+* Hidden files and files ignored by .gitignore are not searched
+* `regex` treats `query` as a Python regular expression; matches do not span lines
+* `include` restricts the search to files matching a glob, e.g. `*.py` or `src/**/*.ts`; globs without `/` are matched against file names
+* The results are lines in the format `path:line:text`, at most `max_results` of them (100 by default)
+* Directories are indexed on the first search and the index is kept up to date, so later searches are fast
+"""
+
+DEFAULT_MAX_RESULTS: int = 100
+# matched lines are shortened to this many characters
+MAX_LINE_LEN: int = 300
+
+logger = logging.getLogger(__name__)
+
+
+class SearchTool(BaseAnthropicTool):
+    """
+    A tool that allows the agent to search the contents of files, backed by a trigram
+    index per searched directory.
+    """
+
+    name: ClassVar[Literal["search"]] = "search"
+
+    _indexes: OrderedDict[str, TrigramIndex]
+    _walker: DirectoryWalker
+    _watcher: FileWatcher | None
+    _max_indexes: int = 4
+    _max_cached_dirs: int = 65536
+
+    def __init__(self, watcher: FileWatcher | None = None):
+        self._indexes = OrderedDict()
+        self._walker = DirectoryWalker(self._max_cached_dirs)
+        self._watcher = watcher
+        # searches run in worker threads, one at a time
+        self._lock = threading.Lock()
+        super().__init__()
+
+    async def __call__(
+        self,
+        *,
+        query: str | None = None,
+        path: str | None = None,
+        regex: bool = False,
+        include: str | None = None,
+        ignore_case: bool = False,
+        max_results: int = DEFAULT_MAX_RESULTS,
+        **kwargs,
+    ):
+        if not query:
+            raise ToolError("Parameter `query` is required and cannot be empty")
+        if not path:
+            raise ToolError("Parameter `path` is required")
+        _path = Path(path)
+        if not _path.is_absolute():
+            raise ToolError(
+                f"The path {path} is not an absolute path, it should start with `/`."
+            )
+        if not _path.exists():
+            raise ToolError(
+                f"The path {path} does not exist. Please provide a valid path."
+            )
+        if not isinstance(max_results, int) or max_results < 1:
+            raise ToolError(
+                f"Invalid `max_results` parameter: {max_results}. It should be a positive integer."
+            )
+
+        flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+        try:
+            pattern = re.compile(query if regex else re.escape(query), flags)
+        except re.error as e:
+            raise ToolError(f"Invalid regular expression `{query}`: {e}") from None
+        literals = regex_literals(query) if regex else [query]
+        if pattern.flags & re.IGNORECASE or (regex and "(?" in query):
+            # the index folds ASCII case only
+            literals = [literal for literal in literals if literal.isascii()]
+
+        return await asyncio.to_thread(
+            self._search,
+            str(_path),
+            pattern,
+            [literal.encode() for literal in literals],
+            include,
+            max_results,
+        )
+
+    def file_changed(self, path: Path):
+        """Let the indexes that cover `path` know that the file changed."""
+        path_str = str(path)
+        for root, index in list(self._indexes.items()):
+            if path_str == root or path_str.startswith(root.rstrip("/") + "/"):
+                index.mark_changed(path_str)
+
+    async def files_changed(self, paths: set[str]):
+        """Let the indexes that cover the paths know that they changed on disk."""
+        for path in paths:
+            self.file_changed(Path(path))
+
+    def _search(
+        self,
+        path: str,
+        pattern: re.Pattern,
+        literals: list[bytes],
+        include: str | None,
+        max_results: int,
+    ) -> CLIResult:
+        with self._lock:
+            started_at = time.monotonic()
+            index_truncated = False
+            if os.path.isdir(path):
+                with tracing.span("search.index", path=path):
+                    index = self._get_index(path)
+                    candidates = index.candidates(literals, prefix=path)
+                index_truncated = index.truncated
+                root = path
+            else:
+                candidates = [path]
+                root = os.path.dirname(path)
+            if include:
+                candidates = [
+                    candidate
+                    for candidate in candidates
+                    if _matches_glob(os.path.relpath(candidate, root), include)
+                ]
+
+            results: list[str] = []
+            n_files = 0
+            truncated = False
+            with tracing.span("search.scan", candidates=len(candidates)):
+                for candidate in candidates:
+                    matches = _search_file(
+                        candidate, pattern, max_results - len(results)
+                    )
+                    if matches:
+                        n_files += 1
+                    results.extend(f"{candidate}:{line}" for line in matches)
+                    if len(results) >= max_results:
+                        truncated = True
+                        break
+            logger.debug(
+                f"Searched {len(candidates)} candidate files in {path} in {time.monotonic() - started_at:.3f}s"
+            )
+
+        index_notice = (
+            f"<index truncated at {MAX_INDEXED_FILES} files, narrow `path` to search the rest>\n"
+            if index_truncated
+            else ""
+        )
+        if not results:
+            output = f"No matches found in {path}."
+            if index_notice:
+                output += "\n" + index_notice
+            return CLIResult(output=output)
+        output = f"Found {len(results)} matches in {n_files} files:\n"
+        output += "\n".join(results) + "\n"
+        if truncated:
+            output += f"<results clipped at {max_results} matches, narrow down the query, `path` or `include` to see the rest>\n"
+        output += index_notice
+        return CLIResult(output=output)
+
+    def _get_index(self, path: str) -> TrigramIndex:
+        """The up to date index of the directory, reusing the index of a parent directory if there is one."""
+        for root, index in self._indexes.items():
+            if path == root or path.startswith(root.rstrip("/") + "/"):
+                break
+        else:
+            # an index of a parent directory makes the indexes below it redundant
+            index = TrigramIndex(path, self._walker)
+            if self._watcher is not None and self._watcher.watch(path):
+                # the watcher reports the changes, no need to sweep for them
+                index.refresh_interval = math.inf
+            for root in list(self._indexes):
+                if root.startswith(path.rstrip("/") + "/"):
+                    self._remove_index(root)
+            self._indexes[path] = index
+            while len(self._indexes) > self._max_indexes:
+                self._remove_index(next(iter(self._indexes)))
+        self._indexes.move_to_end(index.root)
+        index.update()
+        return index
+
+    def _remove_index(self, root: str):
+        del self._indexes[root]
+        if self._watcher is not None:
+            self._watcher.unwatch(root)
+
+    def to_params(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": DESCRIPTION,
+            "inputSchema": {
+                "properties": {
+                    "query": {
+                        "description": "The string to search for, or a regular expression if `regex` is true.",
+                        "type": "string",
+                    },
+                    "path": {
+                        "description": "Absolute path of the directory or file to search in, e.g. `/repo` or `/repo/file.py`.",
+                        "type": "string",
+                    },
+                    "regex": {
+                        "description": "Optional. Whether `query` is a regular expression. Defaults to false.",
+                        "type": "boolean",
+                    },
+                    "include": {
+                        "description": "Optional glob of the files to search, relative to `path`, e.g. `*.py` or `src/**/*.ts`.",
+                        "type": "string",
+                    },
+                    "ignore_case": {
+                        "description": "Optional. Whether to ignore case when matching. Defaults to false.",
+                        "type": "boolean",
+                    },
+                    "max_results": {
+                        "description": f"Optional. The maximum number of matching lines to return. Defaults to {DEFAULT_MAX_RESULTS}.",
+                        "type": "integer",
+                    },
+                },
+                "required": ["query", "path"],
+                "type": "object",
+            },
+        }
+
+
+def _matches_glob(relative_path: str, glob: str) -> bool:
+    if "/" not in glob:
+        return fnmatch.fnmatch(os.path.basename(relative_path), glob)
+    if glob.startswith("**/") and fnmatch.fnmatch(relative_path, glob[3:]):
+        return True
+    return fnmatch.fnmatch(relative_path, glob.lstrip("/"))
+
+
+def _search_file(path: str, pattern: re.Pattern, limit: int) -> list[str]:
+    """Find the lines of the file that match `pattern`, as `line:text`, up to `limit` of them."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return []
+    if is_binary(data):
+        return []
+    content = data.decode(errors="replace")
+
+    results = []
+    line_no, line_start = 1, 0
+    last_line = 0
+    for match in pattern.finditer(content):
+        start = match.start()
+        line_no += content.count("\n", line_start, start)
+        line_start = content.rfind("\n", 0, start) + 1
+        if line_no == last_line:
+            continue
+        last_line = line_no
+        line_end = content.find("\n", start)
+        line = content[line_start : line_end if line_end != -1 else len(content)]
+        if len(line) > MAX_LINE_LEN:
+            line = line[:MAX_LINE_LEN] + "..."
+        results.append(f"{line_no}:{line}")
+        if len(results) >= limit:
+            break
+    return results
@@ -0,0 +1,356 @@
+"""Trigram index of the files in a directory tree, used to narrow down searches."""
+
+import os
+import threading
+import time
+from array import array
+from dataclasses import dataclass
+
+from .walker import DirectoryWalker
+
+# larger files are not indexed but searched every time
+MAX_INDEXED_FILE_SIZE: int = 1024 * 1024  # bytes
+MAX_INDEXED_FILES: int = 500_000
+# a file with a NUL byte in its first bytes is considered binary and skipped
+BINARY_CHECK_SIZE: int = 8192  # bytes
+
+
+def trigrams(data: bytes) -> set[bytes]:
+    """The distinct trigrams of `data`, lowercased (ASCII only) so that the index serves case-insensitive queries too."""
+    data = data.lower()
+    return {data[i : i + 3] for i in range(len(data) - 2)}
+
+
+def is_binary(data: bytes) -> bool:
+    return b"\0" in data[:BINARY_CHECK_SIZE]
+
+
+def regex_literals(pattern: str) -> list[str]:
+    """
+    Literal strings that every match of the regex `pattern` contains, found by a
+    conservative scan of the pattern. Constructs that make this hard to tell, like
+    alternations and negative lookarounds, yield no literals at all.
+    """
+    literals: list[str] = []
+    run: list[str] = []
+    # index into `literals` where each open group started
+    groups: list[int] = []
+
+    def end_run():
+        if run:
+            literals.append("".join(run))
+            run.clear()
+
+    def quantifier_at(i: int) -> bool:
+        return i < len(pattern) and pattern[i] in "*?{"
+
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "|":
+            return []
+        elif c == "\\":
+            if i + 1 < n and not pattern[i + 1].isalnum():
+                # escaped punctuation is a literal character
+                run.append(pattern[i + 1])
+                i += 2
+            else:
+                # classes like \d and \w, anchors, backreferences, and escapes of
+                # characters by code or name, which are skipped whole
+                end_run()
+                i += _escape_length(pattern, i)
+        elif c == "[":
+            end_run()
+            j = i + 1
+            if j < n and pattern[j] == "^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 2 if pattern[j] == "\\" else 1
+            i = j + 1
+        elif c in "*?{":
+            # the quantified character is optional
+            if run:
+                run.pop()
+            end_run()
+            if c == "{":
+                close = pattern.find("}", i)
+                i = n if close == -1 else close + 1
+            else:
+                i += 1
+            if i < n and pattern[i] in "?+":
+                i += 1
+        elif c == "+":
+            end_run()
+            i += 1
+            if i < n and pattern[i] in "?+":
+                i += 1
+        elif c == "(":
+            end_run()
+            i += 1
+            if pattern.startswith("?#", i):
+                # a comment, up to the next parenthesis
+                close = pattern.find(")", i)
+                i = n if close == -1 else close + 1
+                continue
+            if pattern.startswith("?", i):
+                if pattern.startswith(("?!", "?<!", "?(", "?P="), i):
+                    return []
+                if pattern.startswith("?P<", i):
+                    i = pattern.find(">", i) + 1
+                elif pattern[i + 1 : i + 2] in set("aiLmsux-"):
+                    # inline flags, either global like `(?i)` or scoped like `(?i:...)`
+                    j = i + 1
+                    while j < n and pattern[j] not in ":)":
+                        j += 1
+                    if "x" in pattern[i + 1 : j]:
+                        # verbose patterns would need whitespace and comments handled
+                        return []
+                    i = j + 1
+                    if pattern[j : j + 1] == ")":
+                        continue
+                else:
+                    # (?: (?= (?<= and (?>
+                    i += 3 if pattern.startswith("?<=", i) else 2
+            groups.append(len(literals))
+        elif c == ")":
+            end_run()
+            start = groups.pop() if groups else 0
+            i += 1
+            if quantifier_at(i):
+                # the whole group is optional
+                del literals[start:]
+        elif c in ".^$":
+            end_run()
+            i += 1
+        else:
+            run.append(c)
+            i += 1
+    end_run()
+    return literals
+
+
+def _escape_length(pattern: str, i: int) -> int:
+    """The length of the escape sequence starting with the backslash at `i`."""
+    kind = pattern[i + 1 : i + 2]
+    if kind == "x":
+        return 4
+    if kind == "u":
+        return 6
+    if kind == "U":
+        return 10
+    if kind == "N":
+        close = pattern.find("}", i)
+        return len(pattern) - i if close == -1 else close + 1 - i
+    if kind.isdigit():
+        # octal escapes have up to 3 digits, backreferences up to 2
+        j = i + 1
+        while j < len(pattern) and j < i + 4 and pattern[j].isdigit():
+            j += 1
+        return j - i
+    return 2
+
+
+@dataclass
+class _IndexedFile:
+    id: int
+    # (inode, mtime_ns, ctime_ns, size) of the file when it was indexed
+    key: tuple[int, int, int, int]
+
+
+class TrigramIndex:
+    """
+    An index from trigrams to the files under `root` that contain them. The files are
+    listed with a `DirectoryWalker`, so hidden and ignored files are not indexed.
+
+    Postings are append-only arrays of file ids. A changed file gets a new id and its old
+    id is retired, and the arrays are compacted once most of their ids are retired.
+    The index notices changed files through `mark_changed`, which forces them to be
+    reindexed, and through a sweep over the stats of all files that runs at most every
+    `refresh_interval` seconds. At most
+    `MAX_INDEXED_FILES` files are listed; `truncated` tells whether the rest were left out.
+    """
+
+    root: str
+    refresh_interval: float
+    truncated: bool
+
+    def __init__(
+        self, root: str, walker: DirectoryWalker, refresh_interval: float = 5.0
+    ):
+        self.root = root
+        self.refresh_interval = refresh_interval
+        self.truncated = False
+        self._walker = walker
+        self._files: dict[str, _IndexedFile] = {}
+        # id -> path of the files whose postings are current
+        self._paths: dict[int, str] = {}
+        # files too large to index, they are candidates of every search
+        self._unindexed: set[int] = set()
+        self._postings: dict[bytes, array] = {}
+        self._n_postings = 0
+        self._n_live_postings = 0
+        self._posting_counts: dict[int, int] = {}
+        self._next_id = 0
+        self._refreshed_at: float | None = None
+        self._changed: set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def n_files(self) -> int:
+        return len(self._files)
+
+    def mark_changed(self, path: str):
+        """
+        Note that the file at `path` changed, it is reindexed before the next search.
+        If `path` is a directory, everything below it is.
+        """
+        with self._lock:
+            self._changed.add(path)
+
+    def update(self):
+        """Bring the index up to date with the files on disk."""
+        now = time.monotonic()
+        if (
+            self._refreshed_at is None
+            or now - self._refreshed_at >= self.refresh_interval
+        ):
+            # the sweep stats every file, and reindexes the changed ones
+            with self._lock:
+                changed, self._changed = self._changed, set()
+            self._refresh(changed=changed)
+            self._refreshed_at = now
+            return
+
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        for path in changed:
+            if path in self._files or os.path.isfile(path):
+                # a write within one timestamp tick that keeps the size looks unchanged
+                self._update_file(path, force=True)
+            else:
+                # a directory, or something that is gone
+                self._refresh(path)
+
+    def candidates(self, literals: list[bytes], prefix: str | None = None) -> list[str]:
+        """
+        The paths of the files that may contain all of `literals`, optionally only
+        those under `prefix`. Literals shorter than a trigram do not narrow the search.
+        """
+        required = set()
+        for literal in literals:
+            required |= trigrams(literal)
+
+        if required and any(trigram not in self._postings for trigram in required):
+            ids = set(self._unindexed)
+        elif required:
+            postings = sorted(
+                (self._postings[trigram] for trigram in required), key=len
+            )
+            ids = set(postings[0])
+            for posting in postings[1:]:
+                if not ids:
+                    break
+                ids.intersection_update(posting)
+            ids |= self._unindexed
+        else:
+            ids = set(self._paths)
+
+        paths = sorted(self._paths[id] for id in ids if id in self._paths)
+        if prefix is not None:
+            paths = [
+                path
+                for path in paths
+                if path == prefix or path.startswith(prefix.rstrip("/") + "/")
+            ]
+        return paths
+
+    def _refresh(self, root: str | None = None, changed: set[str] | None = None):
+        """Sync the files below `root`, or all files, with the disk; reindex the `changed` files."""
+        root = root or self.root
+        try:
+            entries, truncated = self._walker.walk(
+                root, max_depth=1 << 16, max_entries=MAX_INDEXED_FILES
+            )
+        except OSError:
+            entries, truncated = [], False
+        if root == self.root:
+            self.truncated = truncated
+        elif truncated:
+            # a subdirectory alone has too many files, so the whole tree has too
+            self.truncated = True
+        seen = set()
+        for entry in entries:
+            if entry.is_dir:
+                continue
+            seen.add(entry.path)
+            self._update_file(
+                entry.path, force=changed is not None and entry.path in changed
+            )
+        prefix = root.rstrip("/") + "/"
+        for path in list(self._files):
+            if path not in seen and (path == root or path.startswith(prefix)):
+                self._remove(path)
+
+    def _update_file(self, path: str, force: bool = False):
+        """(Re)index a file if it changed since it was indexed or `force`, or drop it if it is gone."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._remove(path)
+            return
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_size)
+        indexed = self._files.get(path)
+        if not force and indexed is not None and indexed.key == key:
+            return
+        self._remove(path)
+        if not os.path.isfile(path):
+            return
+
+        id = self._next_id
+        self._next_id += 1
+        self._files[path] = _IndexedFile(id, key)
+        if stat.st_size > MAX_INDEXED_FILE_SIZE:
+            self._paths[id] = path
+            self._unindexed.add(id)
+            return
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if is_binary(data):
+            return
+
+        self._paths[id] = path
+        file_trigrams = trigrams(data)
+        for trigram in file_trigrams:
+            posting = self._postings.get(trigram)
+            if posting is None:
+                posting = self._postings[trigram] = array("i")
+            posting.append(id)
+        self._posting_counts[id] = len(file_trigrams)
+        self._n_postings += len(file_trigrams)
+        self._n_live_postings += len(file_trigrams)
+
+    def _remove(self, path: str):
+        indexed = self._files.pop(path, None)
+        if indexed is None:
+            return
+        self._paths.pop(indexed.id, None)
+        self._unindexed.discard(indexed.id)
+        self._n_live_postings -= self._posting_counts.pop(indexed.id, 0)
+        if self._n_postings > 2 * self._n_live_postings + 1_000_000:
+            self._compact()
+
+    def _compact(self):
+        """Drop the retired ids from the postings."""
+        live = self._paths
+        for trigram, posting in list(self._postings.items()):
+            kept = array("i", (id for id in posting if id in live))
+            if kept:
+                self._postings[trigram] = kept
+            else:
+                del self._postings[trigram]
+        self._n_postings = self._n_live_postings
@@ -0,0 +1,101 @@
+"""Symbol tables of Python files, parsed with `ast` and cached by mtime."""
+
+import ast
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable
+
+
+@dataclass
+class Symbol:
+    """A class or function, with the lines it spans (indexed at 1, including decorators)."""
+
+    name: str
+    kind: str
+    start_line: int
+    end_line: int
+    depth: int
+
+
+def parse_symbols(source: str) -> list[Symbol]:
+    """List the classes and functions of a module, nested ones included, in source order."""
+    symbols: list[Symbol] = []
+
+    def visit(node: ast.AST, prefix: str, depth: int):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                kind = "class"
+            elif isinstance(child, ast.FunctionDef):
+                kind = "def"
+            elif isinstance(child, ast.AsyncFunctionDef):
+                kind = "async def"
+            else:
+                # classes and functions under if, try, with and the like
+                if isinstance(child, ast.stmt):
+                    visit(child, prefix, depth)
+                continue
+            name = prefix + child.name
+            start_line = min(
+                [child.lineno]
+                + [decorator.lineno for decorator in child.decorator_list]
+            )
+            symbols.append(
+                Symbol(name, kind, start_line, child.end_lineno or child.lineno, depth)
+            )
+            visit(child, name + ".", depth + 1)
+
+    visit(ast.parse(source), "", 0)
+    return symbols
+
+
+class SymbolCache:
+    """
+    Caches the symbol tables of files keyed by (path, inode, mtime_ns, ctime_ns, size),
+    keeping those of the `max_files` most recently used files. The cache can be used
+    from several threads; files are parsed outside of its lock.
+    """
+
+    max_files: int
+
+    def __init__(self, max_files: int):
+        self.max_files = max_files
+        self._entries: OrderedDict[
+            Path, tuple[tuple[int, int, int, int], list[Symbol]]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path, read: Callable[[Path], str]) -> list[Symbol]:
+        """
+        Get the symbols of `path`, parsing the content returned by `read` if they are
+        missing or stale. Raises SyntaxError if the file cannot be parsed.
+        """
+        stat = os.stat(path)
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_ctime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == key:
+                self._entries.move_to_end(path)
+                return entry[1]
+
+        symbols = parse_symbols(read(path))
+        with self._lock:
+            self._entries[path] = (key, symbols)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_files:
+                self._entries.popitem(last=False)
+        return symbols
+
+    def invalidate(self, path: Path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def invalidate_many(self, paths: Iterable[Path]):
+        """Drop the entries of `paths`; a directory drops the entries of the files below it."""
+        paths = set(paths)
+        with self._lock:
+            for path in list(self._entries):
+                if path in paths or not paths.isdisjoint(path.parents):
+                    del self._entries[path]
@@ -0,0 +1,261 @@
+"""In-process directory walker that honors .gitignore files and caches listings."""
+
+import os
+import re
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+IGNORE_FILE: str = ".gitignore"
+
+
+@dataclass
+class _Rule:
+    """A compiled line of an ignore file."""
+
+    regex: re.Pattern
+    negate: bool
+    dir_only: bool
+    # anchored patterns match the path relative to the ignore file, the others only the name
+    anchored: bool
+
+
+def _translate(pattern: str) -> str:
+    """Translate a gitignore glob into a regex, where `*` and `?` do not match `/`."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+        elif (
+            pattern.startswith("**", i)
+            and i + 2 == n
+            and (i == 0 or pattern[i - 1] == "/")
+        ):
+            out.append(".*")
+            i += 2
+        elif c == "*":
+            out.append("[^/]*")
+            i += 1
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+                i += 1
+                continue
+            body = pattern[i + 1 : end].replace("\\", "\\\\")
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            out.append("[" + body + "]")
+            i = end + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "".join(out)
+
+
+def parse_ignore_file(text: str) -> list[_Rule]:
+    """Compile the lines of a .gitignore file into rules."""
+    rules = []
+    for line in text.splitlines():
+        line = line.rstrip(" ")
+        if not line or line.startswith("#"):
+            continue
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            continue
+        anchored = "/" in line
+        line = line.lstrip("/")
+        rules.append(
+            _Rule(
+                regex=re.compile(_translate(line) + r"\Z", re.DOTALL),
+                negate=negate,
+                dir_only=dir_only,
+                anchored=anchored,
+            )
+        )
+    return rules
+
+
+def _is_ignored(
+    ignore_files: list[tuple[str, list[_Rule]]], path: str, is_dir: bool
+) -> bool:
+    """
+    Check `path` against the rules of the ignore files that apply to it, outermost
+    first. As in git, the last matching rule wins.
+    """
+    ignored = False
+    name = os.path.basename(path)
+    for base, rules in ignore_files:
+        relative = path[len(base) + 1 :] if base != "/" else path[1:]
+        for rule in rules:
+            if rule.dir_only and not is_dir:
+                continue
+            if rule.regex.match(relative if rule.anchored else name):
+                ignored = not rule.negate
+    return ignored
+
+
+@dataclass
+class WalkEntry:
+    path: str
+    is_dir: bool
+    size: int | None = None
+
+
+class DirectoryWalker:
+    """
+    Lists directory trees with `os.scandir`, skipping hidden items and items ignored by
+    .gitignore files, including those of the parent directories up to the root of the
+    git repository. The listings and the parsed ignore files are cached by mtime, up to
+    `max_cached_dirs` directories, so repeated views of a tree only stat its directories.
+    """
+
+    max_cached_dirs: int
+    hits: int
+    misses: int
+
+    def __init__(self, max_cached_dirs: int):
+        self.max_cached_dirs = max_cached_dirs
+        self.hits = 0
+        self.misses = 0
+        # directory -> (mtime_ns, [(name, is_dir)])
+        self._listings: OrderedDict[str, tuple[int, list[tuple[str, bool]]]] = (
+            OrderedDict()
+        )
+        # ignore file -> ((mtime_ns, size), rules)
+        self._ignore_rules: dict[str, tuple[tuple[int, int], list[_Rule]]] = {}
+
+    def walk(
+        self, root: str, max_depth: int, max_entries: int, sizes: bool = False
+    ) -> tuple[list[WalkEntry], bool]:
+        """
+        List `root` and the items up to `max_depth` levels below it, breadth first so
+        that the shallow levels are complete when the listing is cut at `max_entries`.
+        Returns the entries in tree order and whether the listing was cut.
+        """
+        root = os.path.abspath(root)
+        entries = [WalkEntry(root, True)]
+        truncated = False
+        queue = deque([(root, 0, self._parent_ignore_files(root))])
+        while queue and not truncated:
+            directory, depth, ignore_files = queue.popleft()
+            if depth >= max_depth:
+                continue
+            try:
+                listing = self._list(directory)
+            except OSError:
+                if directory == root:
+                    raise
+                continue
+            if any(name == IGNORE_FILE and not is_dir for name, is_dir in listing):
+                rules = self._rules(os.path.join(directory, IGNORE_FILE))
+                if rules:
+                    ignore_files = ignore_files + [(directory, rules)]
+
+            for name, is_dir in listing:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(directory, name)
+                if _is_ignored(ignore_files, path, is_dir):
+                    continue
+                if len(entries) >= max_entries:
+                    truncated = True
+                    break
+                entries.append(WalkEntry(path, is_dir))
+                if is_dir:
+                    queue.append((path, depth + 1, ignore_files))
+
+        if sizes:
+            for entry in entries:
+                if not entry.is_dir:
+                    try:
+                        entry.size = os.stat(entry.path, follow_symlinks=False).st_size
+                    except OSError:
+                        pass
+        entries.sort(key=lambda entry: entry.path.split(os.sep))
+        return entries, truncated
+
+    def is_ignored(self, path: str, is_dir: bool) -> bool:
+        """Whether `path` is ignored by the .gitignore files of the directories above it."""
+        path = os.path.abspath(path)
+        directory = os.path.dirname(path)
+        ignore_files = self._parent_ignore_files(directory)
+        rules = self._rules(os.path.join(directory, IGNORE_FILE))
+        if rules:
+            ignore_files.append((directory, rules))
+        return _is_ignored(ignore_files, path, is_dir)
+
+    def _list(self, directory: str) -> list[tuple[str, bool]]:
+        """The names in `directory` and whether they are directories, from the cache if it is current."""
+        mtime = os.stat(directory).st_mtime_ns
+        cached = self._listings.get(directory)
+        if cached is not None and cached[0] == mtime:
+            self.hits += 1
+            self._listings.move_to_end(directory)
+            return cached[1]
+
+        self.misses += 1
+        with os.scandir(directory) as it:
+            # symlinks to directories are listed but not followed, as with `find`
+            listing = sorted(
+                (entry.name, entry.is_dir(follow_symlinks=False)) for entry in it
+            )
+        self._listings[directory] = (mtime, listing)
+        self._listings.move_to_end(directory)
+        while len(self._listings) > self.max_cached_dirs:
+            self._listings.popitem(last=False)
+        return listing
+
+    def _rules(self, ignore_file: str) -> list[_Rule]:
+        """The parsed rules of an ignore file, from the cache if it is current."""
+        try:
+            stat = os.stat(ignore_file)
+        except OSError:
+            return []
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._ignore_rules.get(ignore_file)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        try:
+            with open(ignore_file, errors="replace") as f:
+                rules = parse_ignore_file(f.read())
+        except OSError:
+            rules = []
+        if len(self._ignore_rules) >= self.max_cached_dirs:
+            self._ignore_rules.clear()
+        self._ignore_rules[ignore_file] = (key, rules)
+        return rules
+
+    def _parent_ignore_files(self, root: str) -> list[tuple[str, list[_Rule]]]:
+        """The ignore files of the directories above `root`, up to the root of its git repository."""
+        parents = []
+        directory = root
+        while True:
+            if os.path.exists(os.path.join(directory, ".git")):
+                break
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                # not in a git repository, the ignore files above root do not apply
+                return []
+            directory = parent
+            parents.append(directory)
+        ignore_files = []
+        for directory in reversed(parents):
+            rules = self._rules(os.path.join(directory, IGNORE_FILE))
+            if rules:
+                ignore_files.append((directory, rules))
+        return ignore_files
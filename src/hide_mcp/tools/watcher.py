@@ -0,0 +1,444 @@
+"""Watches directory trees for file changes, with inotify or by polling."""
+
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Awaitable, Callable
+
+from .walker import DirectoryWalker
+
+# called with the paths that changed; a directory means anything below it may have changed
+ChangeListener = Callable[[set[str]], Awaitable[None]]
+
+logger = logging.getLogger(__name__)
+
+# inotify constants, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+_WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """A thin wrapper of the inotify API of libc."""
+
+    fd: int
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: str) -> int:
+        wd = self._add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd: int):
+        self._rm_watch(self.fd, wd)
+
+    def read_events(self) -> list[tuple[int, int, str]]:
+        """Read the pending events as (watch descriptor, mask, name) tuples."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileWatcher:
+    """
+    Reports changes of the files under the watched directories to the listeners.
+
+    On Linux every directory of a watched tree gets an inotify watch; hidden and ignored
+    directories are skipped, like in the other views of the tree. The directories of new
+    subtrees are walked and watched in a worker thread. Without inotify, or when its watch
+    limit is reached, trees are polled every `poll_interval` seconds instead. Directories
+    can also be watched without their subdirectories, and single files with
+    `watch_file`, which reports them even if they are hidden. Watches are counted: a
+    directory is watched until it was unwatched as many times as it was watched.
+
+    Events are coalesced: they are collected until none arrived for `coalesce_delay`
+    seconds and then reported as one set of paths. When more than `max_batch` paths
+    changed at once, e.g. on a `git checkout`, the watched directories they are in are
+    reported instead of the single paths.
+    """
+
+    coalesce_delay: float
+    poll_interval: float
+    max_batch: int
+
+    def __init__(
+        self,
+        coalesce_delay: float = 0.1,
+        poll_interval: float = 2.0,
+        max_batch: int = 10000,
+    ):
+        self.coalesce_delay = coalesce_delay
+        self.poll_interval = poll_interval
+        self.max_batch = max_batch
+        self._listeners: list[ChangeListener] = []
+        self._walker = DirectoryWalker(max_cached_dirs=65536)
+        self._walker_lock = threading.Lock()
+        self._inotify: _Inotify | None = None
+        # watched (root, recursive) trees, with whether they are watched by inotify or
+        # polled, and how many times they were watched
+        self._roots: dict[tuple[str, bool], bool] = {}
+        self._refs: dict[tuple[str, bool], int] = {}
+        # files watched on their own, with how many times they were watched
+        self._files: dict[str, int] = {}
+        self._watches: dict[int, str] = {}
+        self._watched_dirs: dict[str, int] = {}
+        # polled trees -> {path: (mtime_ns, size)}
+        self._snapshots: dict[tuple[str, bool], dict[str, tuple[int, int]]] = {}
+        self._pending: set[str] = set()
+        self._changed = asyncio.Event()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._tasks: set[asyncio.Task] = set()
+        # trees may be watched from worker threads while the loop reads events
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener: ChangeListener):
+        self._listeners.append(listener)
+
+    def watches(self, path: str, recursive: bool = True) -> bool:
+        """Whether changes of the directory `path`, and of its subdirectories if `recursive`, are reported."""
+        with self._lock:
+            return self._covered(path, recursive)
+
+    def watch(self, root: str, recursive: bool = True) -> bool:
+        """
+        Start reporting the changes in the directory `root`, and in its subdirectories if
+        `recursive`. Returns whether it is watched; it is not if the watcher is not running
+        or `root` is not a directory.
+        """
+        root = os.path.abspath(root)
+        if self._loop is None or not os.path.isdir(root):
+            return False
+        key = (root, recursive)
+        with self._lock:
+            if key in self._refs:
+                self._refs[key] += 1
+                return True
+
+        use_inotify = self._inotify is not None
+        if use_inotify:
+            try:
+                if recursive:
+                    self._add_tree(root)
+                else:
+                    self._add_dir(root)
+            except OSError as e:
+                # most likely the limit of inotify watches, fs.inotify.max_user_watches
+                logger.warning(f"Could not watch {root} with inotify, polling it: {e}")
+                self._remove_tree(root, recursive)
+                use_inotify = False
+        if not use_inotify:
+            snapshot = self._snapshot(root, recursive)
+            with self._lock:
+                self._snapshots[key] = snapshot
+        with self._lock:
+            self._roots[key] = use_inotify
+            # counts the watches of the same tree set up meanwhile by other threads
+            self._refs[key] = self._refs.get(key, 0) + 1
+        logger.info(
+            f"Watching {root}{'' if recursive else ' without subdirectories'} "
+            f"{'with inotify' if use_inotify else 'by polling'}"
+        )
+        return True
+
+    def unwatch(self, root: str, recursive: bool = True):
+        """Undo a call to `watch`; the tree is no longer watched once all calls are undone."""
+        key = (os.path.abspath(root), recursive)
+        with self._lock:
+            refs = self._refs.get(key, 0)
+            if refs > 1:
+                self._refs[key] = refs - 1
+                return
+            self._refs.pop(key, None)
+            use_inotify = self._roots.pop(key, None)
+            self._snapshots.pop(key, None)
+        if use_inotify:
+            self._remove_tree(*key)
+        if use_inotify is not None:
+            logger.info(f"Stopped watching {key[0]}")
+
+    def watch_file(self, path: str) -> bool:
+        """Start reporting the changes of the file at `path`, even if it is hidden. Returns whether it is watched."""
+        path = os.path.abspath(path)
+        if not self.watch(os.path.dirname(path), recursive=False):
+            return False
+        with self._lock:
+            self._files[path] = self._files.get(path, 0) + 1
+        return True
+
+    def unwatch_file(self, path: str):
+        """Undo a call to `watch_file` that returned True."""
+        path = os.path.abspath(path)
+        with self._lock:
+            refs = self._files.get(path, 0)
+            if not refs:
+                return
+            if refs > 1:
+                self._files[path] = refs - 1
+            else:
+                del self._files[path]
+        self.unwatch(os.path.dirname(path), recursive=False)
+
+    def _covered(self, path: str, recursive: bool) -> bool:
+        """Whether a watched root covers the directory; call with the lock held."""
+        return any(
+            _is_under(path, root) if root_recursive else path == root
+            for root, root_recursive in self._roots
+            if root_recursive or not recursive
+        )
+
+    async def run(self):
+        """Watch until cancelled."""
+        self._loop = asyncio.get_running_loop()
+        if sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+                self._loop.add_reader(self._inotify.fd, self._on_inotify_events)
+            except (OSError, AttributeError) as e:
+                logger.warning(f"inotify is not available, polling for changes: {e}")
+                self._inotify = None
+        polled_at = time.monotonic()
+        try:
+            while True:
+                timeout = polled_at + self.poll_interval - time.monotonic()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), max(0, timeout))
+                except asyncio.TimeoutError:
+                    pass
+                if time.monotonic() - polled_at >= self.poll_interval:
+                    await self._poll()
+                    polled_at = time.monotonic()
+                if not self._pending:
+                    self._changed.clear()
+                    continue
+                # wait for the burst of events to settle
+                while True:
+                    self._changed.clear()
+                    try:
+                        await asyncio.wait_for(
+                            self._changed.wait(), self.coalesce_delay
+                        )
+                    except asyncio.TimeoutError:
+                        break
+                await self._flush()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            if self._inotify is not None:
+                self._loop.remove_reader(self._inotify.fd)
+                self._inotify.close()
+                self._inotify = None
+            self._loop = None
+
+    def _on_inotify_events(self):
+        assert self._inotify is not None
+        for wd, mask, name in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, anything may have changed
+                with self._lock:
+                    self._pending.update(root for root, _ in self._roots)
+                continue
+            with self._lock:
+                directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                with self._lock:
+                    self._watches.pop(wd, None)
+                    if self._watched_dirs.get(directory) == wd:
+                        del self._watched_dirs[directory]
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if name.startswith(".") and path not in self._files:
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                with self._lock:
+                    recursive = self._covered(directory, recursive=True)
+                if recursive:
+                    # walking the new tree may take long, e.g. on `npm install`
+                    task = asyncio.create_task(self._watch_new_tree(path))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                    continue
+            self._add_pending(path)
+        self._changed.set()
+
+    async def _watch_new_tree(self, path: str):
+        """Watch a directory created in a watched tree, and report it as changed."""
+
+        def add_tree() -> bool:
+            with self._walker_lock:
+                if self._walker.is_ignored(path, is_dir=True):
+                    return False
+            try:
+                self._add_tree(path)
+            except OSError as e:
+                logger.warning(f"Could not watch {path}: {e}")
+            return True
+
+        if await asyncio.to_thread(add_tree):
+            # files may have been created in it before its watches were added
+            self._add_pending(path)
+            self._changed.set()
+
+    def _add_pending(self, path: str):
+        with self._lock:
+            self._pending.add(path)
+            if len(self._pending) > self.max_batch:
+                # too many changes to report one by one
+                self._pending = {
+                    root
+                    for root, _ in self._roots
+                    if any(_is_under(path, root) for path in self._pending)
+                }
+
+    async def _flush(self):
+        with self._lock:
+            changed, self._pending = self._pending, set()
+        if not changed:
+            return
+        logger.debug(f"{len(changed)} paths changed")
+        for listener in self._listeners:
+            try:
+                await listener(changed)
+            except Exception as e:
+                logger.error(f"File change listener failed: {e}")
+
+    def _add_tree(self, root: str):
+        """Add inotify watches to the directories of a tree."""
+        with self._walker_lock:
+            entries, _ = self._walker.walk(root, max_depth=1 << 16, max_entries=1 << 30)
+        for entry in entries:
+            if entry.is_dir:
+                self._add_dir(entry.path)
+
+    def _add_dir(self, path: str):
+        """Add an inotify watch to a single directory."""
+        inotify = self._inotify
+        if inotify is None:
+            # the watcher stopped
+            return
+        with self._lock:
+            if path in self._watched_dirs:
+                return
+        wd = inotify.add_watch(path)
+        with self._lock:
+            self._watches[wd] = path
+            self._watched_dirs[path] = wd
+
+    def _remove_tree(self, root: str, recursive: bool = True):
+        """Remove the inotify watches of a tree that is no longer a watched root."""
+        with self._lock:
+            if self._covered(root, recursive):
+                # still watched as part of another tree
+                return
+            # the directories watched by the other roots are kept
+            wds = [
+                (path, wd)
+                for path, wd in self._watched_dirs.items()
+                if (_is_under(path, root) if recursive else path == root)
+                and not self._covered(path, recursive=False)
+            ]
+            for path, wd in wds:
+                del self._watched_dirs[path]
+                self._watches.pop(wd, None)
+        if self._inotify is not None:
+            for _, wd in wds:
+                self._inotify.rm_watch(wd)
+
+    async def _poll(self):
+        """Compare the polled trees with their last snapshots."""
+        with self._lock:
+            keys = list(self._snapshots)
+        for key in keys:
+            snapshot = await asyncio.to_thread(self._snapshot, *key)
+            with self._lock:
+                previous = self._snapshots.get(key)
+                if previous is None:
+                    continue
+                self._snapshots[key] = snapshot
+            changed = {
+                path
+                for path in previous.keys() | snapshot.keys()
+                if previous.get(path) != snapshot.get(path)
+            }
+            for path in changed:
+                self._add_pending(path)
+
+    def _snapshot(self, root: str, recursive: bool) -> dict[str, tuple[int, int]]:
+        with self._walker_lock:
+            entries, _ = self._walker.walk(
+                root, max_depth=1 << 16 if recursive else 1, max_entries=1 << 30
+            )
+        paths = [entry.path for entry in entries if not entry.is_dir]
+        if not recursive:
+            # the files watched on their own, which the walker skips if they are hidden
+            with self._lock:
+                paths += [path for path in self._files if os.path.dirname(path) == root]
+        snapshot = {}
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+
+def _is_under(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip("/") + "/")
@@ -0,0 +1,192 @@
+"""
+Lightweight tracing of the stages of a request, exported as JSON lines.
+
+Spans follow the OpenTelemetry data model: a span has a trace ID shared with the spans of
+the same request, its own span ID, the ID of its parent, start and end times in unix
+nanoseconds, attributes and a status. The current span is kept in a context variable, so
+it carries over to tasks and to `asyncio.to_thread`, and spans started under it become
+its children.
+
+Tracing is off unless `HIDE_MCP_TRACE_FILE` is set to the path of a file, to which the
+finished spans are appended, one JSON object per line. When it is off, starting a span
+costs a function call and nothing is recorded.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Iterator, TextIO
+
+SERVICE_NAME: str = "hide-mcp"
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """A timed stage of a request. Spans are ended once; later calls to `end` are ignored."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_span_id: str | None
+    attributes: dict[str, Any]
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_span_id: str | None,
+        attributes: dict[str, Any],
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.attributes = attributes
+        self._start_time = time.time_ns()
+        self._error: str | None = None
+        self._ended = False
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, exception: BaseException):
+        """Mark the span as failed, recording the exception in its attributes."""
+        self._error = f"{type(exception).__name__}: {exception}"
+        self.attributes["exception.type"] = type(exception).__name__
+        self.attributes["exception.message"] = str(exception)
+        self.attributes["exception.stacktrace"] = "".join(
+            traceback.format_exception(exception)
+        )
+
+    def end(self):
+        if self._ended:
+            return
+        self._ended = True
+        if _exporter is not None:
+            _exporter.export(self._to_dict(time.time_ns()))
+
+    def _to_dict(self, end_time: int) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "start_time_unix_nano": self._start_time,
+            "end_time_unix_nano": end_time,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self._error}
+            if self._error is not None
+            else {"code": "OK"},
+            "resource": {"service.name": SERVICE_NAME, "process.pid": os.getpid()},
+        }
+
+
+class _NoopSpan(Span):
+    """The span returned while tracing is off."""
+
+    def __init__(self):
+        pass
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_exception(self, exception: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "hide_mcp_current_span", default=None
+)
+
+
+class JsonLinesExporter:
+    """Appends finished spans to a file, one JSON object per line. Thread safe."""
+
+    path: str
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: TextIO = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: dict[str, Any]):
+        line = json.dumps(span, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            # a line at a time, so that the spans survive the process being killed
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_exporter: JsonLinesExporter | None = None
+
+
+def setup_tracing(path: str | None = None):
+    """
+    Export the spans to the file at `path`. If not provided, will check the
+    HIDE_MCP_TRACE_FILE environment variable, and leave tracing off if it is not set.
+    """
+    global _exporter
+    path = path or os.getenv("HIDE_MCP_TRACE_FILE")
+    if _exporter is not None:
+        if path == _exporter.path:
+            return
+        _exporter.close()
+        _exporter = None
+    if path:
+        _exporter = JsonLinesExporter(path)
+        logger.info(f"Tracing initialized. Trace file: {path}")
+
+
+def is_enabled() -> bool:
+    return _exporter is not None
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def start_span(name: str, parent: Span | None = None, **attributes: Any) -> Span:
+    """
+    Start a span under `parent`, or else under the current span, or else as the root of
+    a new trace. The span is not made current; it has to be ended by the caller.
+    """
+    if _exporter is None:
+        return _NOOP_SPAN
+    if parent is None or parent is _NOOP_SPAN:
+        parent = _current_span.get()
+    if parent is None:
+        return Span(name, f"{random.getrandbits(128):032x}", None, attributes)
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name: str, parent: Span | None = None, **attributes: Any) -> Iterator[Span]:
+    """Trace the block as a span, current within it. Exceptions mark the span as failed."""
+    if _exporter is None:
+        yield _NOOP_SPAN
+        return
+    current = start_span(name, parent, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.record_exception(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
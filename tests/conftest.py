@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def anyio_backend():
+    # the tools use asyncio directly
+    return "asyncio"
+
+
+@pytest.fixture
+def traced(tmp_path, monkeypatch):
+    """Trace to a file for the test. Returns a function that reads the spans so far."""
+    from hide_mcp import tracing
+
+    monkeypatch.delenv("HIDE_MCP_TRACE_FILE", raising=False)
+    path = tmp_path / "trace.jsonl"
+    tracing.setup_tracing(str(path))
+
+    def spans() -> list[dict]:
+        return [json.loads(line) for line in path.read_text().splitlines()]
+
+    yield spans
+    tracing.setup_tracing()
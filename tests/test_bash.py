@@ -0,0 +1,188 @@
+import asyncio
+import os
+import re
+
+import pytest
+
+from hide_mcp.tools.base import ToolError
+from hide_mcp.tools.bash import BashTool, _OutputReader, _partial_suffix
+from hide_mcp.tools.capture import OutputCapture
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def bash_tool():
+    tool = BashTool()
+    tool._spare_sessions = 0
+    yield tool
+    for name, bash_session in list(tool._sessions.items()):
+        tool._stop_session(name)
+        await bash_session._process.wait()
+    await asyncio.gather(*tool._warming)
+    for bash_session in tool._spares:
+        bash_session.stop()
+        await bash_session._process.wait()
+
+
+def _reader(data: bytes, read_size: int, on_output=None) -> _OutputReader:
+    stream = asyncio.StreamReader()
+    stream.feed_data(data)
+    stream.feed_eof()
+    return _OutputReader(
+        stream, b"<<end>>", read_size, OutputCapture(64, 64), on_output
+    )
+
+
+def test_partial_suffix():
+    assert _partial_suffix(b"output<<en", b"<<end>>") == 4
+    assert _partial_suffix(b"output<", b"<<end>>") == 1
+    assert _partial_suffix(b"output", b"<<end>>") == 0
+
+
+@pytest.mark.parametrize("read_size", [1, 3, 1024])
+async def test_reader_finds_a_split_sentinel(read_size):
+    chunks = []
+
+    async def on_output(chunk: str):
+        chunks.append(chunk)
+
+    reader = _reader("héllo <<\n<<end>>0\nbackground\n".encode(), read_size, on_output)
+    assert await reader.read_until_sentinel() == "0"
+    assert reader.capture.getvalue() == "héllo <<\n"
+    assert "".join(chunks) == "héllo <<\n"
+
+
+async def test_reader_raises_on_eof():
+    reader = _reader(b"output without sentinel", 4)
+    with pytest.raises(EOFError):
+        await reader.read_until_sentinel()
+    assert reader.capture.getvalue().startswith("output without")
+
+
+async def test_syntax_error_keeps_the_session(bash_tool: BashTool):
+    await bash_tool(command="cd /tmp && export HIDE_TEST_VAR=kept")
+
+    result = await bash_tool(command="echo 'unbalanced")
+    assert result.system and result.system.startswith("exit code: 2,")
+
+    for command in ("if true; then", "(", "echo a &", "echo b # comment"):
+        await bash_tool(command=command)
+
+    result = await bash_tool(command="echo sync $PWD $HIDE_TEST_VAR")
+    assert result.output == "sync /tmp kept"
+    assert result.system and result.system.startswith("exit code: 0,")
+
+
+async def test_output_cannot_fake_the_sentinel(bash_tool: BashTool):
+    result = await bash_tool(command="echo '<<exit>>fake'; echo after")
+    assert result.output == "<<exit>>fake\nafter"
+    assert result.system and result.system.startswith("exit code: 0,")
+
+    result = await bash_tool(command="echo next")
+    assert result.output == "next"
+
+
+async def test_commands_read_no_input(bash_tool: BashTool):
+    result = await bash_tool(command="cat; read line; echo done $?")
+    assert result.output == "done 1"
+
+
+async def test_invalid_timeout(bash_tool: BashTool):
+    for timeout in (0, -1, "1", True):
+        with pytest.raises(ToolError, match="Invalid `timeout` parameter"):
+            await bash_tool(command="true", timeout=timeout)
+
+
+async def test_long_output_is_kept_in_a_private_directory(bash_tool: BashTool):
+    result = await bash_tool(command="seq 1 20000")
+    assert result.output is not None
+    assert result.output.startswith("1\n2\n")
+    assert result.output.endswith("\n19999\n20000")
+    assert "<response clipped:" in result.output
+
+    store = bash_tool.output_store
+    [(output_id, _)] = store.list()
+    assert f"hide://outputs/{output_id}" in result.output
+    assert store.read(output_id, line_range=(10000, 10001)) == "10000\n10001\n"
+    [name] = os.listdir(store.directory)
+    assert name.startswith("output-")
+    assert os.stat(store.directory).st_mode & 0o777 == 0o700
+
+
+async def test_output_is_streamed_while_running(bash_tool: BashTool):
+    chunks = []
+
+    async def on_output(chunk: str):
+        chunks.append(chunk)
+
+    result = await bash_tool(
+        command="echo first; sleep 0.5; echo second", on_output=on_output
+    )
+    assert result.output == "first\nsecond"
+    assert chunks == ["first\n", "second\n"]
+
+
+async def test_named_sessions_are_independent(bash_tool: BashTool):
+    await bash_tool(command="cd /tmp", session="a")
+    result = await bash_tool(command="pwd", session="b")
+    assert result.output != "/tmp"
+
+    started_at = asyncio.get_running_loop().time()
+    await asyncio.gather(
+        bash_tool(command="sleep 0.5", session="a"),
+        bash_tool(command="sleep 0.5", session="b"),
+    )
+    assert asyncio.get_running_loop().time() - started_at < 0.9
+    assert (await bash_tool(command="pwd", session="a")).output == "/tmp"
+
+
+async def test_least_recently_used_session_is_evicted(bash_tool: BashTool):
+    bash_tool._max_sessions = 2
+    await bash_tool(command="true", session="a")
+    oldest = bash_tool._sessions["a"]
+    await bash_tool(command="true", session="b")
+    await bash_tool(command="true", session="c")
+    assert sorted(bash_tool._sessions) == ["b", "c"]
+    await oldest._process.wait()
+
+
+async def test_sessions_take_a_warm_spare(bash_tool: BashTool):
+    bash_tool._spare_sessions = 1
+    bash_tool.warm_up()
+    [spare] = bash_tool._spares
+    await asyncio.gather(*bash_tool._warming)
+    assert spare._started
+
+    await bash_tool(command="true")
+    assert bash_tool._sessions["default"] is spare
+    # a new spare replaces the one taken, and is taken on restart
+    [next_spare] = bash_tool._spares
+    assert next_spare is not spare
+    await bash_tool(restart=True)
+    assert bash_tool._sessions["default"] is next_spare
+    await spare._process.wait()
+
+
+async def test_timeout_interrupts_the_command_and_keeps_the_shell(bash_tool: BashTool):
+    await bash_tool(command="export HIDE_TEST_VAR=kept")
+    shell = bash_tool._sessions["default"]
+    with pytest.raises(ToolError, match="has been interrupted") as e:
+        await bash_tool(command="echo partial; sleep 30", timeout=0.5)
+    assert e.value.message.endswith("Output so far:\npartial\n")
+
+    assert bash_tool._sessions["default"] is shell
+    result = await bash_tool(command="echo $HIDE_TEST_VAR")
+    assert result.output == "kept"
+
+
+async def test_exit_code_and_timing(bash_tool: BashTool):
+    result = await bash_tool(command="sleep 0.3; (exit 3)")
+    assert result.system is not None
+    match = re.fullmatch(
+        r"exit code: 3, wall time: (\d+\.\d{3})s, cpu time: \d+\.\d{3}s", result.system
+    )
+    assert match and float(match[1]) >= 0.3
+
+    result = await bash_tool(command="true")
+    assert result.system and result.system.startswith("exit code: 0,")
@@ -0,0 +1,182 @@
+import importlib.util
+import json
+import os
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+BENCHMARKS = Path(__file__).parent.parent / "benchmarks"
+SRC = Path(__file__).parent.parent / "src"
+
+
+def _load(name: str):
+    spec = importlib.util.spec_from_file_location(
+        f"benchmarks_{name}", BENCHMARKS / f"{name}.py"
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def run(monkeypatch):
+    # the module sets these defaults for the benchmarks, not for the other tests
+    monkeypatch.setenv("HIDE_MCP_LOG_LEVEL", "WARNING")
+    monkeypatch.setenv("HIDE_BASH_SPARE_SESSIONS", "0")
+    return _load("run")
+
+
+def test_results_are_saved_and_compared(run, tmp_path):
+    output = tmp_path / "results.json"
+    args = ["--quick", "--filter", "edit.1KB", "--budget", "0", "--max-rounds", "3"]
+    result = CliRunner().invoke(run.main, [*args, "--output", str(output)])
+    assert result.exit_code == 0, result.output
+
+    saved = json.loads(output.read_text())
+    assert saved["metadata"]["quick"]
+    names = [entry["name"] for entry in saved["results"]]
+    assert names == [
+        "edit.1KB.view",
+        "edit.1KB.view_range",
+        "edit.1KB.str_replace",
+        "edit.1KB.insert",
+    ]
+    for entry in saved["results"]:
+        assert entry["rounds"] == run.MIN_ROUNDS
+        assert 0 < entry["min"] <= entry["median"] <= entry["max"]
+
+    # a baseline that was much faster is reported as a regression
+    for entry in saved["results"]:
+        entry["median"] /= 1000
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(saved))
+    result = CliRunner().invoke(
+        run.main,
+        [*args, "--output", str(output), "--compare", str(baseline)],
+    )
+    assert result.exit_code == 1
+    assert "edit.1KB.view " in result.output
+    assert "REGRESSION" in result.output
+
+
+def _request(id, method, **params):
+    return {"jsonrpc": "2.0", "id": id, "method": method, "params": params}
+
+
+def _response(id):
+    return {"jsonrpc": "2.0", "id": id, "result": {}}
+
+
+def _view(id, path):
+    return _request(
+        id,
+        "tools/call",
+        name="str_replace_editor",
+        arguments={"command": "view", "path": str(path)},
+    )
+
+
+def _write_transcript(path: Path, messages: list[tuple[str, float, str, dict]]):
+    with open(path, "w") as f:
+        for session, time, direction, message in messages:
+            entry = {
+                "session": session,
+                "time": time,
+                "direction": direction,
+                "message": message,
+            }
+            f.write(json.dumps(entry) + "\n")
+
+
+INITIALIZE = _request(
+    0,
+    "initialize",
+    protocolVersion="2024-11-05",
+    capabilities={},
+    clientInfo={"name": "test", "version": "1"},
+)
+INITIALIZED = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+
+
+def test_sessions_keep_the_order_of_requests(tmp_path):
+    replay = _load("replay")
+    c, s = replay.CLIENT_TO_SERVER, replay.SERVER_TO_CLIENT
+    transcript = tmp_path / "transcript.jsonl"
+    _write_transcript(
+        transcript,
+        [
+            ("a", 10.0, c, INITIALIZE),
+            ("b", 50.0, c, INITIALIZE),
+            ("a", 10.5, s, _response(0)),
+            ("a", 11.0, c, INITIALIZED),
+            ("a", 12.0, c, _request(1, "resources/read", uri="hide://projects/new")),
+            ("a", 13.0, s, _response(1)),
+            # sent together, without waiting for each other
+            ("a", 14.0, c, _view(2, "/a")),
+            ("a", 14.5, c, _view(3, "/b")),
+            ("a", 15.0, s, _response(3)),
+            ("a", 16.0, s, _response(2)),
+            ("a", 16.5, c, _request(4, "tools/list")),
+        ],
+    )
+    a, b = replay.load_sessions(str(transcript))
+    assert (a.id, b.id) == ("a", "b")
+    assert len(b.messages) == 1
+    assert [(m.message.get("id"), m.after, m.delay) for m in a.messages] == [
+        (0, [], 0.0),
+        (None, [0], 0.5),
+        # the read of the project is dropped, and its response is not waited for,
+        # but the pause of the client is counted from it
+        (2, [], 1.0),
+        (3, [], 0.5),
+        (4, [3, 2], 0.5),
+    ]
+
+
+def test_sessions_are_replayed_against_a_local_server(monkeypatch, tmp_path):
+    monkeypatch.setenv(
+        "PYTHONPATH", os.pathsep.join(filter(None, [str(SRC), os.getenv("PYTHONPATH")]))
+    )
+    replay = _load("replay")
+    c, s = replay.CLIENT_TO_SERVER, replay.SERVER_TO_CLIENT
+    (tmp_path / "a.txt").write_text("a\n")
+    transcript = tmp_path / "transcript.jsonl"
+    _write_transcript(
+        transcript,
+        [
+            ("a", 0.0, c, INITIALIZE),
+            ("a", 0.1, s, _response(0)),
+            ("a", 0.2, c, INITIALIZED),
+            ("a", 0.3, c, _view(1, tmp_path / "a.txt")),
+            ("a", 0.3, c, _view(2, tmp_path / "missing.txt")),
+        ],
+    )
+    output = tmp_path / "report.json"
+    result = CliRunner().invoke(
+        replay.main,
+        [
+            str(transcript),
+            "--start-server",
+            "--speedup",
+            "0",
+            "--repeat",
+            "2",
+            "--concurrency",
+            "2",
+            "--timeout",
+            "30",
+            "--output",
+            str(output),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    report = json.loads(output.read_text())
+    assert (report["completed_sessions"], report["failed_sessions"]) == (2, 0)
+    assert report["by_kind"]["initialize"]["requests"] == 2
+    calls = report["by_kind"]["tools/call:str_replace_editor"]
+    assert calls["requests"] == 4
+    assert calls["tool_error_rate"] == 0.5
+    assert calls["timeout_rate"] == 0.0
+    assert 0 < calls["p50"] <= calls["p99"]
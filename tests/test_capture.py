@@ -0,0 +1,36 @@
+from hide_mcp.tools.capture import OutputCapture
+
+
+def test_short_output_is_kept_whole():
+    capture = OutputCapture(head_size=8, tail_size=8)
+    capture.write(b"one\n")
+    capture.write(b"two\n")
+    assert capture.omitted_bytes == 0
+    assert capture.getvalue() == "one\ntwo\n"
+
+
+def test_keeps_head_and_tail():
+    capture = OutputCapture(head_size=4, tail_size=4)
+    for i in range(10):
+        capture.write(f"{i}{i}\n".encode())
+    assert capture.head == b"00\n1"
+    assert capture.tail == b"\n99\n"
+    assert (capture.total_bytes, capture.total_lines) == (30, 10)
+    assert capture.getvalue() == (
+        "00\n1\n<response clipped: 22 of 30 bytes (10 lines) omitted>\n\n99\n"
+    )
+    assert capture.spill_path is None
+
+
+def test_spills_the_full_output(tmp_path):
+    capture = OutputCapture(head_size=4, tail_size=4, spill_dir=str(tmp_path))
+    data = b"".join(f"line {i}\n".encode() for i in range(100))
+    for start in range(0, len(data), 7):
+        capture.write(data[start : start + 7])
+    capture.close()
+    assert capture.spill_path is not None
+    with open(capture.spill_path, "rb") as f:
+        assert f.read() == data
+    value = capture.getvalue("hide://outputs/id")
+    assert f"saved to {capture.spill_path}" in value
+    assert "hide://outputs/id?lines=1-100" in value
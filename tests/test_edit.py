@@ -0,0 +1,165 @@
+import asyncio
+import re
+
+import pytest
+
+from hide_mcp.tools import edit
+from hide_mcp.tools.base import ToolError
+from hide_mcp.tools.edit import EditTool
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_view_files(tmp_path):
+    (tmp_path / "a.txt").write_text("a1\na2\na3\n")
+    (tmp_path / "b.txt").write_text("b1\nb2\n")
+    result = await EditTool()(
+        command="view",
+        files=[
+            {"path": str(tmp_path / "a.txt"), "view_range": [2, 3]},
+            {"path": str(tmp_path / "b.txt")},
+            {"path": str(tmp_path / "missing.txt")},
+        ],
+    )
+    assert result.output is not None
+    assert "     2\ta2\n     3\ta3" in result.output
+    assert "     1\tb1\n     2\tb2" in result.output
+    assert f"Could not view {tmp_path / 'missing.txt'}" in result.output
+
+
+async def test_view_files_shares_the_budget_with_directories(tmp_path, monkeypatch):
+    monkeypatch.setattr(edit, "MAX_VIEW_FILES_LEN", 2000)
+    files = []
+    for i in range(8):
+        directory = tmp_path / f"dir{i}"
+        directory.mkdir()
+        for j in range(100):
+            (directory / f"file_with_a_long_name_{j}.txt").touch()
+        files.append({"path": str(directory)})
+
+    tool = EditTool()
+    result = await tool(command="view", files=files)
+    assert result.output is not None
+    notices = re.findall(r"<response clipped[^>]*>", result.output)
+    assert len(notices) == 8
+    assert len(result.output) <= 2000 + sum(len(notice) + 1 for notice in notices)
+    assert len(tool.output_store.list()) == 8
+
+
+async def test_view_rejects_path_with_files(tmp_path):
+    (tmp_path / "a.txt").write_text("a\n")
+    with pytest.raises(ToolError, match="cannot be used together"):
+        await EditTool()(
+            command="view",
+            path=str(tmp_path / "a.txt"),
+            files=[{"path": str(tmp_path / "a.txt")}],
+        )
+    with pytest.raises(ToolError, match="non-empty list"):
+        await EditTool()(command="view", files=[])
+
+
+async def test_batch_applies_all_edits_or_none(tmp_path):
+    a, b = tmp_path / "a.py", tmp_path / "b.py"
+    a.write_text("x = 1\n")
+    b.write_text("y = 2\n")
+    tool = EditTool()
+    with pytest.raises(ToolError, match="No edits were performed. Edit 2 of 2 failed"):
+        await tool(
+            command="batch",
+            edits=[
+                {
+                    "command": "str_replace",
+                    "path": str(a),
+                    "old_str": "1",
+                    "new_str": "10",
+                },
+                {
+                    "command": "str_replace",
+                    "path": str(b),
+                    "old_str": "3",
+                    "new_str": "30",
+                },
+            ],
+        )
+    assert (a.read_text(), b.read_text()) == ("x = 1\n", "y = 2\n")
+
+    a.chmod(0o751)
+    await tool(
+        command="batch",
+        edits=[
+            {"command": "str_replace", "path": str(a), "old_str": "1", "new_str": "10"},
+            {"command": "insert", "path": str(a), "insert_line": 1, "new_str": "z = 3"},
+            {"command": "str_replace", "path": str(b), "old_str": "2", "new_str": "20"},
+        ],
+    )
+    assert (a.read_text(), b.read_text()) == ("x = 10\nz = 3\n", "y = 20\n")
+    assert a.stat().st_mode & 0o777 == 0o751
+
+    # an undo of either file reverts the whole batch
+    await tool(command="undo_edit", path=str(b))
+    assert (a.read_text(), b.read_text()) == ("x = 1\n", "y = 2\n")
+
+
+async def test_str_replace_reports_the_edited_lines(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_text("".join(f"line {i}\n" for i in range(1, 21)))
+    tool = EditTool()
+
+    result = await tool(
+        command="str_replace", path=str(path), old_str="line 10\n", new_str="ten\nTEN\n"
+    )
+    assert result.output is not None
+    snippet = "".join(
+        f"{n:6}\t{text}\n"
+        for n, text in enumerate(
+            ["line 6", "line 7", "line 8", "line 9", "ten", "TEN"]
+            + [f"line {i}" for i in range(11, 15)],
+            start=6,
+        )
+    )
+    assert snippet in result.output
+    assert path.read_text().count("ten\nTEN\nline 11\n") == 1
+
+    # `line 20` is now line 21
+    with pytest.raises(ToolError, match=r"Multiple occurrences .* in lines \[2, 21\]"):
+        await tool(command="str_replace", path=str(path), old_str="e 2", new_str="")
+    with pytest.raises(ToolError, match="did not appear verbatim"):
+        await tool(command="str_replace", path=str(path), old_str="line 10", new_str="")
+
+
+async def test_view_files_leaves_the_unused_budget_to_longer_files(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(edit, "MAX_VIEW_FILES_LEN", 2000)
+    (tmp_path / "small.txt").write_text("small\n")
+    (tmp_path / "big.txt").write_text("b" * 10000)
+    result = await EditTool()(
+        command="view",
+        files=[
+            {"path": str(tmp_path / "small.txt")},
+            {"path": str(tmp_path / "big.txt")},
+        ],
+    )
+    assert result.output is not None
+    assert "     1\tsmall" in result.output
+    # the big file gets all but the few characters taken by the small one
+    assert "b" * 1990 in result.output
+    assert result.output.count("<response clipped") == 1
+
+
+async def test_concurrent_edits_of_a_file_are_all_applied(tmp_path):
+    path = tmp_path / "counters.py"
+    path.write_text("".join(f"c{i} = 0\n" for i in range(20)))
+    tool = EditTool()
+    await asyncio.gather(
+        *(
+            tool(
+                command="str_replace",
+                path=str(path),
+                old_str=f"c{i} = 0\n",
+                new_str=f"c{i} = 1\n",
+            )
+            for i in range(20)
+        )
+    )
+    assert path.read_text() == "".join(f"c{i} = 1\n" for i in range(20))
@@ -0,0 +1,54 @@
+import pytest
+
+from hide_mcp.tools.file_cache import CachedFile, FileCache
+
+
+@pytest.mark.parametrize(
+    "lines, expected",
+    [
+        ((1, 1), "one"),
+        ((2, 3), "two\nthree"),
+        ((3, -1), "three\n"),
+        ((2, 10), "two\nthree\n"),
+    ],
+)
+def test_cached_file_lines(lines, expected):
+    cached = CachedFile("one\ntwo\nthree\n")
+    assert cached.n_lines == 4
+    assert cached.lines(*lines) == expected
+
+
+def test_hits_and_misses(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("a\n")
+    cache = FileCache(max_size=1 << 20)
+    assert cache.get(path, lambda p: p.read_text()).content == "a\n"
+    assert cache.get(path, lambda p: p.read_text()).content == "a\n"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    path.write_text("changed\n")
+    assert cache.get(path, lambda p: p.read_text()).content == "changed\n"
+    assert cache.misses == 2
+
+
+def test_evicts_the_least_recently_used(tmp_path):
+    paths = [tmp_path / f"{i}.txt" for i in range(3)]
+    for path in paths:
+        path.write_text("x" * 1000)
+    size = CachedFile("x" * 1000).size
+    cache = FileCache(max_size=2 * size)
+    for path in (paths[0], paths[1], paths[0], paths[2]):
+        cache.get(path, lambda p: p.read_text())
+    assert list(cache._entries) == [paths[0], paths[2]]
+
+
+def test_invalidate_many_drops_the_files_below_a_directory(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    inside, outside = tmp_path / "pkg" / "a.txt", tmp_path / "b.txt"
+    for path in (inside, outside):
+        path.write_text("x")
+    cache = FileCache(max_size=1 << 20)
+    for path in (inside, outside):
+        cache.get(path, lambda p: p.read_text())
+    cache.invalidate_many([tmp_path / "pkg"])
+    assert list(cache._entries) == [outside]
@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import pytest
+
+from hide_mcp.tools.history import FileHistory, apply_delta, make_delta
+
+VERSIONS = ["a\n" * 5000, "a\n" * 2500 + "b\n" + "a\n" * 2500, "c\n" + "a\n" * 5000, ""]
+
+
+@pytest.mark.parametrize(
+    "new, old", [("abcdef", "abXdef"), ("abc", "abcabc"), ("", "x"), ("same", "same")]
+)
+def test_delta_round_trip(new, old):
+    delta = make_delta(new, old)
+    assert apply_delta(new, delta) == old
+    assert len(delta[2]) <= len(old)
+
+
+def test_deltas_are_about_as_small_as_the_edit():
+    start, end, text = make_delta(VERSIONS[1], VERSIONS[0])
+    assert (end - start, text) == (2, "")
+
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_pop_restores_the_versions_newest_first(spill):
+    history = FileHistory(
+        max_file_memory=1 << 20, max_memory=1 << 20, max_disk=1 << 20, spill=spill
+    )
+    path = Path("/repo/file.txt")
+    for content in VERSIONS:
+        history.push(path, content)
+    assert [history.pop(path) for _ in VERSIONS] == VERSIONS[::-1]
+    assert history.pop(path) is None
+    assert path not in history
+
+
+def test_spills_beyond_the_memory_budget_and_drops_beyond_the_disk_budget():
+    history = FileHistory(
+        max_file_memory=1 << 20, max_memory=20000, max_disk=30000, spill=True
+    )
+    paths = [Path(f"/repo/{i}.txt") for i in range(4)]
+    for i, path in enumerate(paths):
+        history.push(path, str(i) * 10000)
+    assert history._spill_dir is not None
+    assert history.pop(paths[3]) == "3" * 10000
+    # the oldest entries were spilled, and dropped once the disk budget was exceeded
+    assert paths[0] not in history
+    assert history.pop(paths[1]) == "1" * 10000
+
+    spill_dir = history._spill_dir
+    history.clear()
+    assert not Path(spill_dir).exists()
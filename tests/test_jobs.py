@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+import pytest
+
+from hide_mcp.tools.jobs import JobTool, _complete_length
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def job_tool():
+    tool = JobTool()
+    yield tool
+    for job in tool._jobs.values():
+        await job.kill(timeout=1)
+
+
+@pytest.mark.parametrize(
+    "data, length",
+    [
+        (b"", 0),
+        (b"abc", 3),
+        ("aé".encode(), 3),
+        ("aé".encode()[:-1], 1),
+        ("a€".encode()[:-1], 1),
+        ("a€".encode()[:-2], 1),
+        ("a😀".encode(), 5),
+        ("a😀".encode()[:-1], 1),
+        ("😀".encode()[1:], 3),
+    ],
+)
+def test_complete_length(data, length):
+    assert _complete_length(data) == length
+
+
+async def test_output_pages_end_at_characters(job_tool: JobTool):
+    await job_tool(command="start_job", job_command="printf 'aé%.0s' $(seq 1 10000)")
+    job = job_tool._jobs["1"]
+    await job._monitor
+
+    # the page from the é at offset 1 would end with the first byte of an é
+    result = await job_tool(command="job_output", job_id="1", offset=1)
+    assert result.output == "éa" * 5333
+    assert result.system and "next offset: 16000," in result.system
+    result = await job_tool(command="job_output", job_id="1", offset=16000)
+    assert result.output and result.output.startswith("éaé")
+    assert "�" not in result.output
+
+
+async def test_output_files_are_private(job_tool: JobTool):
+    await job_tool(command="start_job", job_command="echo done")
+    job = job_tool._jobs["1"]
+    await job._monitor
+    directory = os.path.dirname(job.output_path)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    assert os.path.basename(directory).startswith("hide-mcp-jobs-")
+    result = await job_tool(command="job_output", job_id="1")
+    assert result.output == "done\n"
+
+
+def _group_members(pgid: int) -> list[int]:
+    """The processes of a process group that are still running, read from /proc."""
+    members = []
+    for pid in filter(str.isdigit, os.listdir("/proc")):
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        # the state and the process group are the 3rd and 5th fields
+        if int(fields[2]) == pgid and fields[0] != "Z":
+            members.append(int(pid))
+    return members
+
+
+async def test_kill_stops_the_processes_started_by_the_job(job_tool: JobTool):
+    await job_tool(command="start_job", job_command="sleep 100 & sleep 100")
+    job = job_tool._jobs["1"]
+    await asyncio.sleep(0.2)
+    assert len(_group_members(job._process.pid)) >= 2
+
+    result = await job_tool(command="kill_job", job_id="1")
+    assert result.output and "exited with code" in result.output
+    assert _group_members(job._process.pid) == []
@@ -0,0 +1,83 @@
+import pytest
+
+from hide_mcp import metrics
+
+
+@pytest.fixture
+def registry() -> metrics.Registry:
+    return metrics.Registry()
+
+
+def test_counters_and_gauges_are_rendered_per_labels(registry):
+    calls = metrics.Counter(
+        "hide_calls_total", "Calls.\nBy tool.", ("tool",), registry=registry
+    )
+    calls.inc("bash")
+    calls.inc("bash", amount=2)
+    calls.inc('say "hi"')
+    in_flight = metrics.Gauge("hide_in_flight", "In flight.", registry=registry)
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+    size = metrics.Gauge("hide_size", "Size.", registry=registry)
+    size.set(value=0.5)
+
+    assert registry.render() == (
+        "# HELP hide_calls_total Calls.\\nBy tool.\n"
+        "# TYPE hide_calls_total counter\n"
+        'hide_calls_total{tool="bash"} 3\n'
+        'hide_calls_total{tool="say \\"hi\\""} 1\n'
+        "# HELP hide_in_flight In flight.\n"
+        "# TYPE hide_in_flight gauge\n"
+        "hide_in_flight 1\n"
+        "# HELP hide_size Size.\n"
+        "# TYPE hide_size gauge\n"
+        "hide_size 0.5\n"
+    )
+
+
+def test_histograms_have_cumulative_buckets(registry):
+    latency = metrics.Histogram(
+        "hide_latency_seconds",
+        "Latency.",
+        ("tool",),
+        buckets=(0.1, 1.0),
+        registry=registry,
+    )
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, "bash")
+    with latency.time("edit"):
+        pass
+
+    lines = registry.render().splitlines()
+    assert lines[1] == "# TYPE hide_latency_seconds histogram"
+    assert lines[2:9] == [
+        'hide_latency_seconds_bucket{tool="bash",le="0.1"} 2',
+        'hide_latency_seconds_bucket{tool="bash",le="1"} 3',
+        'hide_latency_seconds_bucket{tool="bash",le="+Inf"} 4',
+        'hide_latency_seconds_sum{tool="bash"} 3.65',
+        'hide_latency_seconds_count{tool="bash"} 4',
+        'hide_latency_seconds_bucket{tool="edit",le="0.1"} 1',
+        'hide_latency_seconds_bucket{tool="edit",le="1"} 1',
+    ]
+    assert lines[-1] == 'hide_latency_seconds_count{tool="edit"} 1'
+
+
+def test_function_metrics_are_read_when_rendered(registry):
+    values = {("a",): 1.0}
+    metrics.Gauge(
+        "hide_entries",
+        "Entries.",
+        ("cache",),
+        function=lambda: values,
+        registry=registry,
+    )
+    assert 'hide_entries{cache="a"} 1' in registry.render()
+    values[("b",)] = float("inf")
+    assert 'hide_entries{cache="b"} +Inf' in registry.render()
+
+
+def test_names_are_registered_once(registry):
+    metrics.Counter("hide_calls_total", "Calls.", registry=registry)
+    with pytest.raises(ValueError, match="already registered"):
+        metrics.Counter("hide_calls_total", "Calls.", registry=registry)
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from hide_mcp.tools import outputs
+from hide_mcp.tools.base import ToolError
+from hide_mcp.tools.edit import EditTool
+from hide_mcp.tools.outputs import OutputStore
+from hide_mcp.tools.run import maybe_truncate
+
+pytestmark = pytest.mark.anyio
+
+
+def test_read_by_bytes_and_lines(monkeypatch):
+    monkeypatch.setattr(outputs, "LINE_INDEX_STEP", 4)
+    store = OutputStore()
+    output_id = store.add_text("".join(f"line {i}\n" for i in range(1, 21)))
+    assert store.read(output_id, line_range=(5, 6)) == "line 5\nline 6\n"
+    assert store.read(output_id, line_range=(19, None)) == "line 19\nline 20\n"
+    assert store.read(output_id, byte_range=(0, 5)) == "line 1"
+    with pytest.raises(ToolError, match="Invalid line range"):
+        store.read(output_id, line_range=(22, None))
+    with pytest.raises(ToolError, match="No output found"):
+        store.read("unknown")
+
+
+def test_evicts_the_oldest_but_keeps_the_newest():
+    store = OutputStore(max_outputs=2, max_size=10)
+    first = store.add_text("a" * 4)
+    path = os.path.join(store.directory, os.listdir(store.directory)[0])
+    store.add_text("b" * 4)
+    newest = store.add_text("c" * 20)
+    assert [output_id for output_id, _ in store.list()] == [newest]
+    assert not os.path.exists(path)
+    with pytest.raises(ToolError):
+        store.read(first)
+
+
+def test_directory_is_private():
+    store = OutputStore()
+    assert os.stat(store.directory).st_mode & 0o777 == 0o700
+    assert store.directory != OutputStore().directory
+
+
+def test_maybe_truncate_keeps_the_full_content():
+    store = OutputStore()
+    content = "x" * 100
+    assert maybe_truncate(content, 100, store) == content
+    clipped = maybe_truncate(content, 10, store)
+    assert clipped.startswith("x" * 10 + "<response clipped: 90 of 100 characters")
+    [(output_id, _)] = store.list()
+    assert f"hide://outputs/{output_id}" in clipped
+    assert store.read(output_id) == content
+
+
+async def test_view_keeps_the_numbered_file(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_text("".join(f"line {i}\n" for i in range(1, 5001)))
+    tool = EditTool()
+    result = await tool(command="view", path=str(path))
+    assert result.output is not None
+    [(output_id, _)] = tool.output_store.list()
+    assert f"hide://outputs/{output_id}" in result.output
+    page = tool.output_store.read(output_id, line_range=(4000, 4001))
+    assert page == "  4000\tline 4000\n  4001\tline 4001\n"
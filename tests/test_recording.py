@@ -0,0 +1,86 @@
+import importlib
+import json
+
+import anyio
+import pytest
+from mcp.client.session import ClientSession
+from mcp.shared.memory import create_client_server_memory_streams
+
+from hide_mcp import recording
+
+# the package exports a `server` command that hides the module
+server = importlib.import_module("hide_mcp.server")
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def transcript(tmp_path, monkeypatch):
+    monkeypatch.delenv("HIDE_MCP_RECORD_FILE", raising=False)
+    path = tmp_path / "transcript.jsonl"
+    recording.setup_recording(str(path))
+    yield path
+    recording.setup_recording()
+
+
+async def _session(tmp_path):
+    (tmp_path / "a.txt").write_text("a\n")
+    async with create_client_server_memory_streams() as (
+        client_streams,
+        server_streams,
+    ):
+        async with (
+            recording.recorded_streams(*server_streams) as streams,
+            anyio.create_task_group() as tg,
+        ):
+            tg.start_soon(
+                server._serve, *streams, server.server.create_initialization_options()
+            )
+            async with ClientSession(*client_streams) as session:
+                tg.start_soon(_drain, session)
+                await session.initialize()
+                await session.call_tool(
+                    "str_replace_editor",
+                    {"command": "view", "path": str(tmp_path / "a.txt")},
+                )
+            tg.cancel_scope.cancel()
+
+
+async def _drain(session: ClientSession):
+    async for _ in session.incoming_messages:
+        pass
+
+
+async def test_sessions_are_recorded(transcript, tmp_path):
+    await _session(tmp_path)
+    await _session(tmp_path)
+    entries = [json.loads(line) for line in transcript.read_text().splitlines()]
+
+    first = [entry for entry in entries if entry["session"] == entries[0]["session"]]
+    assert len({entry["session"] for entry in entries}) == 2
+    assert len(first) == len(entries) / 2
+    assert [
+        (entry["direction"], entry["message"].get("method")) for entry in first
+    ] == [
+        (recording.CLIENT_TO_SERVER, "initialize"),
+        (recording.SERVER_TO_CLIENT, None),
+        (recording.CLIENT_TO_SERVER, "notifications/initialized"),
+        (recording.CLIENT_TO_SERVER, "tools/call"),
+        (recording.SERVER_TO_CLIENT, None),
+    ]
+    call, result = first[3:]
+    assert call["message"]["params"]["arguments"]["command"] == "view"
+    assert result["message"]["id"] == call["message"]["id"]
+    assert "     1\ta" in result["message"]["result"]["content"][0]["text"]
+    assert [entry["time"] for entry in first] == sorted(
+        entry["time"] for entry in first
+    )
+
+
+async def test_streams_are_passed_through_when_off(monkeypatch):
+    monkeypatch.delenv("HIDE_MCP_RECORD_FILE", raising=False)
+    recording.setup_recording()
+    assert not recording.is_enabled()
+    send, receive = anyio.create_memory_object_stream(1)
+    async with send, receive, recording.recorded_streams(receive, send) as streams:
+        assert streams == (receive, send)
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from hide_mcp import remote
+from hide_mcp.remote import RemotePool
+from hide_mcp.tools.base import ToolError
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeConnection:
+    """Stands in for a connection to a remote server; calls wait until `gate` is set."""
+
+    gate: asyncio.Event
+    opened: list["FakeConnection"]
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.closed = False
+
+    async def connect(self):
+        if self.url == "http://unreachable":
+            raise OSError("Connection refused")
+        FakeConnection.opened.append(self)
+
+    async def call_tool(self, name, arguments, on_log):
+        self.in_flight += 1
+        try:
+            await FakeConnection.gate.wait()
+            if self.closed:
+                raise ConnectionError(f"Lost the connection to {self.url}")
+            return name
+        finally:
+            self.in_flight -= 1
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch) -> list[FakeConnection]:
+    monkeypatch.setattr(remote, "RemoteConnection", FakeConnection)
+    FakeConnection.gate = asyncio.Event()
+    FakeConnection.opened = []
+    return FakeConnection.opened
+
+
+async def test_idle_connections_are_reused(opened):
+    pool = RemotePool(max_connections=2)
+    FakeConnection.gate.set()
+    assert await pool.call_tool("http://a", "bash", {}) == "bash"
+    assert await pool.call_tool("http://a", "bash", {}) == "bash"
+    assert len(opened) == 1
+
+    # owners, e.g. client sessions, get their own connections
+    await pool.call_tool("http://a", "bash", {}, owner="other")
+    assert len(opened) == 2
+
+    # closed connections are replaced
+    opened[0].closed = True
+    await pool.call_tool("http://a", "bash", {})
+    assert len(opened) == 3
+    assert pool.n_connections == 2
+
+
+async def test_busy_connections_are_shared_beyond_the_limit(opened):
+    pool = RemotePool(max_connections=2)
+    calls = [
+        asyncio.create_task(pool.call_tool("http://a", "bash", {})) for _ in range(3)
+    ]
+    await asyncio.sleep(0.01)
+    assert len(opened) == 2
+    assert sorted(connection.in_flight for connection in opened) == [1, 2]
+    FakeConnection.gate.set()
+    assert await asyncio.gather(*calls) == ["bash"] * 3
+
+
+async def test_connection_errors_are_tool_errors(opened):
+    pool = RemotePool()
+    with pytest.raises(ToolError, match="Could not connect to http://unreachable"):
+        await pool.call_tool("http://unreachable", "bash", {})
+
+    call = asyncio.create_task(pool.call_tool("http://a", "bash", {}))
+    await asyncio.sleep(0.01)
+    await pool.close("http://a")
+    FakeConnection.gate.set()
+    with pytest.raises(ToolError, match="may or may not have completed"):
+        await call
+    assert pool.n_connections == 0
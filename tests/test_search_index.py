@@ -0,0 +1,158 @@
+import os
+import re
+
+import pytest
+
+from hide_mcp.tools import search_index
+from hide_mcp.tools.search import SearchTool
+from hide_mcp.tools.search_index import TrigramIndex, regex_literals
+from hide_mcp.tools.walker import DirectoryWalker
+
+
+@pytest.mark.parametrize(
+    "pattern, literals",
+    [
+        ("ABC", ["ABC"]),
+        (r"foo\.bar", ["foo.bar"]),
+        (r"abc\dxyz", ["abc", "xyz"]),
+        (r"\x41BC", ["BC"]),
+        (r"\U00000041BC", ["BC"]),
+        (r"\N{LATIN CAPITAL LETTER A}BC", ["BC"]),
+        (r"\101BC", ["BC"]),
+        (r"\0BC", ["BC"]),
+        (r"(A)\1BC", ["A", "BC"]),
+        ("(?#note)ABC", ["ABC"]),
+        ("AB(?#note)C", ["AB", "C"]),
+        ("abcd?ef", ["abc", "ef"]),
+        ("(abc)?def", ["def"]),
+        ("(?:abc)+def", ["abc", "def"]),
+        ("(?i)abc", ["abc"]),
+        ("abc|def", []),
+        ("(?x)abc", []),
+    ],
+)
+def test_regex_literals(pattern: str, literals: list[str]):
+    assert regex_literals(pattern) == literals
+
+
+@pytest.mark.parametrize(
+    "pattern, text",
+    [
+        (r"\x41BC", "ABC"),
+        (r"\101BC", "ABC"),
+        (r"\N{LATIN CAPITAL LETTER A}BC", "ABC"),
+        ("(?#note)ABC", "ABC"),
+        (r"(A)\1BC", "AABC"),
+        (r"a\tb", "a\tb"),
+        (r"x{2,3}yz", "xxyz"),
+        (r"[abc]+def\s*ghi", "aadefghi"),
+        (r"(?P<name>foo)bar(?P=name)", "foobarfoo"),
+    ],
+)
+def test_regex_literals_are_in_every_match(pattern: str, text: str):
+    match = re.search(pattern, text)
+    assert match is not None
+    for literal in regex_literals(pattern):
+        assert literal in match.group()
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("query", [r"\x41BC", "(?#note)ABC", r"\101BC"])
+async def test_regex_search_finds_escaped_literals(tmp_path, query: str):
+    for i in range(5):
+        (tmp_path / f"file{i}.txt").write_text("ABC\n")
+    (tmp_path / "other.txt").write_text("XYZ\n")
+
+    result = await SearchTool()(query=query, path=str(tmp_path), regex=True)
+    assert result.output is not None
+    assert result.output.startswith("Found 5 matches in 5 files:")
+
+
+def _rewrite_keeping_stat(path, content: str):
+    """Rewrite a file in place with content of the same size, keeping its mtime."""
+    stat = os.stat(path)
+    with open(path, "r+") as f:
+        f.write(content)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+@pytest.mark.parametrize("refresh_interval", [float("inf"), 0.0])
+def test_marked_files_are_reindexed(tmp_path, refresh_interval: float):
+    path = tmp_path / "file.txt"
+    path.write_text("old content\n")
+    index = TrigramIndex(str(tmp_path), DirectoryWalker(16), refresh_interval)
+    index.update()
+    assert index.candidates([b"old"]) == [str(path)]
+
+    _rewrite_keeping_stat(path, "new content\n")
+    index.mark_changed(str(path))
+    index.update()
+    assert index.candidates([b"new"]) == [str(path)]
+    assert index.candidates([b"old"]) == []
+
+
+def test_index_notices_replaced_files(tmp_path):
+    path = tmp_path / "file.txt"
+    path.write_text("old content\n")
+    index = TrigramIndex(str(tmp_path), DirectoryWalker(16), refresh_interval=0.0)
+    index.update()
+
+    replacement = tmp_path / "replacement.tmp"
+    replacement.write_text("new content\n")
+    stat = os.stat(path)
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(replacement, path)
+    index.update()
+    assert index.candidates([b"new"]) == [str(path)]
+
+
+def test_trigram_prefilter(tmp_path, monkeypatch):
+    (tmp_path / "sub").mkdir()
+    files = {
+        "a.txt": b"hello world\n",
+        "sub/b.txt": b"Hello there\n",
+        "c.txt": b"goodbye\n",
+        "binary.bin": b"hello\0world",
+        "large.txt": b"x" * 64,
+    }
+    for name, data in files.items():
+        (tmp_path / name).write_bytes(data)
+    monkeypatch.setattr(search_index, "MAX_INDEXED_FILE_SIZE", 32)
+    index = TrigramIndex(str(tmp_path), DirectoryWalker(16))
+    index.update()
+
+    def candidates(*literals, prefix=None):
+        paths = index.candidates([lit.encode() for lit in literals], prefix)
+        return [os.path.relpath(path, tmp_path) for path in paths]
+
+    # files too large to index are candidates of every search, binary files of none
+    assert candidates("hello") == ["a.txt", "large.txt", "sub/b.txt"]
+    assert candidates("hello", "world") == ["a.txt", "large.txt"]
+    assert candidates("nowhere") == ["large.txt"]
+    assert candidates("he") == ["a.txt", "c.txt", "large.txt", "sub/b.txt"]
+    assert candidates("hello", prefix=str(tmp_path / "sub")) == ["sub/b.txt"]
+
+
+@pytest.mark.anyio
+async def test_search_tool(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "main.py").write_text("import os\nprint(os.name)\n")
+    (tmp_path / "src" / "notes.md").write_text("use OS.path\n")
+    tool = SearchTool()
+
+    result = await tool(query="os.", path=str(tmp_path), ignore_case=True)
+    assert result.output == (
+        "Found 2 matches in 2 files:\n"
+        f"{tmp_path}/src/main.py:2:print(os.name)\n"
+        f"{tmp_path}/src/notes.md:1:use OS.path\n"
+    )
+    result = await tool(
+        query=r"os\.\w+", path=str(tmp_path), regex=True, include="*.py"
+    )
+    assert result.output and result.output.startswith("Found 1 matches in 1 files:")
+    result = await tool(query="os", path=str(tmp_path), max_results=1)
+    assert result.output and "<results clipped at 1 matches" in result.output
+
+    # searches in a subdirectory reuse the index of the directory
+    await tool(query="os", path=str(tmp_path / "src"))
+    assert list(tool._indexes) == [str(tmp_path)]
@@ -0,0 +1,200 @@
+import importlib
+from contextlib import asynccontextmanager
+
+import anyio
+import httpx
+import mcp.types as types
+import pytest
+from mcp.client.session import ClientSession
+from mcp.shared.exceptions import McpError
+from mcp.shared.memory import create_client_server_memory_streams
+from pydantic import AnyUrl
+
+from hide_mcp.sse import starlette_app
+
+# the package exports a `server` command that hides the module
+server = importlib.import_module("hide_mcp.server")
+
+pytestmark = pytest.mark.anyio
+
+
+@asynccontextmanager
+async def connect(notifications: list | None = None):
+    """
+    Serve a client session over memory streams, like a client connecting over SSE. The
+    messages of the server, which the client must consume, go to `notifications`.
+    """
+    async with create_client_server_memory_streams() as (
+        client_streams,
+        server_streams,
+    ):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(
+                server._serve,
+                *server_streams,
+                server.server.create_initialization_options(),
+            )
+            async with ClientSession(*client_streams) as session:
+
+                async def receive():
+                    async for message in session.incoming_messages:
+                        if notifications is not None:
+                            notifications.append(message)
+
+                tg.start_soon(receive)
+                await session.initialize()
+                yield session
+            tg.cancel_scope.cancel()
+
+
+class FakeRemotePool:
+    def __init__(self):
+        self.calls = []
+
+    async def call_tool(self, url, name, arguments, on_log=None, owner=None):
+        self.calls.append((url, name, owner))
+        return types.CallToolResult(
+            content=[types.TextContent(type="text", text=f"called {name} at {url}")]
+        )
+
+
+@pytest.fixture
+def remote_pool(monkeypatch) -> FakeRemotePool:
+    projects = iter(["p1", "p2"])
+
+    def create_project():
+        project_id = next(projects)
+        return server.Project(id=project_id, url=f"http://{project_id}")
+
+    monkeypatch.setattr(server, "PROJECTS", {})
+    monkeypatch.setattr(server, "_create_project", create_project)
+    pool = FakeRemotePool()
+    monkeypatch.setattr(server, "remote_pool", pool)
+    return pool
+
+
+async def test_sessions_are_routed_to_their_own_projects(remote_pool, tmp_path):
+    (tmp_path / "local.txt").write_text("local\n")
+    async with connect() as first, connect() as second:
+        await first.read_resource(AnyUrl("hide://projects/new"))
+        result = await first.call_tool("bash", {"command": "ls"})
+        assert result.content[0].text == "called bash at http://p1"
+
+        # the other session runs its tools locally and cannot see the project
+        result = await second.call_tool(
+            "str_replace_editor",
+            {"command": "view", "path": str(tmp_path / "local.txt")},
+        )
+        assert "     1\tlocal" in result.content[0].text
+        resources = await second.list_resources()
+        assert [str(r.uri) for r in resources.resources] == ["hide://projects/new"]
+        with pytest.raises(McpError, match="Unknown project: p1"):
+            await second.read_resource(AnyUrl("hide://projects/p1"))
+
+        await second.read_resource(AnyUrl("hide://projects/new"))
+        result = await second.call_tool("bash", {"command": "ls"})
+        assert result.content[0].text == "called bash at http://p2"
+
+    [(_, _, first_owner), (_, _, second_owner)] = remote_pool.calls
+    assert first_owner is not second_owner
+
+
+class SlowTool:
+    name = "bash_jobs"
+
+    async def __call__(self, **kwargs):
+        await anyio.sleep(0.3)
+        return server.ToolResult(output="done")
+
+
+@pytest.mark.parametrize(
+    "max_concurrent, min_time, max_time", [(16, 0, 0.6), (1, 0.9, 5)]
+)
+async def test_requests_run_concurrently(
+    monkeypatch, max_concurrent, min_time, max_time
+):
+    monkeypatch.setattr(server, "job_tool", SlowTool())
+    monkeypatch.setattr(server, "MAX_CONCURRENT_REQUESTS", max_concurrent)
+    async with connect() as session:
+        started_at = anyio.current_time()
+        results = []
+
+        async def call():
+            results.append(await session.call_tool("bash_jobs", {}))
+
+        async with anyio.create_task_group() as tg:
+            for _ in range(3):
+                tg.start_soon(call)
+        assert min_time <= anyio.current_time() - started_at < max_time
+    assert [result.content[0].text for result in results] == ["done"] * 3
+
+
+async def test_read_output_pages():
+    output_id = server.output_store.add_text("one\ntwo\nthree\n")
+    uri = f"hide://outputs/{output_id}"
+    async with connect() as session:
+
+        async def read(query: str) -> str:
+            result = await session.read_resource(AnyUrl(uri + query))
+            return result.contents[0].text
+
+        assert await read("") == "one\ntwo\nthree\n"
+        assert await read("?lines=2-3") == "two\nthree\n"
+        assert await read("?lines=3-") == "three\n"
+        assert await read("?bytes=4-6") == "two"
+        with pytest.raises(McpError, match="Invalid range `lines=a-b`"):
+            await read("?lines=a-b")
+        with pytest.raises(McpError, match="No output found"):
+            await session.read_resource(AnyUrl("hide://outputs/unknown"))
+
+
+async def test_tool_calls_are_measured(tmp_path):
+    (tmp_path / "a.txt").write_text("a\n")
+    transport = httpx.ASGITransport(app=starlette_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+
+        async def value(sample: str) -> float:
+            response = await client.get("/metrics")
+            assert response.headers["content-type"].startswith("text/plain")
+            for line in response.text.splitlines():
+                if line.startswith(sample + " "):
+                    return float(line.split()[-1])
+            return 0.0
+
+        calls = (
+            "hide_tool_call_duration_seconds_count"
+            '{tool="str_replace_editor",command="view",status="ok"}'
+        )
+        errors = calls.replace('"ok"', '"error"')
+        before = (await value(calls), await value(errors))
+        async with connect() as session:
+            for name in ("a.txt", "b.txt"):
+                await session.call_tool(
+                    "str_replace_editor",
+                    {"command": "view", "path": str(tmp_path / name)},
+                )
+        # viewing the missing file fails
+        assert (await value(calls), await value(errors)) == (
+            before[0] + 1,
+            before[1] + 1,
+        )
+        in_flight = 'hide_tool_calls_in_flight{tool="str_replace_editor"}'
+        assert await value(in_flight) == 0
+
+
+async def test_tool_calls_are_traced(traced, tmp_path):
+    (tmp_path / "a.txt").write_text("a\n")
+    async with connect() as session:
+        await session.call_tool(
+            "str_replace_editor", {"command": "view", "path": str(tmp_path / "a.txt")}
+        )
+    spans = {span["name"]: span for span in traced()}
+    chain = ["mcp.request", "mcp.handle", "tool.call", "edit.view"]
+    for parent, child in zip(chain, chain[1:]):
+        assert spans[child]["parent_span_id"] == spans[parent]["span_id"]
+        assert spans[child]["trace_id"] == spans[parent]["trace_id"]
+    assert spans["mcp.request"]["attributes"]["method"] == "tools/call"
+    assert spans["tool.call"]["attributes"] == {
+        "tool": "str_replace_editor",
+        "command": "view",
+    }
@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+from hide_mcp.tools.base import ToolError
+from hide_mcp.tools.edit import EditTool
+from hide_mcp.tools.symbols import SymbolCache, parse_symbols
+
+SOURCE = """\
+class Parser:
+    def parse(self):
+        pass
+
+
+def main():
+    pass
+"""
+
+
+def test_parse_symbols():
+    symbols = [(s.name, s.start_line, s.end_line) for s in parse_symbols(SOURCE)]
+    assert symbols == [("Parser", 1, 3), ("Parser.parse", 2, 3), ("main", 6, 7)]
+
+
+def test_symbol_cache_notices_same_size_rewrites(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text(SOURCE)
+    cache = SymbolCache(max_files=4)
+    assert "main" in [s.name for s in cache.get(path, lambda p: p.read_text())]
+
+    stat = os.stat(path)
+    with open(path, "r+") as f:
+        f.write(SOURCE.replace("main", "mian"))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert "mian" in [s.name for s in cache.get(path, lambda p: p.read_text())]
+
+
+def test_symbol_cache_invalidate_many(tmp_path):
+    path = tmp_path / "pkg" / "module.py"
+    path.parent.mkdir()
+    path.write_text(SOURCE)
+    cache = SymbolCache(max_files=4)
+    reads = []
+
+    def read(p):
+        reads.append(p)
+        return p.read_text()
+
+    cache.get(path, read)
+    cache.get(path, read)
+    cache.invalidate_many([path.parent])
+    cache.get(path, read)
+    assert len(reads) == 2
+
+
+@pytest.mark.anyio
+async def test_outline_after_same_size_edit(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text(SOURCE)
+    tool = EditTool()
+    await tool(command="outline", path=str(path))
+
+    await tool(command="str_replace", path=str(path), old_str="main", new_str="mian")
+    result = await tool(command="outline", path=str(path))
+    assert result.output is not None
+    assert "mian" in result.output and "main" not in result.output
+
+
+@pytest.mark.anyio
+async def test_view_symbol_suggests_names_once(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text(
+        "if X:\n    def parse(): pass\nelse:\n    def parse(): pass\n"
+        "class A:\n    def parse(self): pass\n"
+    )
+    with pytest.raises(ToolError) as error:
+        await EditTool()(command="view_symbol", path=str(path), symbol="pars")
+    assert "Did you mean `parse` or `A.parse`?" in error.value.message
+
+
+@pytest.mark.anyio
+async def test_view_symbol_shows_decorators_and_every_definition(tmp_path):
+    path = tmp_path / "module.py"
+    path.write_text(
+        "class A:\n"
+        "    @property\n"
+        "    def value(self):\n"
+        "        return 1\n"
+        "\n"
+        "    @value.setter\n"
+        "    def value(self, value):\n"
+        "        pass\n"
+        "\n"
+        "async def fetch():\n"
+        "    pass\n"
+    )
+    tool = EditTool()
+    result = await tool(command="view_symbol", path=str(path), symbol="value")
+    assert result.output is not None
+    assert "     2\t    @property\n     3\t    def value(self):" in result.output
+    assert "     6\t    @value.setter" in result.output
+
+    result = await tool(command="outline", path=str(path))
+    assert result.output is not None
+    assert "    def value  (lines 2-4)" in result.output
+    assert "async def fetch  (lines 10-11)" in result.output
+
+    (tmp_path / "notes.txt").write_text("def f(): pass\n")
+    with pytest.raises(ToolError, match="not a Python file"):
+        await tool(command="outline", path=str(tmp_path / "notes.txt"))
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from hide_mcp import tracing
+
+pytestmark = pytest.mark.anyio
+
+
+def _in_thread():
+    with tracing.span("thread"):
+        pass
+
+
+async def test_nested_spans_share_the_trace(traced):
+    with tracing.span("request", method="call") as request:
+        with tracing.span("handle"):
+            # the current span carries over to threads
+            await asyncio.to_thread(_in_thread)
+        detached = tracing.start_span("detached", n=1)
+    detached.end()
+    detached.end()
+
+    spans = {span["name"]: span for span in traced()}
+    assert list(spans) == ["thread", "handle", "request", "detached"]
+    assert {span["trace_id"] for span in spans.values()} == {request.trace_id}
+    assert spans["request"]["parent_span_id"] is None
+    assert spans["handle"]["parent_span_id"] == request.span_id
+    assert spans["thread"]["parent_span_id"] == spans["handle"]["span_id"]
+    assert spans["detached"]["parent_span_id"] == request.span_id
+    assert spans["request"]["attributes"] == {"method": "call"}
+    assert spans["request"]["status"] == {"code": "OK"}
+    assert (
+        spans["request"]["start_time_unix_nano"]
+        <= spans["handle"]["start_time_unix_nano"]
+        <= spans["handle"]["end_time_unix_nano"]
+        <= spans["request"]["end_time_unix_nano"]
+    )
+
+    with tracing.span("other"):
+        pass
+    assert traced()[-1]["trace_id"] != request.trace_id
+
+
+async def test_exceptions_fail_the_span(traced):
+    with pytest.raises(ValueError):
+        with tracing.span("failing"):
+            raise ValueError("bad value")
+    [span] = traced()
+    assert span["status"] == {"code": "ERROR", "message": "ValueError: bad value"}
+    assert span["attributes"]["exception.type"] == "ValueError"
+    assert "raise ValueError" in span["attributes"]["exception.stacktrace"]
+
+
+def test_spans_are_not_recorded_when_off(monkeypatch):
+    monkeypatch.delenv("HIDE_MCP_TRACE_FILE", raising=False)
+    tracing.setup_tracing()
+    assert not tracing.is_enabled()
+    with tracing.span("off") as span:
+        assert tracing.current_span() is None
+        span.set_attribute("key", "value")
+    assert tracing.start_span("off") is span
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+
+from hide_mcp.tools.walker import DirectoryWalker, _is_ignored, parse_ignore_file
+
+
+@pytest.mark.parametrize(
+    "rules, path, is_dir, ignored",
+    [
+        ("*.log", "/repo/src/debug.log", False, True),
+        ("/build", "/repo/build", True, True),
+        ("/build", "/repo/src/build", True, False),
+        ("out/", "/repo/out", False, False),
+        ("out/", "/repo/out", True, True),
+        ("docs/**/*.md", "/repo/docs/a/b/c.md", False, True),
+        ("*.log\n!keep.log", "/repo/keep.log", False, False),
+        ("# comment\n\\#name", "/repo/#name", False, True),
+        ("file[0-9].txt", "/repo/file7.txt", False, True),
+        ("a?c", "/repo/a/c", False, False),
+    ],
+)
+def test_ignore_rules(rules, path, is_dir, ignored):
+    ignore_files = [("/repo", parse_ignore_file(rules))]
+    assert _is_ignored(ignore_files, path, is_dir) == ignored
+
+
+def _tree(root, paths):
+    for path in paths:
+        path = os.path.join(root, path)
+        if path.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write("x")
+
+
+def test_walk_skips_hidden_and_ignored(tmp_path):
+    _tree(
+        tmp_path,
+        [
+            ".git/",
+            ".gitignore",
+            ".env",
+            "node_modules/pkg/index.js",
+            "src/main.py",
+            "src/main.pyc",
+            "src/.gitignore",
+            "src/generated/api.py",
+        ],
+    )
+    (tmp_path / ".gitignore").write_text("node_modules/\n*.pyc\n")
+    (tmp_path / "src" / ".gitignore").write_text("generated/\n")
+
+    walker = DirectoryWalker(max_cached_dirs=16)
+    entries, truncated = walker.walk(
+        str(tmp_path / "src"), max_depth=8, max_entries=100
+    )
+    assert not truncated
+    # the ignore files of the parent directories apply too
+    assert [os.path.relpath(e.path, tmp_path) for e in entries] == [
+        "src",
+        "src/main.py",
+    ]
+    assert walker.is_ignored(str(tmp_path / "node_modules"), is_dir=True)
+    assert not walker.is_ignored(str(tmp_path / "src" / "main.py"), is_dir=False)
+
+
+def test_walk_is_breadth_first_and_cached(tmp_path):
+    _tree(tmp_path, ["a/b/c/d.txt", "e.txt", "f.txt"])
+    walker = DirectoryWalker(max_cached_dirs=16)
+    entries, truncated = walker.walk(str(tmp_path), max_depth=8, max_entries=4)
+    assert truncated
+    assert [os.path.relpath(e.path, tmp_path) for e in entries] == [
+        ".",
+        "a",
+        "e.txt",
+        "f.txt",
+    ]
+
+    walker.walk(str(tmp_path), max_depth=8, max_entries=100)
+    misses = walker.misses
+    walker.walk(str(tmp_path), max_depth=8, max_entries=100)
+    assert walker.misses == misses
+    (tmp_path / "a" / "new.txt").write_text("x")
+    entries, _ = walker.walk(str(tmp_path), max_depth=8, max_entries=100)
+    assert walker.misses == misses + 1
+    assert str(tmp_path / "a" / "new.txt") in [e.path for e in entries]
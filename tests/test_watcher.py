@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from hide_mcp.tools import watcher as watcher_module
+from hide_mcp.tools.watcher import FileWatcher
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=["inotify", "polling"])
+async def watcher(request, monkeypatch):
+    if request.param == "polling":
+
+        def no_inotify():
+            raise OSError("inotify is disabled")
+
+        monkeypatch.setattr(watcher_module, "_Inotify", no_inotify)
+    file_watcher = FileWatcher(coalesce_delay=0.01, poll_interval=0.05)
+    task = asyncio.create_task(file_watcher.run())
+    await asyncio.sleep(0)
+    yield file_watcher
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+def _collect(file_watcher: FileWatcher) -> asyncio.Queue:
+    queue = asyncio.Queue()
+
+    async def listener(paths: set[str]):
+        queue.put_nowait(paths)
+
+    file_watcher.add_listener(listener)
+    return queue
+
+
+async def _changed(queue: asyncio.Queue, path: str):
+    """Wait until `path` is reported as changed, and return all the reported paths."""
+    reported = set()
+    while path not in reported:
+        reported |= await asyncio.wait_for(queue.get(), 5)
+    return reported
+
+
+async def test_watch_is_counted(watcher, tmp_path):
+    assert watcher.watch(tmp_path, recursive=False)
+    assert watcher.watch(tmp_path, recursive=False)
+    watcher.unwatch(tmp_path, recursive=False)
+    assert watcher.watches(str(tmp_path), recursive=False)
+    watcher.unwatch(tmp_path, recursive=False)
+    assert not watcher.watches(str(tmp_path), recursive=False)
+    assert not watcher._watched_dirs
+    assert not watcher._snapshots
+
+
+async def test_unwatch_keeps_trees_watched_on_their_own(watcher, tmp_path):
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    assert watcher.watch(tmp_path)
+    assert watcher.watch(sub)
+    watcher.unwatch(tmp_path)
+    assert not watcher.watches(str(tmp_path))
+    assert watcher.watches(str(sub))
+
+    queue = _collect(watcher)
+    (sub / "a.txt").write_text("a")
+    await _changed(queue, str(sub / "a.txt"))
+    watcher.unwatch(sub)
+    assert not watcher._watched_dirs
+
+
+async def test_watch_file_reports_hidden_files(watcher, tmp_path):
+    env = tmp_path / ".env"
+    env.write_text("A=1")
+    (tmp_path / ".other").write_text("")
+    assert watcher.watch_file(env)
+    queue = _collect(watcher)
+
+    (tmp_path / ".other").write_text("changed")
+    env.write_text("A=2")
+    reported = await _changed(queue, str(env))
+    assert str(tmp_path / ".other") not in reported
+
+    watcher.unwatch_file(env)
+    assert not watcher.watches(str(tmp_path), recursive=False)
+
+
+async def test_new_directories_are_watched(watcher, tmp_path):
+    assert watcher.watch(tmp_path)
+    queue = _collect(watcher)
+    (tmp_path / "new").mkdir()
+    if watcher._inotify is not None:
+        # polling reports the files only
+        await _changed(queue, str(tmp_path / "new"))
+    (tmp_path / "new" / "file.txt").write_text("x")
+    await _changed(queue, str(tmp_path / "new" / "file.txt"))
+    watcher.unwatch(tmp_path)
+
+
+async def test_changes_are_coalesced(watcher, tmp_path):
+    watcher.max_batch = 5
+    assert watcher.watch(tmp_path)
+    queue = _collect(watcher)
+    for i in range(3):
+        (tmp_path / f"{i}.txt").write_text("x")
+    reported = await _changed(queue, str(tmp_path / "2.txt"))
+    assert {str(tmp_path / f"{i}.txt") for i in range(3)} <= reported
+
+    # too many changes at once are reported as the watched root
+    for i in range(10):
+        (tmp_path / f"{i}.txt").write_text("changed")
+    await _changed(queue, str(tmp_path))
+    watcher.unwatch(tmp_path)